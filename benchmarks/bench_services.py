@@ -0,0 +1,192 @@
+# Offline stand-ins for the services the pipeline talks to
+#
+# The fake Anthropic and OpenAI clients only implement the calls main.py makes.
+# The Pexels stand-in is a local HTTP server answering /videos/search with the
+# same JSON shape as the real API and serving lavfi-generated portrait clips.
+
+import json
+import zlib
+import random
+import shutil
+import threading
+import subprocess
+from pathlib import Path
+from types import SimpleNamespace
+from contextlib import contextmanager
+from urllib.parse import urlparse, parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Rough speaking rate of the onyx voice, used to size tone audio
+SPEECH_WORDS_PER_SECOND = 2.5
+
+# Sentences for canned scripts - kept free of the words the script cleanup strips
+CANNED_SENTENCES = [
+    "What if the universe is not a place but a process?",
+    "Every river forgets its source and still finds the sea.",
+    "You are the cosmos looking back at itself with wide open eyes.",
+    "The mind builds walls and then wonders why the room feels small.",
+    "Consider the seed, which holds an entire forest in a grain of dust.",
+    "Time is a spiral, returning to the same moment from a higher place.",
+    "The mystics knew that silence is the oldest language we have.",
+    "A wave cannot be separated from the ocean that dreams it.",
+    "We chase meaning as a dog chases its own tail, dizzy and delighted.",
+    "Perhaps the stars are simply the universe remembering how to shine.",
+    "Every breath is a small surrender and a small rebirth.",
+    "The map was never the territory, and the name was never the thing.",
+    "Look closely at a single leaf and you will find the whole tree.",
+    "The ego is a candle that insists it invented the sun.",
+    "Nothing is ever lost, only transformed into another shape of light.",
+    "So sit with the mystery, and let it sit with you.",
+]
+
+def canned_script(words, seed):
+    """Build a deterministic monologue of roughly `words` words"""
+    rng = random.Random(seed)
+    sentences = []
+    count = 0
+    while count < words:
+        sentence = rng.choice(CANNED_SENTENCES)
+        sentences.append(sentence)
+        count += len(sentence.split())
+    return " ".join(sentences)
+
+def make_fake_anthropic(script_words, seed):
+    """An Anthropic client stand-in whose messages.create returns a canned script"""
+    def create(**kwargs):
+        prompt = kwargs["messages"][-1]["content"]
+        text = canned_script(script_words, seed ^ zlib.crc32(prompt.encode("utf-8")))
+        return SimpleNamespace(content=[SimpleNamespace(text=text)])
+
+    return SimpleNamespace(messages=SimpleNamespace(create=create))
+
+def synthesize_speech(text, output_path):
+    """Render text to mp3 with espeak when available, otherwise as tone audio of speech length"""
+    output_path = Path(output_path)
+    espeak = shutil.which("espeak-ng") or shutil.which("espeak")
+
+    if espeak:
+        wav_path = output_path.with_suffix(".wav")
+        subprocess.run([espeak, "-w", str(wav_path), text], check=True, capture_output=True)
+        source = ["-i", str(wav_path)]
+    else:
+        duration = max(1.0, len(text.split()) / SPEECH_WORDS_PER_SECOND)
+        source = ["-f", "lavfi", "-i", f"sine=frequency=220:sample_rate=24000:duration={duration:.2f}"]
+
+    subprocess.run(
+        ["ffmpeg", "-y", "-v", "error", *source, "-ac", "1", "-c:a", "libmp3lame", "-b:a", "128k",
+         str(output_path)],
+        check=True, capture_output=True
+    )
+
+    if espeak:
+        wav_path.unlink()
+    return output_path
+
+def make_fake_openai(work_dir):
+    """An OpenAI client stand-in whose audio.speech calls synthesize speech locally"""
+    work_dir = Path(work_dir)
+
+    def create(model, voice, input, response_format="mp3", **kwargs):
+        # Named per thread as well - chunked TTS synthesizes several inputs at once
+        mp3_path = work_dir / f"tts_{zlib.crc32(input.encode('utf-8')):08x}_{threading.get_ident()}.mp3"
+        synthesize_speech(input, mp3_path)
+        if response_format == "pcm":
+            # Raw 24 kHz 16-bit mono, like the real API
+            content = subprocess.run(
+                ["ffmpeg", "-v", "error", "-i", str(mp3_path), "-f", "s16le", "-ar", "24000", "-ac", "1", "-"],
+                check=True, capture_output=True
+            ).stdout
+        else:
+            content = mp3_path.read_bytes()
+        mp3_path.unlink()
+        return SimpleNamespace(content=content)
+
+    @contextmanager
+    def create_streaming(**kwargs):
+        content = create(**kwargs).content
+        yield SimpleNamespace(
+            iter_bytes=lambda chunk_size=65536: (
+                content[i:i + chunk_size] for i in range(0, len(content), chunk_size)
+            )
+        )
+
+    speech = SimpleNamespace(create=create, with_streaming_response=SimpleNamespace(create=create_streaming))
+    return SimpleNamespace(audio=SimpleNamespace(speech=speech))
+
+def generate_clip(output_path, duration):
+    """Render a 1080x1920 test-pattern clip with ffmpeg's lavfi sources"""
+    subprocess.run(
+        ["ffmpeg", "-y", "-v", "error",
+         "-f", "lavfi", "-i", f"testsrc2=size=1080x1920:rate=30:duration={duration}",
+         "-c:v", "libx264", "-preset", "ultrafast", "-pix_fmt", "yuv420p", "-an", str(output_path)],
+        check=True, capture_output=True
+    )
+    return output_path
+
+class PexelsHandler(BaseHTTPRequestHandler):
+    """Answers Pexels video searches with one clip of the server's current duration"""
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == "/videos/search":
+            self._search(parse_qs(url.query).get("query", [""])[0])
+        elif url.path.startswith("/clips/"):
+            self._send_clip(Path(url.path).name)
+        else:
+            self.send_error(404)
+
+    def _search(self, query):
+        duration = self.server.clip_seconds
+        video_id = zlib.crc32(f"{query}:{duration}".encode("utf-8"))
+        host, port = self.server.server_address[:2]
+        body = json.dumps({"videos": [{
+            "id": video_id,
+            "duration": duration,
+            "video_files": [{
+                "id": video_id * 10 + 1,
+                "quality": "hd",
+                "file_type": "video/mp4",
+                "width": 1080,
+                "height": 1920,
+                "link": f"http://{host}:{port}/clips/clip_{duration}s.mp4",
+            }],
+        }]}).encode("utf-8")
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_clip(self, name):
+        path = self.server.clip_dir / name
+        if not path.exists():
+            self.send_error(404)
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "video/mp4")
+        self.send_header("Content-Length", str(path.stat().st_size))
+        self.end_headers()
+        with open(path, "rb") as f:
+            shutil.copyfileobj(f, self.wfile)
+
+    def log_message(self, format, *args):
+        pass
+
+def start_pexels_server(clip_dir, clip_durations):
+    """Generate the clips and serve them on a local port; returns (server, search_url)"""
+    clip_dir = Path(clip_dir)
+    clip_dir.mkdir(parents=True, exist_ok=True)
+    for duration in clip_durations:
+        clip_path = clip_dir / f"clip_{duration}s.mp4"
+        if not clip_path.exists():
+            generate_clip(clip_path, duration)
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), PexelsHandler)
+    server.clip_dir = clip_dir
+    server.clip_seconds = clip_durations[0]
+    threading.Thread(target=server.serve_forever, name="pexels-standin", daemon=True).start()
+
+    host, port = server.server_address[:2]
+    return server, f"http://{host}:{port}/videos/search"
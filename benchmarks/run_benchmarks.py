@@ -0,0 +1,347 @@
+#!/usr/bin/env python3
+"""
+Offline Pipeline Benchmarks
+Runs the full main.py pipeline against local stand-ins for Claude, OpenAI TTS
+and Pexels across script lengths and clip durations, and compares the results
+with the previous run so render/caption regressions show up between commits.
+
+Needs ffmpeg on PATH and the Whisper weights already downloaded (no network).
+espeak/espeak-ng is used for the fake voice when installed, tone audio otherwise.
+"""
+
+import os
+import sys
+import re
+import json
+import time
+import shutil
+import random
+import argparse
+import tempfile
+import statistics
+import subprocess
+from pathlib import Path
+from datetime import datetime
+
+BENCH_DIR = Path(__file__).resolve().parent
+REPO_ROOT = BENCH_DIR.parent
+RESULTS_DIR = BENCH_DIR / "results"
+
+sys.path.insert(0, str(REPO_ROOT))
+
+from bench_services import start_pexels_server, make_fake_anthropic, make_fake_openai
+
+DEFAULT_SCRIPT_WORDS = [60, 150, 230]
+DEFAULT_CLIP_SECONDS = [10, 30, 90]
+DEFAULT_RENDER_PROFILES = ["standard"]
+
+# Lossless render of the same inputs that each profile's SSIM is measured against
+REFERENCE_PROFILE = {"preset": "ultrafast", "crf": 0}
+
+# End-to-end slowdowns beyond this fraction of the baseline are flagged
+REGRESSION_THRESHOLD = 0.10
+
+def git_revision():
+    """Short commit hash of the checkout, with -dirty for uncommitted changes"""
+    try:
+        revision = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT,
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+        dirty = subprocess.run(
+            ["git", "status", "--porcelain", "--untracked-files=no"], cwd=REPO_ROOT,
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+        return f"{revision}-dirty" if dirty else revision
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+def prepare_workspace(workspace):
+    """Give the pipeline a topic bank and a background track to work with"""
+    workspace.mkdir(parents=True, exist_ok=True)
+    shutil.copy(REPO_ROOT / "topics.txt", workspace / "topics.txt")
+
+    music_path = workspace / "assets" / "bench_music.mp3"
+    if not music_path.exists():
+        music_path.parent.mkdir(exist_ok=True)
+        subprocess.run(
+            ["ffmpeg", "-y", "-v", "error", "-f", "lavfi",
+             "-i", "sine=frequency=110:sample_rate=44100:duration=60",
+             "-c:a", "libmp3lame", "-b:a", "128k", str(music_path)],
+            check=True, capture_output=True
+        )
+
+def measure_ssim(video_path, reference_path):
+    """Mean SSIM of a video against a reference (1.0 = identical)"""
+    result = subprocess.run(
+        ["ffmpeg", "-v", "info", "-i", str(video_path), "-i", str(reference_path),
+         "-lavfi", "[0:v][1:v]ssim", "-f", "null", "-"],
+        capture_output=True, text=True, check=True
+    )
+    match = re.search(r"All:([\d.]+)", result.stderr)
+    return float(match.group(1)) if match else None
+
+def measure_quality(pipeline, run_id):
+    """Output size and SSIM of a run's final render against a lossless reference"""
+    from stage_cache import load_manifest
+
+    stages = load_manifest(run_id)["stages"]
+    output_path = Path(stages["captioned"]["values"]["captioned_path"])
+    reference_path = output_path.with_name(f"{output_path.stem}_reference.mp4")
+
+    pipeline.render_final_video(
+        stages["clip"]["values"]["video_path"],
+        stages["mix"]["values"]["combined_audio_path"],
+        stages["srt"]["values"]["srt_path"],
+        stages["mix"]["values"]["duration"],
+        reference_path,
+        render_profile=REFERENCE_PROFILE,
+    )
+    ssim = measure_ssim(output_path, reference_path)
+    reference_path.unlink()
+
+    return {"output_bytes": output_path.stat().st_size, "ssim": ssim}
+
+def run_cell(cell):
+    """Run one pipeline job in this (fresh) process and return its measurements"""
+    os.chdir(cell["workspace"])
+    os.environ["PEXELS_SEARCH_URL"] = cell["pexels_url"]
+    os.environ.setdefault("PEXELS_API_KEY", "benchmark")
+    # Every cell should pay for its (fake) Claude call rather than hit an earlier cell's cache
+    os.environ.setdefault("LLM_CACHE", "off")
+    random.seed(cell["seed"])
+
+    import main
+    import llm_cache
+    import content_variety_enhancer
+    from pipeline_profiler import start_profiling, stop_profiling, io_bytes, peak_rss_mb
+
+    # Topic bank expansion would call the real API
+    content_variety_enhancer.auto_expand_topics = lambda *args, **kwargs: None
+    llm_cache._CLIENTS["anthropic"] = make_fake_anthropic(cell["script_words"], cell["seed"])
+    main._CLIENTS["openai"] = make_fake_openai(Path(cell["workspace"]))
+
+    start_profiling(cell["run_id"])
+    read_start, written_start = io_bytes()
+    started = time.perf_counter()
+    try:
+        summary = main.run_pipeline(cell["run_id"], render_profile=cell["render_profile"])
+    finally:
+        stages = stop_profiling()
+    elapsed = time.perf_counter() - started
+    read_end, written_end = io_bytes()
+    own_rss, child_rss = peak_rss_mb()
+
+    # Measured after the timed run so the reference render doesn't count
+    quality = measure_quality(main, cell["run_id"])
+
+    return {
+        "wall_s": elapsed,
+        "video_seconds": summary["duration"],
+        "stages": {s["stage"]: s["wall_s"] for s in stages},
+        "peak_rss_mb": own_rss,
+        "child_peak_rss_mb": child_rss,
+        "bytes_read": read_end - read_start if read_end is not None else None,
+        "bytes_written": written_end - written_start if written_end is not None else None,
+        "output_bytes": quality["output_bytes"],
+        "ssim": quality["ssim"],
+    }
+
+def spawn_cell(cell):
+    """Run a cell in a child process so memory peaks and module state don't leak between cells"""
+    result_path = Path(cell["workspace"]) / f"{cell['run_id']}.result.json"
+    cmd = [sys.executable, str(Path(__file__).resolve()), "--cell", json.dumps(dict(cell, result=str(result_path)))]
+    completed = subprocess.run(cmd, capture_output=True, text=True)
+
+    if completed.returncode != 0 or not result_path.exists():
+        tail = "\n".join((completed.stdout + completed.stderr).splitlines()[-15:])
+        raise RuntimeError(f"Benchmark cell {cell['run_id']} failed:\n{tail}")
+
+    with open(result_path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def summarize(runs):
+    """Median timings and worst-case memory over a cell's repeats"""
+    def median(values):
+        values = [v for v in values if v is not None]
+        return statistics.median(values) if values else None
+
+    wall = median(r["wall_s"] for r in runs)
+    stage_names = sorted({name for r in runs for name in r["stages"]})
+    return {
+        "repeats": len(runs),
+        "wall_s": wall,
+        "videos_per_hour": 3600 / wall if wall else None,
+        "video_seconds": median(r["video_seconds"] for r in runs),
+        "stages": {name: median(r["stages"].get(name) for r in runs) for name in stage_names},
+        "peak_rss_mb": max((r["peak_rss_mb"] or 0) for r in runs),
+        "child_peak_rss_mb": max((r["child_peak_rss_mb"] or 0) for r in runs),
+        "bytes_read": median(r["bytes_read"] for r in runs),
+        "bytes_written": median(r["bytes_written"] for r in runs),
+        "output_bytes": median(r["output_bytes"] for r in runs),
+        "ssim": median(r["ssim"] for r in runs),
+    }
+
+def find_baseline(exclude=None):
+    """Most recent stored result, skipping the file we just wrote"""
+    if not RESULTS_DIR.exists():
+        return None
+    for path in sorted(RESULTS_DIR.glob("*.json"), reverse=True):
+        if path != exclude:
+            return path
+    return None
+
+def print_report(results, baseline=None):
+    """Show each cell's latency, throughput, memory and I/O against the baseline"""
+    baseline_cells = {}
+    if baseline:
+        baseline_cells = {c["name"]: c for c in baseline["cells"]}
+        print(f"\n📏 Baseline: {baseline['revision']} ({baseline['created']})")
+
+    print(f"\n🏁 BENCHMARK RESULTS ({results['revision']}, seed {results['seed']})")
+    header = (
+        f"{'cell':<22} {'e2e s':>7} {'videos/h':>9} {'rss MB':>7} {'ffmpeg MB':>10} "
+        f"{'read MB':>8} {'write MB':>9} {'out MB':>7} {'SSIM':>6} {'vs base':>8}"
+    )
+    print(header)
+    print("-" * len(header))
+
+    regressions = []
+    for cell in results["cells"]:
+        delta = ""
+        previous = baseline_cells.get(cell["name"])
+        if previous and previous["wall_s"]:
+            change = (cell["wall_s"] - previous["wall_s"]) / previous["wall_s"]
+            delta = f"{change:+.0%}"
+            if change > REGRESSION_THRESHOLD:
+                regressions.append(cell["name"])
+                delta += " ⚠️"
+
+        ssim = f"{cell['ssim']:.4f}" if cell.get("ssim") is not None else "-"
+        print(
+            f"{cell['name']:<22} {cell['wall_s']:>7.1f} {cell['videos_per_hour']:>9.1f} "
+            f"{cell['peak_rss_mb']:>7.0f} {cell['child_peak_rss_mb']:>10.0f} "
+            f"{(cell['bytes_read'] or 0) / 1e6:>8.1f} {(cell['bytes_written'] or 0) / 1e6:>9.1f} "
+            f"{(cell.get('output_bytes') or 0) / 1e6:>7.1f} {ssim:>6} {delta:>8}"
+        )
+        print("   " + "  ".join(f"{name} {seconds:.1f}s" for name, seconds in cell["stages"].items()))
+
+    if regressions:
+        print(f"\n⚠️ Slower than baseline by more than {REGRESSION_THRESHOLD:.0%}: {', '.join(regressions)}")
+    return regressions
+
+def run_matrix(script_words, clip_seconds, render_profiles, seed, repeat, workspace):
+    """Run every script length x clip duration x render profile cell and collect the summaries"""
+    prepare_workspace(workspace)
+    server, pexels_url = start_pexels_server(workspace / "pexels_clips", clip_seconds)
+    session = datetime.now().strftime("%Y%m%d_%H%M%S")
+
+    cells = []
+    try:
+        for words in script_words:
+            for seconds in clip_seconds:
+                for profile in render_profiles:
+                    name = f"{words}w/{seconds}s/{profile}"
+                    server.clip_seconds = seconds
+                    runs = []
+                    for attempt in range(1, repeat + 1):
+                        # Every run downloads its clip from scratch
+                        shutil.rmtree(workspace / "esoteric_content_pipeline" / "clip_cache", ignore_errors=True)
+                        print(f"⏱️ {name} (run {attempt}/{repeat})")
+                        runs.append(spawn_cell({
+                            "run_id": f"bench_{session}_{words}w_{seconds}s_{profile}_{attempt}",
+                            "workspace": str(workspace),
+                            "pexels_url": pexels_url,
+                            "script_words": words,
+                            "render_profile": profile,
+                            "seed": seed,
+                        }))
+                    cells.append(dict(
+                        summarize(runs), name=name, script_words=words, clip_seconds=seconds,
+                        render_profile=profile
+                    ))
+    finally:
+        server.shutdown()
+
+    return cells
+
+def parse_int_list(value):
+    return [int(v) for v in value.split(",") if v.strip()]
+
+def parse_profile_list(value):
+    from render_profiles import RENDER_PROFILES
+
+    if value == "all":
+        return list(RENDER_PROFILES)
+    profiles = [v.strip() for v in value.split(",") if v.strip()]
+    unknown = [p for p in profiles if p not in RENDER_PROFILES]
+    if unknown:
+        raise argparse.ArgumentTypeError(f"unknown render profile(s): {', '.join(unknown)}")
+    return profiles
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline end-to-end pipeline benchmarks")
+    parser.add_argument("--script-words", type=parse_int_list, default=DEFAULT_SCRIPT_WORDS,
+                        help="comma-separated script lengths in words (default: 60,150,230)")
+    parser.add_argument("--clip-seconds", type=parse_int_list, default=DEFAULT_CLIP_SECONDS,
+                        help="comma-separated background clip durations (default: 10,30,90)")
+    parser.add_argument("--render-profiles", type=parse_profile_list, default=DEFAULT_RENDER_PROFILES,
+                        help="comma-separated render profiles to compare, or 'all' (default: standard)")
+    parser.add_argument("--seed", type=int, default=1, help="seed for topics and canned scripts")
+    parser.add_argument("--repeat", type=int, default=1, help="runs per cell (the median is reported)")
+    parser.add_argument("--quick", action="store_true", help="only the shortest script and clip")
+    parser.add_argument("--workspace", type=Path, help="keep the pipeline's files here instead of a temp dir")
+    parser.add_argument("--baseline", type=Path, help="results file to compare against (default: the latest)")
+    parser.add_argument("--no-save", action="store_true", help="don't store the results")
+    parser.add_argument("--cell", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.cell:
+        cell = json.loads(args.cell)
+        result = run_cell(cell)
+        with open(cell["result"], 'w', encoding='utf-8') as f:
+            json.dump(result, f)
+        return 0
+
+    if args.quick:
+        args.script_words = [min(args.script_words)]
+        args.clip_seconds = [min(args.clip_seconds)]
+
+    workspace = args.workspace or Path(tempfile.mkdtemp(prefix="bragi_bench_"))
+    try:
+        cells = run_matrix(
+            args.script_words, args.clip_seconds, args.render_profiles, args.seed, args.repeat,
+            workspace.resolve()
+        )
+    finally:
+        if not args.workspace:
+            shutil.rmtree(workspace, ignore_errors=True)
+
+    results = {
+        "revision": git_revision(),
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "seed": args.seed,
+        "python": sys.version.split()[0],
+        "cells": cells,
+    }
+
+    results_path = None
+    if not args.no_save:
+        RESULTS_DIR.mkdir(exist_ok=True)
+        results_path = RESULTS_DIR / f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{results['revision']}.json"
+        with open(results_path, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+
+    baseline_path = args.baseline or find_baseline(exclude=results_path)
+    baseline = None
+    if baseline_path:
+        with open(baseline_path, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+
+    regressions = print_report(results, baseline)
+    if results_path:
+        print(f"\n💾 Results saved to {results_path}")
+    return 1 if regressions else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
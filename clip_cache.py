@@ -0,0 +1,406 @@
+# Local cache of downloaded Pexels background clips
+#
+# Also home to the Pexels search/download helpers, so both the pipeline and
+# the prefetcher (clip_prefetch.py) fetch clips straight into the cache.
+# The prefetcher may run as its own process, so every read-modify-write of
+# the index holds a file lock rather than a thread lock.
+
+import os
+import time
+import random
+import shutil
+import logging
+import subprocess
+from pathlib import Path
+
+import requests
+
+from media_probe import probe_media
+from pipeline_profiler import track_api_call
+from shared_state import file_lock, read_json, write_json_atomic
+
+CACHE_DIR = Path("esoteric_content_pipeline") / "clip_cache"
+INDEX_FILE = CACHE_DIR / "index.json"
+
+# Disk budget for cached clips (least recently used clips are evicted first)
+CACHE_MAX_BYTES = int(float(os.getenv("CLIP_CACHE_MAX_MB", "2048")) * 1024 * 1024)
+
+# Overridable so the benchmarks can point at a local stand-in server
+PEXELS_SEARCH_URL = os.getenv("PEXELS_SEARCH_URL", "https://api.pexels.com/videos/search")
+FALLBACK_SEARCH_TERMS = ["abstract", "nature", "cosmic", "flowing", "peaceful"]
+
+# Target frame for Shorts/TikTok - smaller variants that still cover it are preferred
+TARGET_WIDTH = 1080
+TARGET_HEIGHT = 1920
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+DOWNLOAD_ATTEMPTS = 3
+
+# Canonical mezzanine every clip is transcoded to once, at ingest. Constant
+# frame rate and a fixed one-second closed GOP keep later concat/trim steps
+# frame-accurate with plain stream copy.
+MEZZANINE_FPS = 30
+MEZZANINE_GOP = MEZZANINE_FPS
+MEZZANINE_CRF = 18
+NORMALIZE_CLIPS = os.getenv("NORMALIZE_CLIPS", "1") != "0"
+
+def clip_key(video_id, video_file):
+    """Build the cache key for one file variant of a Pexels video"""
+    variant = video_file.get("id") or f"{video_file.get('width')}x{video_file.get('height')}"
+    return f"{video_id}_{variant}"
+
+def cache_path(video_id, video_file):
+    """Where a clip variant lives once it's in the cache"""
+    return CACHE_DIR / f"{clip_key(video_id, video_file)}.mp4"
+
+def source_path_for(key):
+    """Where the raw Pexels download is kept until it has been normalized"""
+    return CACHE_DIR / f"{key}.source.mp4"
+
+def load_index():
+    """Load the cache index, dropping entries whose files have disappeared"""
+    index = {"clips": {}, "searches": {}}
+    index.update(read_json(INDEX_FILE, default={}))
+
+    for key in list(index["clips"]):
+        if not (CACHE_DIR / index["clips"][key]["file"]).exists():
+            _forget_clip(index, key)
+
+    return index
+
+def save_index(index):
+    """Write the cache index atomically (callers hold the index's file lock)"""
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    write_json_atomic(INDEX_FILE, index)
+
+def _forget_clip(index, key):
+    """Remove a clip from the index and from every search term that points at it"""
+    index["clips"].pop(key, None)
+    for term in list(index["searches"]):
+        index["searches"][term] = [k for k in index["searches"][term] if k != key]
+        if not index["searches"][term]:
+            del index["searches"][term]
+
+def _link_or_copy(source, destination):
+    """Hard-link a file when possible, otherwise copy it"""
+    destination = Path(destination)
+    if destination.exists():
+        destination.unlink()
+    try:
+        os.link(source, destination)
+    except OSError:
+        shutil.copy2(source, destination)
+
+def _touch(index, key):
+    """Mark a clip as just used (for LRU eviction)"""
+    entry = index["clips"][key]
+    entry["last_used"] = time.time()
+    entry["hits"] = entry.get("hits", 0) + 1
+    return dict(entry, key=key, path=str(CACHE_DIR / entry["file"]))
+
+def lookup_search(search_term, min_duration=None):
+    """Return a cached clip previously downloaded for this search term, if any
+
+    Clips that cover min_duration are preferred; a shorter one is still a hit
+    (the renderer loops it) rather than a reason to go back to the network.
+    """
+    with file_lock(INDEX_FILE):
+        index = load_index()
+        keys = index["searches"].get(search_term)
+        if not keys:
+            return None
+
+        clips = index["clips"]
+        if min_duration:
+            long_enough = [k for k in keys if (clips[k].get("duration") or 0) >= min_duration]
+        else:
+            long_enough = keys
+
+        if long_enough:
+            # Least recently used clip for the term keeps repeats varied
+            key = min(long_enough, key=lambda k: clips[k].get("last_used", 0))
+        else:
+            key = max(keys, key=lambda k: clips[k].get("created", 0))
+        entry = _touch(index, key)
+        save_index(index)
+        return entry
+
+def lookup_clip(video_id, video_file, search_term=None):
+    """Return the cached copy of a specific Pexels file variant, if any"""
+    key = clip_key(video_id, video_file)
+
+    with file_lock(INDEX_FILE):
+        index = load_index()
+        if key not in index["clips"]:
+            return None
+
+        if search_term:
+            keys = index["searches"].setdefault(search_term, [])
+            if key not in keys:
+                keys.append(key)
+
+        entry = _touch(index, key)
+        save_index(index)
+        return entry
+
+def mezzanine_encode_args():
+    """ffmpeg output arguments that produce the 1080x1920, constant-fps, short-GOP mezzanine"""
+    video_filter = (
+        f"scale={TARGET_WIDTH}:{TARGET_HEIGHT}:force_original_aspect_ratio=increase,"
+        f"crop={TARGET_WIDTH}:{TARGET_HEIGHT},fps={MEZZANINE_FPS},setsar=1"
+    )
+    return [
+        "-vf", video_filter,
+        "-an",  # Background clips never contribute audio
+        "-c:v", "libx264", "-preset", "veryfast", "-crf", str(MEZZANINE_CRF),
+        "-pix_fmt", "yuv420p",
+        "-g", str(MEZZANINE_GOP), "-keyint_min", str(MEZZANINE_GOP),
+        "-sc_threshold", "0", "-flags", "+cgop",
+        "-movflags", "+faststart",
+    ]
+
+def normalize_clip(source, destination):
+    """Transcode a clip to the 1080x1920, constant-fps, short-GOP mezzanine"""
+    cmd = ["ffmpeg", "-y", "-i", str(source), *mezzanine_encode_args(), str(destination)]
+    subprocess.run(cmd, check=True, capture_output=True, text=True, timeout=600)
+
+def probe_clip(path):
+    """Read duration, resolution, frame rate and codec of a clip"""
+    info = probe_media(path)
+    return {
+        "duration": info["duration"],
+        "width": info["width"],
+        "height": info["height"],
+        "fps": info["fps"],
+        "codec": info["video_codec"],
+        "bit_rate": info["bit_rate"],
+    }
+
+def ingest_clip(source, cache_file):
+    """Normalize a raw download into the cache, or keep it as-is if that fails"""
+    if NORMALIZE_CLIPS:
+        temp_file = cache_file.with_name(f"{cache_file.stem}.partial.mp4")
+        print("🎞️ Normalizing clip to 1080x1920 mezzanine...")
+        try:
+            normalize_clip(source, temp_file)
+            os.replace(temp_file, cache_file)
+            return True
+        except (subprocess.CalledProcessError, subprocess.TimeoutExpired, OSError) as e:
+            logging.warning(f"Clip normalization failed, caching original: {e}")
+            print("⚠️ Clip normalization failed, caching the original file")
+        finally:
+            if temp_file.exists():
+                temp_file.unlink()
+
+    _link_or_copy(source, cache_file)
+    return False
+
+def store_clip(source_path, video, video_file, search_term=None):
+    """Normalize a downloaded clip into the cache and evict old clips over the budget"""
+    key = clip_key(video["id"], video_file)
+    cache_file = cache_path(video["id"], video_file)
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+
+    # Transcoding happens outside the index lock so lookups aren't held up
+    normalized = ingest_clip(source_path, cache_file)
+    try:
+        probed = probe_clip(cache_file)
+    except Exception as e:
+        logging.warning(f"Could not probe cached clip {cache_file}: {e}")
+        probed = {}
+
+    # The raw download is no longer needed once the cache holds the clip
+    if Path(source_path).resolve() == source_path_for(key).resolve():
+        Path(source_path).unlink()
+
+    with file_lock(INDEX_FILE):
+        index = load_index()
+        index["clips"][key] = {
+            "file": cache_file.name,
+            "video_id": video["id"],
+            "file_id": video_file.get("id"),
+            "quality": video_file.get("quality"),
+            "source_width": video_file.get("width"),
+            "source_height": video_file.get("height"),
+            "width": probed.get("width", video_file.get("width")),
+            "height": probed.get("height", video_file.get("height")),
+            "fps": probed.get("fps"),
+            "codec": probed.get("codec"),
+            "duration": probed.get("duration", video.get("duration", 0)),
+            "normalized": normalized,
+            "size": cache_file.stat().st_size,
+            "created": time.time(),
+            "last_used": time.time(),
+            "hits": 0,
+        }
+
+        if search_term:
+            keys = index["searches"].setdefault(search_term, [])
+            if key not in keys:
+                keys.append(key)
+
+        evicted = _evict_to_budget(index, CACHE_MAX_BYTES, keep=key)
+        save_index(index)
+
+    if evicted:
+        print(f"🧹 Evicted {evicted} old clips from the cache")
+
+    return dict(index["clips"][key], key=key, path=str(cache_file))
+
+def set_pinned(key, pinned):
+    """Protect a clip from eviction (used for clips waiting in the prefetch pool)"""
+    with file_lock(INDEX_FILE):
+        index = load_index()
+        if key not in index["clips"]:
+            return False
+        index["clips"][key]["pinned"] = pinned
+        save_index(index)
+        return True
+
+def get_clip(key):
+    """Return a cached clip by key without marking it as used"""
+    entry = load_index()["clips"].get(key)
+    return dict(entry, key=key, path=str(CACHE_DIR / entry["file"])) if entry else None
+
+def copy_cached_clip(entry, output_path):
+    """Place a cached clip at output_path without touching the network
+
+    Always a real copy: a hard link would keep an evicted clip's disk space
+    in use for as long as the job's copy is around.
+    """
+    shutil.copyfile(entry["path"], output_path)
+
+def _evict_to_budget(index, max_bytes, keep=None):
+    """Delete least recently used clips until the cache fits in max_bytes"""
+    total = sum(entry["size"] for entry in index["clips"].values())
+    evicted = 0
+
+    by_age = sorted(index["clips"].items(), key=lambda item: item[1].get("last_used", 0))
+    for key, entry in by_age:
+        if total <= max_bytes:
+            break
+        if key == keep or entry.get("pinned"):
+            continue
+
+        try:
+            (CACHE_DIR / entry["file"]).unlink()
+        except FileNotFoundError:
+            pass
+        total -= entry["size"]
+        _forget_clip(index, key)
+        evicted += 1
+
+    return evicted
+
+def get_cache_stats():
+    """Summarize cache usage"""
+    index = load_index()
+    clips = index["clips"].values()
+    return {
+        "clips": len(index["clips"]),
+        "search_terms": len(index["searches"]),
+        "total_mb": sum(entry["size"] for entry in clips) / (1024 * 1024),
+        "budget_mb": CACHE_MAX_BYTES / (1024 * 1024),
+        "hits": sum(entry.get("hits", 0) for entry in clips),
+        "pinned": sum(1 for entry in clips if entry.get("pinned")),
+    }
+
+def search_videos(search_term):
+    """Search Pexels for portrait videos matching a term"""
+    headers = {"Authorization": os.getenv("PEXELS_API_KEY")}
+    params = {"query": search_term, "orientation": "portrait", "per_page": 20}
+
+    with track_api_call("pexels_search"):
+        response = requests.get(PEXELS_SEARCH_URL, headers=headers, params=params, timeout=(10, 30))
+    return response.json().get("videos", [])
+
+def select_video(videos, min_duration=None):
+    """Pick the first search result long enough to cover the audio without looping"""
+    if min_duration:
+        for video in videos:
+            if video.get("duration", 0) >= min_duration:
+                return video
+    return videos[0]
+
+def select_video_file(video_files):
+    """Pick the smallest file variant that still meets the target resolution"""
+    large_enough = [
+        vf for vf in video_files
+        if (vf.get("width") or 0) >= TARGET_WIDTH and (vf.get("height") or 0) >= TARGET_HEIGHT
+    ]
+    if large_enough:
+        return min(large_enough, key=lambda vf: vf["width"] * vf["height"])
+
+    # Nothing reaches the target - take the biggest variant we can get
+    return max(video_files, key=lambda vf: (vf.get("width") or 0) * (vf.get("height") or 0))
+
+def stream_download(url, output_path):
+    """Stream a file to disk in chunks, resuming a partial download when possible"""
+    output_path = Path(output_path)
+    part_path = output_path.with_name(output_path.name + ".part")
+
+    for attempt in range(1, DOWNLOAD_ATTEMPTS + 1):
+        resume_from = part_path.stat().st_size if part_path.exists() else 0
+        headers = {"Range": f"bytes={resume_from}-"} if resume_from else {}
+
+        try:
+            with track_api_call("pexels_download"), \
+                    requests.get(url, headers=headers, stream=True, timeout=(10, 60)) as r:
+                if r.status_code == 416:
+                    # Our partial file doesn't fit the remote one - start over
+                    part_path.unlink()
+                    continue
+                r.raise_for_status()
+
+                # 206 means the server honoured the Range header
+                mode = "ab" if r.status_code == 206 else "wb"
+                if resume_from and mode == "ab":
+                    print(f"⏩ Resuming download at {resume_from / (1024 * 1024):.1f} MB")
+
+                with open(part_path, mode) as f:
+                    for chunk in r.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                        f.write(chunk)
+
+            os.replace(part_path, output_path)
+            return output_path
+
+        except requests.RequestException as e:
+            logging.warning(f"Download attempt {attempt} failed for {url}: {e}")
+            print(f"⚠️ Download interrupted (attempt {attempt}/{DOWNLOAD_ATTEMPTS}): {e}")
+
+    raise Exception(f"Failed to download {url} after {DOWNLOAD_ATTEMPTS} attempts")
+
+def fetch_clip(search_term, min_duration=None):
+    """Search Pexels for a term and return the cached clip, downloading it if needed"""
+    print(f"🎬 Searching for: {search_term}")
+    videos = search_videos(search_term)
+
+    if not videos:
+        # Fallback to basic search terms if specific search fails
+        search_term = random.choice(FALLBACK_SEARCH_TERMS)
+        videos = search_videos(search_term)
+
+        if not videos:
+            raise Exception(f"No videos found even with fallback terms")
+
+    # Prefer a clip that already covers the audio, so no looping is needed
+    video = select_video(videos, min_duration)
+    best_video = select_video_file(video["video_files"])
+    video_duration = video.get("duration", 0)
+
+    # Same clip, same variant: reuse the cached copy instead of downloading again
+    cached = lookup_clip(video["id"], best_video, search_term)
+    if cached:
+        logging.info(f"Background video cache hit for Pexels video {video['id']}: {cached['path']}")
+        print(f"⚡ Using cached {search_term} video (original duration: {video_duration}s)")
+        return dict(cached, search_term=search_term)
+
+    logging.info(f"Downloading video: {search_term} from {best_video['link']}")
+    print(f"🎬 Downloading {search_term} video "
+          f"({best_video.get('width')}x{best_video.get('height')}, original duration: {video_duration}s)")
+
+    # Download straight into the cache so an interrupted download can resume next time
+    download_path = source_path_for(clip_key(video["id"], best_video))
+    download_path.parent.mkdir(parents=True, exist_ok=True)
+    stream_download(best_video["link"], download_path)
+
+    return dict(store_clip(download_path, video, best_video, search_term), search_term=search_term)
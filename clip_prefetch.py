@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""
+Background Clip Prefetcher
+Keeps a pool of ready-to-use background clips in the clip cache
+"""
+
+import os
+import time
+import random
+import threading
+
+from dotenv import load_dotenv
+
+from clip_cache import CACHE_DIR, CACHE_MAX_BYTES, fetch_clip, get_clip, get_cache_stats, set_pinned
+from content_variety_enhancer import BACKGROUND_CATEGORIES, record_background_search
+from shared_state import file_lock, read_json, write_json_atomic
+
+load_dotenv()
+
+POOL_FILE = CACHE_DIR / "pool.json"
+
+# Pool configuration
+POOL_SIZE = int(os.getenv("CLIP_POOL_SIZE", "6"))
+POOL_CATEGORY_QUOTA = int(os.getenv("CLIP_POOL_CATEGORY_QUOTA", "1"))
+POOL_MAX_BYTES = int(float(os.getenv("CLIP_POOL_MAX_MB", "1024")) * 1024 * 1024)
+POOL_REFILL_INTERVAL = float(os.getenv("CLIP_POOL_REFILL_SECONDS", "60"))
+
+_PREFETCHER = None
+
+def load_pool():
+    """Load the pool, dropping clips that are no longer in the cache"""
+    pool = read_json(POOL_FILE, default=[])
+    return [item for item in pool if get_clip(item["key"])]
+
+def save_pool(pool):
+    """Write the pool atomically (callers hold the pool's file lock)"""
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    write_json_atomic(POOL_FILE, pool)
+
+def take_pooled_clip(min_duration=None):
+    """Pop a ready clip from the pool (preferring ones that cover min_duration)"""
+    # The daemon prefetcher runs in its own process, so the lock is on the file
+    with file_lock(POOL_FILE):
+        pool = load_pool()
+        if not pool:
+            return None
+
+        long_enough = [item for item in pool if min_duration and item["duration"] >= min_duration]
+        item = (long_enough or pool)[0]
+        pool.remove(item)
+        save_pool(pool)
+
+    set_pinned(item["key"], False)
+    record_background_search(item["search_term"])
+
+    clip = get_clip(item["key"])
+    return dict(clip, search_term=item["search_term"]) if clip else None
+
+def _pick_category(pool):
+    """Choose the least represented category that is still under its quota"""
+    counts = {}
+    for item in pool:
+        counts[item["category"]] = counts.get(item["category"], 0) + 1
+
+    open_categories = [
+        i for i in range(len(BACKGROUND_CATEGORIES))
+        if counts.get(i, 0) < POOL_CATEGORY_QUOTA
+    ]
+    if not open_categories:
+        return None
+
+    fewest = min(counts.get(i, 0) for i in open_categories)
+    return random.choice([i for i in open_categories if counts.get(i, 0) == fewest])
+
+def fill_pool(pool_size=None):
+    """Download clips until the pool holds pool_size clips (or hits its disk cap)"""
+    pool_size = POOL_SIZE if pool_size is None else pool_size
+    added = 0
+    attempts = 0
+
+    while attempts < pool_size * 3:
+        attempts += 1
+
+        pool = load_pool()
+        pool_bytes = sum(item.get("size", 0) for item in pool)
+
+        if len(pool) >= pool_size or pool_bytes >= min(POOL_MAX_BYTES, CACHE_MAX_BYTES):
+            break
+
+        category = _pick_category(pool)
+        if category is None:
+            break
+
+        search_term = random.choice(BACKGROUND_CATEGORIES[category])
+        try:
+            clip = fetch_clip(search_term)
+        except Exception as e:
+            print(f"⚠️ Prefetch failed for '{search_term}': {e}")
+            break
+
+        with file_lock(POOL_FILE):
+            pool = load_pool()
+            if any(item["key"] == clip["key"] for item in pool):
+                continue
+            set_pinned(clip["key"], True)
+            pool.append({
+                "key": clip["key"],
+                "search_term": clip["search_term"],
+                "category": category,
+                "duration": clip["duration"],
+                "size": clip["size"],
+                "added": time.time(),
+            })
+            save_pool(pool)
+        added += 1
+
+    if added:
+        print(f"📥 Prefetched {added} background clips")
+    return added
+
+def start_prefetcher(interval=POOL_REFILL_INTERVAL):
+    """Refill the pool on a daemon thread for the life of the process"""
+    global _PREFETCHER
+
+    if _PREFETCHER is not None and _PREFETCHER.is_alive():
+        return _PREFETCHER
+
+    def _loop():
+        while True:
+            try:
+                fill_pool()
+            except Exception as e:
+                print(f"⚠️ Prefetcher error: {e}")
+            time.sleep(interval)
+
+    _PREFETCHER = threading.Thread(target=_loop, name="clip-prefetcher", daemon=True)
+    _PREFETCHER.start()
+    return _PREFETCHER
+
+def show_pool():
+    """Print what's waiting in the pool"""
+    pool = load_pool()
+    total_mb = sum(item.get("size", 0) for item in pool) / (1024 * 1024)
+
+    print(f"📦 PREFETCH POOL ({len(pool)}/{POOL_SIZE} clips, {total_mb:.1f} MB)")
+    print("=" * 40)
+    for item in pool:
+        print(f"   {item['search_term']:<20} {item['duration']:>4}s  (category {item['category']})")
+
+    stats = get_cache_stats()
+    print(f"\n🗄️ CLIP CACHE ({stats['clips']} clips for {stats['search_terms']} search terms)")
+    print(f"   {stats['total_mb']:.1f} / {stats['budget_mb']:.0f} MB used, "
+          f"{stats['pinned']} pinned, {stats['hits']} hits")
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Keep a pool of ready background clips")
+    parser.add_argument("--daemon", action="store_true", help="keep refilling the pool until interrupted")
+    parser.add_argument("--status", action="store_true", help="show the pool and clip cache, then exit")
+    args = parser.parse_args()
+
+    if args.status:
+        show_pool()
+    elif args.daemon:
+        print(f"🔁 Prefetching every {POOL_REFILL_INTERVAL:.0f}s (Ctrl+C to stop)")
+        try:
+            while True:
+                fill_pool()
+                time.sleep(POOL_REFILL_INTERVAL)
+        except KeyboardInterrupt:
+            print("\n👋 Prefetcher stopped")
+    else:
+        fill_pool()
+        show_pool()
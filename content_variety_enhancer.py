@@ -1,9 +1,15 @@
 # Enhanced topic and background variety system
 
 import random
-import json
 from pathlib import Path
 
+# Background search history (snapshot + append-only journal, see shared_state.py)
+USED_SEARCHES_FILE = Path("used_searches.json")
+SEARCH_HISTORY_LIMIT = 100
+
+# Persisted least-recently-used schedule of background search terms
+BACKGROUND_SCHEDULE_FILE = Path("background_schedule.json")
+
 # Expanded esoteric topics database
 EXPANDED_TOPICS = [
     # Original topics
@@ -165,110 +171,39 @@ BACKGROUND_CATEGORIES = [
 
 def get_varied_topic():
     """Get a topic with better variety tracking"""
-    topic_file = Path("topics.txt")
-    used_topics_file = Path("used_topics.json")
-    
-    # Load used topics tracking
-    used_topics = []
-    if used_topics_file.exists():
-        try:
-            with open(used_topics_file, 'r') as f:
-                used_topics = json.load(f)
-        except:
-            used_topics = []
-    
-    # Get available topics (file topics + expanded topics)
-    available_topics = EXPANDED_TOPICS.copy()
-    
-    # Add custom topics from file if it exists
-    if topic_file.exists():
-        with open(topic_file, 'r', encoding='utf-8') as f:
-            custom_topics = [line.strip() for line in f if line.strip()]
-            available_topics.extend(custom_topics)
-    
-    # Remove recently used topics to avoid repetition
-    if len(used_topics) > 20:  # Keep last 20 topics in memory
-        used_topics = used_topics[-20:]
-    
-    # Filter out recently used topics
-    fresh_topics = [topic for topic in available_topics if topic not in used_topics]
-    
-    # If we've used all topics, reset and use all topics again
-    if not fresh_topics:
-        fresh_topics = available_topics
-        used_topics = []
-        print("🔄 Topic pool refreshed - starting new cycle")
-    
-    # Select random topic
-    selected_topic = random.choice(fresh_topics)
+    from topic_store import pick_topic
     
-    # Track usage
-    used_topics.append(selected_topic)
-    
-    # Save usage tracking
-    try:
-        with open(used_topics_file, 'w') as f:
-            json.dump(used_topics, f)
-    except:
-        pass  # Ignore save errors
-    
-    return selected_topic
+    # Least recently used topic; the rotation lives in topics.db
+    return pick_topic()
+
+def all_background_searches():
+    """Every background search term once, in category order"""
+    return list(dict.fromkeys(term for category in BACKGROUND_CATEGORIES for term in category))
 
 def get_varied_background_search():
     """Get varied background video search terms"""
-    used_searches_file = Path("used_searches.json")
-    
-    # Load used searches tracking
-    used_searches = []
-    if used_searches_file.exists():
-        try:
-            with open(used_searches_file, 'r') as f:
-                used_searches = json.load(f)
-        except:
-            used_searches = []
-    
-    # Keep last 15 searches in memory
-    if len(used_searches) > 15:
-        used_searches = used_searches[-15:]
-    
-    # Flatten all background categories
-    all_searches = []
-    for category in BACKGROUND_CATEGORIES:
-        all_searches.extend(category)
-    
-    # Filter out recently used searches
-    fresh_searches = [search for search in all_searches if search not in used_searches]
+    from rotation import pick_next
+    from shared_state import append_usage
     
-    # If we've used most searches, reset
-    if len(fresh_searches) < 5:
-        fresh_searches = all_searches
-        used_searches = []
-        print("🔄 Background search pool refreshed")
-    
-    # Select random search term
-    selected_search = random.choice(fresh_searches)
-    
-    # Track usage
-    used_searches.append(selected_search)
-    
-    # Save usage tracking
-    try:
-        with open(used_searches_file, 'w') as f:
-            json.dump(used_searches, f)
-    except:
-        pass
+    # Every term comes up once before any repeats (see rotation.py)
+    selected_search = pick_next(BACKGROUND_SCHEDULE_FILE, all_background_searches())
+    append_usage(USED_SEARCHES_FILE, selected_search, keep=SEARCH_HISTORY_LIMIT)
     
     return selected_search
 
+def record_background_search(search_term):
+    """Track a search term that was used without going through get_varied_background_search"""
+    from rotation import mark_used
+    from shared_state import append_usage
+    
+    mark_used(BACKGROUND_SCHEDULE_FILE, search_term, all_background_searches())
+    append_usage(USED_SEARCHES_FILE, search_term, keep=SEARCH_HISTORY_LIMIT)
+
 def auto_expand_topics():
     """Automatically generate new topics using Claude"""
     try:
-        import anthropic
-        import os
-        from dotenv import load_dotenv
-        
-        load_dotenv()
-        client = anthropic.Anthropic(api_key=os.getenv("ANTHROPIC_API_KEY"))
+        from llm_cache import cached_completion
+        from topic_store import add_topics, get_topic_stats
         
         # Generate new topics in different categories
         categories = [
@@ -294,24 +229,25 @@ Make them:
 
 Format: One topic per line, no numbers or bullets."""
 
-        response = client.messages.create(
+        # Keyed on the bank's state: once this batch is added (or a topic is picked)
+        # the next call asks again, but a run that failed before adding it reuses the reply
+        stats = get_topic_stats()
+        text = cached_completion(
             model="claude-3-5-sonnet-20241022",
-            max_tokens=300,
-            temperature=1.2,
             system="You are a mystical philosopher generating unique content ideas.",
-            messages=[{"role": "user", "content": prompt}]
+            prompt=prompt,
+            temperature=1.2,
+            max_tokens=300,
+            slot=[stats["total"], stats["uses"]]
         )
         
-        new_topics = [line.strip() for line in response.content[0].text.strip().split('\n') if line.strip()]
+        new_topics = [line.strip() for line in text.strip().split('\n') if line.strip()]
         
-        # Add to topics file
-        topics_file = Path("topics.txt")
-        with open(topics_file, 'a', encoding='utf-8') as f:
-            for topic in new_topics:
-                f.write(f"{topic}\n")
+        # Add to the topic store (topics already in the bank are skipped)
+        added = add_topics(new_topics, source="auto", category=category)
         
-        print(f"✨ Added {len(new_topics)} new auto-generated topics")
-        return new_topics
+        print(f"✨ Added {len(added)} new auto-generated topics")
+        return added
         
     except Exception as e:
         print(f"⚠️ Auto topic generation failed: {e}")
@@ -328,33 +264,34 @@ def create_expanded_topics_file():
                 f.write(f"{topic}\n")
         print(f"📝 Created expanded topics file with {len(EXPANDED_TOPICS)} topics")
 
+def expand_topic_bank():
+    """Per-job topic bank upkeep, whether the job's topic is picked now or was queued"""
+    # Ensure we have an expanded topics file
+    create_expanded_topics_file()
+    
+    # 10% chance to auto-generate new topics
+    if random.random() < 0.1:
+        auto_expand_topics()
+
 # Usage tracking for insights
 def get_content_variety_stats():
     """Show variety statistics"""
-    used_topics_file = Path("used_topics.json")
-    used_searches_file = Path("used_searches.json")
+    from topic_store import get_topic_stats
+    from shared_state import load_usage
+    from rotation import schedule_progress
+    
+    topic_stats = get_topic_stats()
+    search_round, searches_due = schedule_progress(BACKGROUND_SCHEDULE_FILE, all_background_searches())
     
     stats = {
-        "total_available_topics": len(EXPANDED_TOPICS),
-        "used_topics": 0,
-        "total_search_terms": sum(len(cat) for cat in BACKGROUND_CATEGORIES),
-        "used_searches": 0
+        "total_available_topics": topic_stats["total"],
+        "used_topics": topic_stats["used"],
+        "topic_round": topic_stats["round"],
+        "topics_due": topic_stats["due"],
+        "total_search_terms": len(all_background_searches()),
+        "used_searches": len(set(load_usage(USED_SEARCHES_FILE))),
+        "search_round": search_round,
+        "searches_due": searches_due
     }
     
-    if used_topics_file.exists():
-        try:
-            with open(used_topics_file, 'r') as f:
-                used_topics = json.load(f)
-                stats["used_topics"] = len(set(used_topics))
-        except:
-            pass
-    
-    if used_searches_file.exists():
-        try:
-            with open(used_searches_file, 'r') as f:
-                used_searches = json.load(f)
-                stats["used_searches"] = len(set(used_searches))
-        except:
-            pass
-    
     return stats
\ No newline at end of file
@@ -1,7 +1,12 @@
 import random
-import json
 from pathlib import Path
 
+# Caption/hashtag history (snapshot + append-only journal, see shared_state.py)
+CAPTION_USAGE_FILE = Path("caption_hashtag_usage.json")
+
+# Keep only the last 50 to avoid infinite growth
+CAPTION_HISTORY_LIMIT = 50
+
 # Varied caption starters and styles
 CAPTION_STYLES = [
     # Question-based openings
@@ -323,40 +328,52 @@ def create_youtube_title_and_description(topic):
     
     return title, full_description
 
+def _usage_entries(snapshot):
+    """Read the old {"captions": [...], "hashtag_combos": [...]} snapshot as usage entries"""
+    if isinstance(snapshot, dict):
+        return [
+            {"caption": caption, "hashtags": hashtags}
+            for caption, hashtags in zip(snapshot.get("captions", []), snapshot.get("hashtag_combos", []))
+        ]
+    return snapshot
+
 def track_caption_hashtag_usage():
     """Track usage to ensure variety over time"""
-    usage_file = Path("caption_hashtag_usage.json")
-    
-    # Load existing usage
-    usage_data = {"captions": [], "hashtag_combos": []}
-    if usage_file.exists():
-        try:
-            with open(usage_file, 'r') as f:
-                usage_data = json.load(f)
-        except:
-            pass
-    
-    return usage_data
+    from shared_state import load_usage
+    
+    entries = load_usage(CAPTION_USAGE_FILE, keep=CAPTION_HISTORY_LIMIT, convert=_usage_entries)
+    return {
+        "captions": [entry["caption"] for entry in entries],
+        "hashtag_combos": [entry["hashtags"] for entry in entries],
+    }
 
 def save_caption_hashtag_usage(caption, hashtags):
     """Save usage for variety tracking"""
-    usage_file = Path("caption_hashtag_usage.json")
-    usage_data = track_caption_hashtag_usage()
-    
-    # Add new usage
-    usage_data["captions"].append(caption)
-    usage_data["hashtag_combos"].append(hashtags)
-    
-    # Keep only last 50 to avoid infinite growth
-    usage_data["captions"] = usage_data["captions"][-50:]
-    usage_data["hashtag_combos"] = usage_data["hashtag_combos"][-50:]
+    from shared_state import append_usage
     
-    # Save
-    try:
-        with open(usage_file, 'w') as f:
-            json.dump(usage_data, f)
-    except:
-        pass  # Ignore save errors
+    append_usage(
+        CAPTION_USAGE_FILE, {"caption": caption, "hashtags": hashtags},
+        keep=CAPTION_HISTORY_LIMIT, convert=_usage_entries
+    )
+
+def pick_tiktok_caption(topic, attempts=10):
+    """Create a TikTok caption whose hashtag combo wasn't used recently and record it
+    
+    Runs under the usage file lock, so parallel workers never hand out the same combo.
+    """
+    from shared_state import pick_usage
+    
+    def choose(entries):
+        recent_combos = {frozenset(entry["hashtags"]) for entry in entries}
+        for _ in range(attempts):
+            caption = create_tiktok_caption(topic)
+            hashtags = [tag for tag in caption.split() if tag.startswith('#')]
+            if frozenset(hashtags) not in recent_combos:
+                break
+        return {"caption": caption, "hashtags": hashtags}
+    
+    entry = pick_usage(CAPTION_USAGE_FILE, choose, keep=CAPTION_HISTORY_LIMIT, convert=_usage_entries)
+    return entry["caption"]
 
 def get_caption_variety_stats():
     """Get statistics on caption/hashtag variety"""
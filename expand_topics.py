@@ -1,11 +1,5 @@
-import anthropic
-from dotenv import load_dotenv
-import os
-from pathlib import Path
-
-load_dotenv()
-client = anthropic.Anthropic(api_key=os.getenv("ANTHROPIC_API_KEY"))
-TOPIC_FILE = "topics.txt"
+from llm_cache import cached_completion
+from topic_store import add_topics, get_topic_stats, TOPIC_DB
 
 def expand_topics():
     system_prompt = "You are an enlightened philosopher helping generate unique esoteric content ideas for social media videos."
@@ -14,22 +8,23 @@ def expand_topics():
         "Keep them poetic, mystical, and mysterious. Each on its own line."
     )
 
-    response = client.messages.create(
+    # A fresh sample once the bank has changed (new topics or picks) since the last call
+    stats = get_topic_stats()
+    text = cached_completion(
         model="claude-3-sonnet-20240229",
-        max_tokens=300,
-        temperature=1.1,
         system=system_prompt,
-        messages=[{"role": "user", "content": user_prompt}]
+        prompt=user_prompt,
+        temperature=1.1,
+        max_tokens=300,
+        slot=[stats["total"], stats["uses"]]
     )
 
-    new_topics = response.content[0].text.strip().split("\n")
+    new_topics = text.strip().split("\n")
     new_topics = [t.strip("•- ").strip() for t in new_topics if t.strip()]
 
-    with open(TOPIC_FILE, "a", encoding="utf-8") as f:
-        for topic in new_topics:
-            f.write(f"{topic}\n")
+    added = add_topics(new_topics, source="auto")
 
-    print(f"[+] Added {len(new_topics)} new topics to {TOPIC_FILE}")
+    print(f"[+] Added {len(added)} new topics to {TOPIC_DB} ({len(new_topics) - len(added)} already known)")
 
 if __name__ == "__main__":
     expand_topics()
@@ -3,14 +3,89 @@ from pathlib import Path
 import subprocess
 import os
 import shutil
-import tempfile
+import threading
+import time
 import re
+import difflib
 
-def transcribe_audio_to_srt(audio_path, srt_path):
+# Resident Whisper models, keyed by (model size, device)
+_MODEL_CACHE = {}
+_MODEL_LAST_USED = {}
+_MODEL_LOCK = threading.Lock()
+_IDLE_TIMER = None
+
+# Unload models idle for this many seconds (0 keeps them resident forever)
+MODEL_IDLE_TIMEOUT = float(os.getenv("WHISPER_IDLE_TIMEOUT", "0"))
+
+# "align" times the known script against the voice, "transcribe" runs free Whisper
+CAPTION_MODE = os.getenv("CAPTION_MODE", "align")
+ALIGN_MODEL_SIZE = os.getenv("WHISPER_ALIGN_MODEL", "tiny")
+ALIGN_LANGUAGE = "en"
+
+# Below this share of script words heard in the audio, alignment is not trusted
+MIN_ALIGN_MATCH_RATIO = 0.5
+
+def get_whisper_model(size="base", device=None):
+    """Load a Whisper model once per (size, device) and reuse it across calls"""
+    key = (size, device)
+    
+    with _MODEL_LOCK:
+        model = _MODEL_CACHE.get(key)
+        if model is None:
+            print(f"🧠 Loading Whisper model '{size}'...")
+            model = whisper.load_model(size, device=device)
+            _MODEL_CACHE[key] = model
+        _MODEL_LAST_USED[key] = time.monotonic()
+    
+    _schedule_idle_unload()
+    return model
+
+def unload_whisper_models(max_idle=None):
+    """Drop resident models (only those idle longer than max_idle, if given)"""
+    now = time.monotonic()
+    
+    with _MODEL_LOCK:
+        for key in list(_MODEL_CACHE):
+            if max_idle is None or now - _MODEL_LAST_USED.get(key, 0) >= max_idle:
+                del _MODEL_CACHE[key]
+                _MODEL_LAST_USED.pop(key, None)
+                print(f"🧹 Unloaded idle Whisper model '{key[0]}'")
+        
+        remaining = len(_MODEL_CACHE)
+    
+    # Give freed GPU memory back too, if torch is using CUDA
+    try:
+        import torch
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
+    except Exception:
+        pass
+    
+    return remaining
+
+def _schedule_idle_unload():
+    """Re-arm the idle timer so unused models are released after the timeout"""
+    global _IDLE_TIMER
+    
+    if MODEL_IDLE_TIMEOUT <= 0:
+        return
+    
+    def _check():
+        if unload_whisper_models(max_idle=MODEL_IDLE_TIMEOUT):
+            _schedule_idle_unload()
+    
+    with _MODEL_LOCK:
+        if _IDLE_TIMER is not None:
+            _IDLE_TIMER.cancel()
+        _IDLE_TIMER = threading.Timer(MODEL_IDLE_TIMEOUT, _check)
+        _IDLE_TIMER.daemon = True
+        _IDLE_TIMER.start()
+
+def transcribe_audio_to_srt(audio_path, srt_path, model_size="base"):
     """Transcribe audio to SRT with short, punchy captions that sync perfectly"""
     try:
         # Use word-level timestamps for precise control
-        model = whisper.load_model("base")
+        model = get_whisper_model(model_size)
         result = model.transcribe(str(audio_path), word_timestamps=True)
         
         with open(srt_path, "w", encoding="utf-8") as f:
@@ -52,6 +127,103 @@ def transcribe_audio_to_srt(audio_path, srt_path):
         print(f"❌ Caption generation failed: {e}")
         raise
 
+def generate_captions_srt(voice_audio_path, script, srt_path, fallback_audio_path=None):
+    """Create captions for a known script, falling back to free transcription"""
+    if CAPTION_MODE == "align" and script:
+        try:
+            align_script_to_srt(voice_audio_path, script, srt_path)
+            return "align"
+        except Exception as e:
+            print(f"⚠️ Script alignment failed ({e}), falling back to transcription")
+    
+    transcribe_audio_to_srt(fallback_audio_path or voice_audio_path, srt_path)
+    return "transcribe"
+
+def align_script_to_srt(audio_path, script, srt_path, model_size=ALIGN_MODEL_SIZE):
+    """Time the exact script words against the voice track and write an SRT"""
+    model = get_whisper_model(model_size)
+    
+    # Fixed language and the script as prompt keep the small model on track
+    result = model.transcribe(
+        str(audio_path),
+        language=ALIGN_LANGUAGE,
+        initial_prompt=script[:800],
+        word_timestamps=True,
+        fp16=False,
+    )
+    
+    heard_words = [w for segment in result["segments"] for w in segment.get("words", [])]
+    if not heard_words:
+        raise ValueError("no word timings in alignment pass")
+    
+    timed_words = align_words_to_script(heard_words, script)
+    write_srt(create_punchy_chunks(timed_words), srt_path)
+    
+    print(f"✅ Script-aligned captions saved to: {srt_path}")
+
+def _normalize_word(word):
+    """Lowercase a word and strip punctuation for matching"""
+    return re.sub(r"[^\w']", "", word.lower())
+
+def align_words_to_script(heard_words, script):
+    """Carry Whisper word timings over to the script's own words"""
+    script_words = script.split()
+    heard_norm = [_normalize_word(w.get("word", "")) for w in heard_words]
+    script_norm = [_normalize_word(w) for w in script_words]
+    
+    starts = [None] * len(script_words)
+    ends = [None] * len(script_words)
+    matched = 0
+    
+    matcher = difflib.SequenceMatcher(None, heard_norm, script_norm, autojunk=False)
+    for tag, h1, h2, s1, s2 in matcher.get_opcodes():
+        if tag == "equal":
+            for offset in range(s2 - s1):
+                starts[s1 + offset] = heard_words[h1 + offset]["start"]
+                ends[s1 + offset] = heard_words[h1 + offset]["end"]
+            matched += s2 - s1
+        elif tag == "replace":
+            # Spread the misheard span evenly over the script words it stands for
+            span_start = heard_words[h1]["start"]
+            span_end = heard_words[h2 - 1]["end"]
+            step = (span_end - span_start) / (s2 - s1)
+            for offset in range(s2 - s1):
+                starts[s1 + offset] = span_start + offset * step
+                ends[s1 + offset] = span_start + (offset + 1) * step
+    
+    if not script_words or matched / len(script_words) < MIN_ALIGN_MATCH_RATIO:
+        raise ValueError(f"only {matched}/{len(script_words)} script words matched the audio")
+    
+    # Words Whisper never heard get squeezed between their timed neighbours
+    i = 0
+    while i < len(script_words):
+        if starts[i] is not None:
+            i += 1
+            continue
+        j = i
+        while j < len(script_words) and starts[j] is None:
+            j += 1
+        gap_start = ends[i - 1] if i > 0 else 0.0
+        gap_end = starts[j] if j < len(script_words) else gap_start + 0.3 * (j - i)
+        step = max(gap_end - gap_start, 0.0) / (j - i)
+        for k in range(i, j):
+            starts[k] = gap_start + (k - i) * step
+            ends[k] = gap_start + (k - i + 1) * step
+        i = j
+    
+    return [
+        {"word": word, "start": start, "end": end}
+        for word, start, end in zip(script_words, starts, ends)
+    ]
+
+def write_srt(chunks, srt_path):
+    """Write caption chunks to an SRT file"""
+    with open(srt_path, "w", encoding="utf-8") as f:
+        for subtitle_index, chunk in enumerate(chunks, 1):
+            start = format_timestamp(chunk["start"])
+            end = format_timestamp(chunk["end"])
+            f.write(f"{subtitle_index}\n{start} --> {end}\n{chunk['text']}\n\n")
+
 def create_punchy_chunks(words, max_words=3, max_chars=20):
     """Create short, impactful caption chunks from word timestamps"""
     chunks = []
@@ -169,143 +341,181 @@ def format_timestamp(seconds):
     ms = int((seconds % 1) * 1000)
     return f"{hrs:02}:{mins:02}:{secs:02},{ms:03}"
 
-def burn_captions(video_path, srt_path, output_path):
-    """Burn elegant, mobile-optimized captions"""
+# Mobile caption style shared by the single-pass render and burn_captions
+CAPTION_STYLE = {
+    "FontName": "Arial Black",
+    "FontSize": 40,
+    "Bold": 1,
+    "PrimaryColour": "&Hffffff&",
+    "OutlineColour": "&H000000&",
+    "Outline": 4,
+    "Shadow": 2,
+    "Alignment": 2,
+    "MarginV": 160,
+    "BorderStyle": 1,
+}
+
+# Fonts tried in order when the styled font isn't installed
+FALLBACK_CAPTION_FONTS = ["Arial", "DejaVu Sans", "Liberation Sans"]
+
+# ffmpeg renders SRT through libass on a 384x288 canvas - keep it so sizes match
+ASS_PLAY_RES = (384, 288)
+
+# Results of the one-time font and filter checks
+_RENDER_CHECKS = {}
+_RENDER_CHECKS_LOCK = threading.Lock()
+
+def escape_filter_value(value):
+    """Escape a filter option value (backslash, quote and colon) for ffmpeg"""
+    return re.sub(r"([\\':])", r"\\\1", str(value))
+
+def _quote_filter(name, options):
+    # Quote the whole option string so commas in the style survive graph parsing
+    return f"{name}='" + options.replace("'", "'\\''") + "'"
+
+def ass_filter(ass_path):
+    """Build an ass= filter for a styled ASS file using an absolute path"""
+    return _quote_filter("ass", f"filename={escape_filter_value(Path(ass_path).resolve().as_posix())}")
+
+def has_subtitle_filters():
+    """Whether this ffmpeg was built with libass' ass filter (checked once per process)"""
+    with _RENDER_CHECKS_LOCK:
+        if "filters" not in _RENDER_CHECKS:
+            try:
+                result = subprocess.run(
+                    ["ffmpeg", "-hide_banner", "-filters"], capture_output=True, text=True, timeout=30
+                )
+                names = {line.split()[1] for line in result.stdout.splitlines() if len(line.split()) > 2}
+                _RENDER_CHECKS["filters"] = "ass" in names
+            except (OSError, subprocess.SubprocessError):
+                _RENDER_CHECKS["filters"] = False
+            
+            if not _RENDER_CHECKS["filters"]:
+                print("⚠️ This ffmpeg has no libass subtitle filters - captions can't be burned")
+        return _RENDER_CHECKS["filters"]
+
+def resolve_caption_font(font_name=CAPTION_STYLE["FontName"]):
+    """Pick an installed caption font via fc-match (checked once per font)"""
+    with _RENDER_CHECKS_LOCK:
+        cache_key = ("font", font_name)
+        if cache_key not in _RENDER_CHECKS:
+            _RENDER_CHECKS[cache_key] = _match_font([font_name] + FALLBACK_CAPTION_FONTS) or font_name
+            if _RENDER_CHECKS[cache_key] != font_name:
+                print(f"⚠️ Caption font '{font_name}' not installed, using '{_RENDER_CHECKS[cache_key]}'")
+        return _RENDER_CHECKS[cache_key]
+
+def _match_font(candidates):
+    """First candidate fontconfig actually has (None when fc-match is unavailable)"""
+    for name in candidates:
+        try:
+            result = subprocess.run(
+                ["fc-match", "--format=%{family}", name], capture_output=True, text=True, timeout=10
+            )
+        except (OSError, subprocess.SubprocessError):
+            # No fontconfig (e.g. Windows) - let libass resolve the name itself
+            return None
+        
+        families = [family.strip().lower() for family in result.stdout.split(",")]
+        if name.lower() in families:
+            return name
+    return None
+
+def format_ass_timestamp(seconds):
+    """Format seconds to ASS timestamp format (h:mm:ss.cc)"""
+    centiseconds = int(round(seconds * 100))
+    hrs, centiseconds = divmod(centiseconds, 360000)
+    mins, centiseconds = divmod(centiseconds, 6000)
+    secs, centiseconds = divmod(centiseconds, 100)
+    return f"{hrs}:{mins:02}:{secs:02}.{centiseconds:02}"
+
+def parse_srt_time(timestamp):
+    """Parse an SRT timestamp (00:00:01,500) into seconds"""
+    hrs, mins, rest = timestamp.strip().split(":")
+    secs, _, ms = rest.partition(",")
+    return int(hrs) * 3600 + int(mins) * 60 + int(secs) + int(ms or 0) / 1000
+
+def write_ass(srt_path, ass_path, style=None):
+    """Convert an SRT file to an ASS file carrying the caption style"""
+    style = dict(CAPTION_STYLE, **(style or {}))
+    style["FontName"] = resolve_caption_font(style["FontName"])
+    
+    fields = [
+        "Name", "FontName", "FontSize", "PrimaryColour", "OutlineColour", "Bold",
+        "BorderStyle", "Outline", "Shadow", "Alignment", "MarginV",
+    ]
+    values = dict(style, Name="Caption")
+    
+    lines = [
+        "[Script Info]",
+        "ScriptType: v4.00+",
+        f"PlayResX: {ASS_PLAY_RES[0]}",
+        f"PlayResY: {ASS_PLAY_RES[1]}",
+        "ScaledBorderAndShadow: yes",
+        "",
+        "[V4+ Styles]",
+        "Format: " + ", ".join(fields),
+        "Style: " + ",".join(str(values[field]) for field in fields),
+        "",
+        "[Events]",
+        "Format: Layer, Start, End, Style, Text",
+    ]
+    
+    with open(srt_path, "r", encoding="utf-8") as f:
+        blocks = f.read().strip().split("\n\n")
+    
+    for block in blocks:
+        block_lines = block.strip().split("\n")
+        if len(block_lines) < 3 or "-->" not in block_lines[1]:
+            continue
+        start, end = (parse_srt_time(t) for t in block_lines[1].split("-->"))
+        # Braces would start ASS override tags
+        text = "\\N".join(block_lines[2:]).replace("{", "(").replace("}", ")")
+        lines.append(
+            f"Dialogue: 0,{format_ass_timestamp(start)},{format_ass_timestamp(end)},Caption,{text}"
+        )
+    
+    with open(ass_path, "w", encoding="utf-8") as f:
+        f.write("\n".join(lines) + "\n")
+    return ass_path
+
+def burn_captions(video_path, srt_path, output_path, render_profile=None):
+    """Burn elegant, mobile-optimized captions in a single encode
+    
+    Paths are passed to ffmpeg absolute and escaped, so several burns can run
+    at once; the output is written straight to `output_path`.
+    """
+    from render_profiles import video_encode_args
     
     print("🔥 Burning elegant captions into video...")
     
-    # Use temporary directory for clean processing
-    with tempfile.TemporaryDirectory() as temp_dir:
-        temp_dir_path = Path(temp_dir)
+    if has_subtitle_filters():
+        ass_path = Path(output_path).with_suffix(".ass")
+        write_ass(srt_path, ass_path)
         
-        # Copy files to temp directory with simple names
-        temp_video = temp_dir_path / "input.mp4"
-        temp_srt = temp_dir_path / "captions.srt"
-        temp_output = temp_dir_path / "output.mp4"
+        cmd = [
+            "ffmpeg", "-y",
+            "-i", str(video_path),
+            "-vf", ass_filter(ass_path),
+            *video_encode_args(render_profile),
+            "-c:a", "copy",
+            str(output_path)
+        ]
         
         try:
-            # Copy input files
-            shutil.copy2(video_path, temp_video)
-            shutil.copy2(srt_path, temp_srt)
-            
-            # Change to temp directory
-            original_cwd = os.getcwd()
-            os.chdir(temp_dir)
-            
-            # Method 1: Perfect TikTok/YouTube mobile style
-            cmd = [
-                "ffmpeg", "-y",
-                "-i", "input.mp4",
-                "-vf", (
-                    "subtitles=captions.srt:force_style='"
-                    "FontName=Arial Black,"
-                    "FontSize=40,"
-                    "Bold=1,"
-                    "PrimaryColour=&Hffffff&,"
-                    "OutlineColour=&H000000&,"
-                    "Outline=4,"
-                    "Shadow=2,"
-                    "Alignment=2,"
-                    "MarginV=160,"
-                    "BorderStyle=1"
-                    "'"
-                ),
-                "-c:a", "copy",
-                "output.mp4"
-            ]
-            
             print("🎬 Creating professional captions...")
-            result = subprocess.run(cmd, capture_output=True, text=True, timeout=180)
-            
+            result = subprocess.run(cmd, capture_output=True, text=True, timeout=600)
             if result.returncode == 0:
-                os.chdir(original_cwd)
-                shutil.copy2(temp_output, output_path)
                 print("✅ Professional captions created successfully!")
                 return
-            else:
-                print(f"⚠️ Professional style failed, trying simplified...")
-                
-        except Exception as e:
-            print(f"⚠️ Professional style exception: {e}")
-        
-        # Method 2: Simplified but elegant style
-        try:
-            os.chdir(temp_dir)
-            
-            cmd = [
-                "ffmpeg", "-y",
-                "-i", "input.mp4",
-                "-vf", (
-                    "subtitles=captions.srt:force_style='"
-                    "FontName=Arial,"
-                    "FontSize=28,"
-                    "Bold=1,"
-                    "PrimaryColour=&Hffffff&,"
-                    "OutlineColour=&H000000&,"
-                    "Outline=2,"
-                    "Alignment=2,"
-                    "MarginV=100"
-                    "'"
-                ),
-                "-c:a", "copy",
-                "output.mp4"
-            ]
-            
-            print("🎬 Creating simplified elegant captions...")
-            result = subprocess.run(cmd, capture_output=True, text=True, timeout=180)
-            
-            if result.returncode == 0:
-                os.chdir(original_cwd)
-                shutil.copy2(temp_output, output_path)
-                print("✅ Simplified elegant captions created!")
-                return
-            else:
-                print(f"⚠️ Simplified style failed...")
-                
-        except Exception as e:
-            print(f"⚠️ Simplified style exception: {e}")
-        
-        # Method 3: Ultra-minimal fallback
-        try:
-            os.chdir(temp_dir)
-            
-            # Create ultra-simple SRT
-            simple_srt = temp_dir_path / "simple.srt"
-            create_minimal_srt(temp_srt, simple_srt)
-            
-            cmd = [
-                "ffmpeg", "-y",
-                "-i", "input.mp4",
-                "-vf", (
-                    "subtitles=simple.srt:force_style='"
-                    "FontSize=24,"
-                    "PrimaryColour=&Hffffff&,"
-                    "OutlineColour=&H000000&,"
-                    "Outline=1,"
-                    "Alignment=2"
-                    "'"
-                ),
-                "-c:a", "copy",
-                "output.mp4"
-            ]
-            
-            print("🎬 Creating minimal captions...")
-            result = subprocess.run(cmd, capture_output=True, text=True, timeout=180)
-            
-            if result.returncode == 0:
-                os.chdir(original_cwd)
-                shutil.copy2(temp_output, output_path)
-                print("✅ Minimal captions created!")
-                return
-                
-        except Exception as e:
-            print(f"⚠️ Minimal style exception: {e}")
-        
-        # Restore working directory
-        os.chdir(original_cwd)
+            print(f"⚠️ Caption burn failed: {result.stderr.strip()[-300:]}")
+        except subprocess.TimeoutExpired:
+            print("⚠️ Caption burn timed out")
+        finally:
+            if ass_path.exists():
+                ass_path.unlink()
     
-    # If all methods failed, copy video without captions
-    print("📝 All caption methods failed - using video without captions")
+    # If burning isn't possible, ship the video without captions
+    print("📝 Caption burn failed - using video without captions")
     try:
         shutil.copy2(video_path, output_path)
         print("✅ Video ready (without burned captions)")
@@ -313,38 +523,3 @@ def burn_captions(video_path, srt_path, output_path):
     except Exception as e:
         print(f"❌ Even video copy failed: {e}")
         raise
-
-def create_minimal_srt(input_srt, output_srt):
-    """Create a minimal SRT file with very short, key phrases only"""
-    
-    try:
-        with open(input_srt, 'r', encoding='utf-8') as f:
-            content = f.read()
-        
-        # Split into subtitle blocks
-        blocks = content.strip().split('\n\n')
-        
-        with open(output_srt, 'w', encoding='utf-8') as f:
-            for i, block in enumerate(blocks, 1):
-                lines = block.strip().split('\n')
-                if len(lines) >= 3:
-                    # Get timing and text
-                    timing = lines[1]
-                    text = ' '.join(lines[2:])
-                    
-                    # Extract key phrases only (first few words)
-                    words = text.split()
-                    if len(words) > 3:
-                        key_phrase = ' '.join(words[:3]) + "..."
-                    else:
-                        key_phrase = text
-                    
-                    # Clean up
-                    key_phrase = re.sub(r'[^\w\s\.]', '', key_phrase)
-                    
-                    f.write(f"{i}\n{timing}\n{key_phrase}\n\n")
-                    
-    except Exception as e:
-        print(f"⚠️ Failed to create minimal SRT: {e}")
-        # If failed, just copy the original
-        shutil.copy2(input_srt, output_srt)
\ No newline at end of file
@@ -0,0 +1,121 @@
+# On-disk cache for Claude responses
+#
+# Responses are keyed by (model, system prompt, prompt, temperature,
+# max_tokens, sample slot) and stored one JSON file per entry. The slot lets a
+# caller ask for a fresh sample of the same prompt (a new job) or the same one
+# again (a rerun of that job). Entries expire after LLM_CACHE_TTL_DAYS and the
+# least recently used are evicted above LLM_CACHE_MAX_MB.
+#
+# LLM_CACHE=on      read and write the cache (default)
+# LLM_CACHE=off     always call the API
+# LLM_CACHE=replay  never call the API; a missing entry is an error
+
+import os
+import json
+import time
+import hashlib
+import logging
+from pathlib import Path
+
+from pipeline_profiler import track_api_call
+from shared_state import read_json, write_json_atomic
+
+LLM_CACHE_DIR = Path(os.getenv("LLM_CACHE_DIR", Path("esoteric_content_pipeline") / "llm_cache"))
+LLM_CACHE_MODE = os.getenv("LLM_CACHE", "on")
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL_DAYS", "30")) * 86400
+LLM_CACHE_MAX_BYTES = int(float(os.getenv("LLM_CACHE_MAX_MB", "200")) * 1024 * 1024)
+
+# Shared API client - built once per process and reused across batch jobs
+_CLIENTS = {}
+
+def get_anthropic_client():
+    """Get the shared Anthropic client, creating it on first use"""
+    if "anthropic" not in _CLIENTS:
+        import anthropic
+        from dotenv import load_dotenv
+
+        load_dotenv()
+        _CLIENTS["anthropic"] = anthropic.Anthropic(api_key=os.getenv("ANTHROPIC_API_KEY"))
+    return _CLIENTS["anthropic"]
+
+def cache_key(model, system, prompt, temperature, max_tokens, slot=None):
+    """Stable hash of everything that determines a response"""
+    payload = json.dumps(
+        [model, system, prompt, temperature, max_tokens, slot], sort_keys=True, ensure_ascii=False
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def _entry_path(key):
+    return LLM_CACHE_DIR / key[:2] / f"{key}.json"
+
+def cached_completion(model, system, prompt, temperature, max_tokens, slot=None, mode=None):
+    """Text of Claude's reply to `prompt`, served from the cache when possible"""
+    mode = mode or LLM_CACHE_MODE
+    if mode not in ("on", "off", "replay"):
+        raise ValueError(f"Unknown LLM_CACHE mode '{mode}' (choose from: on, off, replay)")
+
+    key = cache_key(model, system, prompt, temperature, max_tokens, slot)
+    path = _entry_path(key)
+
+    if mode != "off":
+        entry = read_json(path)
+        # Replay serves whatever was recorded, however old
+        if entry and (mode == "replay" or time.time() - entry["created"] < LLM_CACHE_TTL):
+            os.utime(path)  # Mark as recently used for eviction
+            print(f"♻️ Using cached Claude response ({model})")
+            return entry["text"]
+        if mode == "replay":
+            raise LookupError(f"No cached Claude response for this request (key {key[:12]}) in replay mode")
+
+    with track_api_call("claude"):
+        response = get_anthropic_client().messages.create(
+            model=model,
+            max_tokens=max_tokens,
+            temperature=temperature,
+            system=system,
+            messages=[{"role": "user", "content": prompt}]
+        )
+    text = response.content[0].text
+
+    if mode == "on":
+        path.parent.mkdir(parents=True, exist_ok=True)
+        write_json_atomic(path, {"created": time.time(), "model": model, "slot": slot, "text": text})
+        evict_cache()
+    return text
+
+def evict_cache(max_bytes=None, ttl=None):
+    """Drop expired entries, then the least recently used until the cache fits"""
+    max_bytes = LLM_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+    ttl = LLM_CACHE_TTL if ttl is None else ttl
+    if not LLM_CACHE_DIR.exists():
+        return 0
+
+    now = time.time()
+    entries = []
+    removed = 0
+    for path in LLM_CACHE_DIR.glob("*/*.json"):
+        try:
+            stat = path.stat()
+            # Idle for longer than the TTL (hits refresh the mtime)
+            if now - stat.st_mtime >= ttl:
+                path.unlink()
+                removed += 1
+            else:
+                entries.append((stat.st_mtime, stat.st_size, path))
+        except FileNotFoundError:
+            continue  # Evicted by another worker
+
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            path.unlink()
+            removed += 1
+        except FileNotFoundError:
+            pass
+        total -= size
+
+    if removed:
+        logging.info(f"Evicted {removed} LLM cache entries")
+    return removed
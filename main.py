@@ -1,6 +1,8 @@
 import os
+import sys
+import time
 import random
-import requests
+import argparse
 import subprocess
 import logging
 import warnings
@@ -8,8 +10,18 @@ from dotenv import load_dotenv
 from datetime import datetime
 from pathlib import Path
 import openai
-import anthropic
-from generate_captions import transcribe_audio_to_srt, burn_captions
+from generate_captions import (
+    generate_captions_srt, burn_captions, get_whisper_model, write_ass, ass_filter,
+    CAPTION_MODE, ALIGN_MODEL_SIZE, CAPTION_STYLE
+)
+from media_probe import probe_media, get_media_duration
+from llm_cache import cached_completion
+from tts_chunks import synthesize_speech, TTS_FORMAT
+from script_backlog import (
+    clean_generated_script, script_prompt, take_script,
+    SCRIPT_MODEL, SCRIPT_SYSTEM_PROMPT, SCRIPT_TEMPERATURE, SCRIPT_MAX_TOKENS
+)
+from render_profiles import video_encode_args, get_render_profile, RENDER_PROFILE, RENDER_PROFILES
 
 # Suppress pydub warnings since we know FFmpeg works
 warnings.filterwarnings("ignore", message="Couldn't find ffmpeg or avconv")
@@ -22,6 +34,9 @@ ANTHROPIC_API_KEY = os.getenv("ANTHROPIC_API_KEY")
 PEXELS_API_KEY = os.getenv("PEXELS_API_KEY")
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 
+TTS_MODEL = "tts-1-hd"
+TTS_VOICE = "onyx"
+
 def configure_ffmpeg_for_pydub():
     """Configure FFmpeg for pydub using known working path"""
     # We know from your test that this path works
@@ -63,111 +78,155 @@ logging.basicConfig(
 def get_random_topic():
     """Get a topic with enhanced variety tracking"""
     # Import the variety enhancer
-    from content_variety_enhancer import get_varied_topic, create_expanded_topics_file, auto_expand_topics
-    
-    # Ensure we have an expanded topics file
-    create_expanded_topics_file()
-    
-    # 10% chance to auto-generate new topics
-    if random.random() < 0.1:
-        auto_expand_topics()
+    from content_variety_enhancer import get_varied_topic, expand_topic_bank
     
+    expand_topic_bank()
     return get_varied_topic()
 
-def generate_script_with_claude(topic):
-    """Generate a clean philosophical script without any meta-instructions"""
-    client = anthropic.Anthropic(api_key=ANTHROPIC_API_KEY)
-    
-    # Much cleaner prompt that focuses on content, not delivery
-    prompt = f"""Write a philosophical monologue about "{topic}" in the style of Alan Watts or Terence McKenna. 
-
-Create a 60-90 second spoken piece that:
-- Starts with an intriguing hook or question
-- Explores the topic with poetic, mystical language
-- Uses metaphors and profound insights
-- Ends with a thought-provoking conclusion
-- Flows naturally as spoken word
+# Shared API clients - built once per process and reused across batch jobs
+# (the Anthropic client lives in llm_cache.py)
+_CLIENTS = {}
 
-Write ONLY the monologue content itself - no stage directions, no speaking instructions, no meta-commentary. Just the pure philosophical content as it should be spoken."""
+def get_openai_client():
+    """Get the shared OpenAI client, creating it on first use"""
+    if "openai" not in _CLIENTS:
+        _CLIENTS["openai"] = openai.OpenAI(api_key=OPENAI_API_KEY)
+    return _CLIENTS["openai"]
 
-    response = client.messages.create(
-        model="claude-3-5-sonnet-20241022",
-        max_tokens=600,
-        temperature=1.0,
-        system="You are a philosophical content writer. Generate only the spoken content, no instructions or directions.",
-        messages=[{"role": "user", "content": prompt}]
+def generate_script_with_claude(topic, slot=None):
+    """Generate a clean philosophical script without any meta-instructions
+    
+    `slot` picks the cached sample: a rerun of the same job reuses its script.
+    """
+    script = cached_completion(
+        model=SCRIPT_MODEL,
+        system=SCRIPT_SYSTEM_PROMPT,
+        prompt=script_prompt(topic),
+        temperature=SCRIPT_TEMPERATURE,
+        max_tokens=SCRIPT_MAX_TOKENS,
+        slot=slot
     )
     
     # Clean up the response to remove any meta-instructions that might slip through
-    script = response.content[0].text.strip()
-    
-    # Remove common meta-instruction patterns
-    meta_patterns = [
-        r"\[.*?\]",  # Remove [instructions in brackets]
-        r"\(.*speaking.*\)",  # Remove (speaking instructions)
-        r"\(.*tone.*\)",  # Remove (tone instructions)
-        r"\(.*voice.*\)",  # Remove (voice instructions)
-        r"speaking in.*",  # Remove "speaking in a X manner"
-        r".*contemplative tone.*",  # Remove tone descriptions
-        r".*deliberate.*tone.*",  # Remove deliberate tone mentions
-    ]
-    
-    import re
-    for pattern in meta_patterns:
-        script = re.sub(pattern, "", script, flags=re.IGNORECASE)
-    
-    # Clean up extra whitespace and line breaks
-    script = re.sub(r'\s+', ' ', script).strip()
-    
-    # Remove any sentences that start with meta-instructions
-    sentences = script.split('.')
-    clean_sentences = []
-    
-    for sentence in sentences:
-        sentence = sentence.strip()
-        if sentence and not any(word in sentence.lower() for word in [
-            'speaking', 'voice', 'tone', 'delivery', 'manner', 'contemplative',
-            'deliberate', 'pause', 'emphasis', 'inflection'
-        ]):
-            clean_sentences.append(sentence)
-    
-    # Reconstruct the script
-    clean_script = '. '.join(clean_sentences)
-    if clean_script and not clean_script.endswith('.'):
-        clean_script += '.'
-    
-    return clean_script
+    return clean_generated_script(script)
 
 def synthesize_audio(text, output_path):
-    """Generate speech using OpenAI TTS with dreamy male voice"""
-    client = openai.OpenAI(api_key=OPENAI_API_KEY)
+    """Generate speech using OpenAI TTS with dreamy male voice (lossless WAV)"""
+    client = get_openai_client()
     
     try:
-        response = client.audio.speech.create(
-            model="tts-1-hd",
-            voice="onyx",
-            input=text,
-            response_format="mp3"
-        )
-        
-        with open(output_path, "wb") as f:
-            f.write(response.content)
+        # Sentence chunks in parallel, cached per chunk (see tts_chunks.py)
+        chunks, synthesized = synthesize_speech(client, text, output_path, voice=TTS_VOICE, model=TTS_MODEL)
         
-        logging.info(f"Audio generated with OpenAI TTS (onyx voice): {output_path}")
+        logging.info(
+            f"Audio generated with OpenAI TTS ({TTS_VOICE} voice): {output_path} "
+            f"({synthesized}/{chunks} chunks synthesized, the rest cached)"
+        )
         
     except Exception as e:
         logging.error(f"Failed to generate audio with OpenAI TTS: {e}")
         raise
 
 def get_audio_duration(audio_path):
-    """Get the exact duration of an audio file in seconds"""
+    """Get the exact duration of an audio file in seconds (from cached header probe)"""
+    return get_media_duration(audio_path)
+
+# Final audio codec - the ffmpeg mix encodes this once and later steps copy it
+AUDIO_BITRATE = "192k"
+
+# Duck the music a little further whenever the voice is speaking
+MUSIC_DUCKING = os.getenv("MUSIC_DUCKING", "1") != "0"
+
+def audio_codec_args(audio_path):
+    """Copy audio that's already AAC, encode anything else to AAC"""
+    if Path(audio_path).suffix.lower() in (".m4a", ".aac"):
+        return ["-c:a", "copy"]
+    return ["-c:a", "aac", "-b:a", AUDIO_BITRATE]
+
+def get_audio_sample_rate(audio_path):
+    """Read the sample rate of the first audio stream (from cached header probe)"""
+    return probe_media(audio_path)["sample_rate"]
+
+def build_music_input(voice_audio_path, bg_music_path):
+    """ffmpeg input args for the background track, preferring the decoded PCM cache"""
     try:
-        audio = AudioSegment.from_file(audio_path)
-        duration_seconds = len(audio) / 1000.0  # Convert from ms to seconds
-        return duration_seconds
+        from music_cache import sync_music_cache, CACHE_DIR
+        
+        cached_tracks = sync_music_cache(get_audio_sample_rate(voice_audio_path))
+        entry = next(e for e in cached_tracks.values() if e["source"] == bg_music_path.name)
+        
+        pcm_input = [
+            "-f", "s16le", "-ar", str(entry["sample_rate"]), "-ac", str(entry["channels"]),
+            "-stream_loop", "-1", "-i", str(CACHE_DIR / entry["pcm_file"])
+        ]
+        # The cached PCM is already attenuated
+        return pcm_input, "anull"
+    
     except Exception as e:
-        logging.error(f"Failed to get audio duration: {e}")
+        logging.warning(f"Music cache unavailable, decoding {bg_music_path} in ffmpeg: {e}")
+        return ["-stream_loop", "-1", "-i", str(bg_music_path)], "volume=-20dB"
+
+def mix_audio_to_aac(voice_audio_path, output_path):
+    """Loop, duck and mix the music under the voice and encode AAC in one ffmpeg run"""
+    from music_cache import get_music_tracks
+    
+    music_files = get_music_tracks()
+    
+    cmd = ["ffmpeg", "-y", "-i", str(voice_audio_path)]
+    
+    if music_files:
+        bg_music_path = random.choice(music_files)
+        logging.info(f"Using background music: {bg_music_path}")
+        print(f"🎵 Mixing background music: {bg_music_path.name}")
+        
+        music_input, music_gain = build_music_input(voice_audio_path, bg_music_path)
+        cmd += music_input
+        
+        if MUSIC_DUCKING:
+            # The voice keys a compressor on the music, then both are summed
+            audio_graph = (
+                "[0:a]asplit=2[voice][key];"
+                f"[1:a]{music_gain}[music];"
+                "[music][key]sidechaincompress=threshold=0.05:ratio=4:attack=20:release=400[ducked];"
+                "[voice][ducked]amix=inputs=2:duration=first:dropout_transition=0:normalize=0[out]"
+            )
+        else:
+            audio_graph = (
+                f"[1:a]{music_gain}[music];"
+                "[0:a][music]amix=inputs=2:duration=first:dropout_transition=0:normalize=0[out]"
+            )
+        cmd += ["-filter_complex", audio_graph, "-map", "[out]"]
+    else:
+        logging.info("No background music found, using voice only")
+        cmd += ["-map", "0:a:0"]
+    
+    cmd += [
+        "-c:a", "aac", "-b:a", AUDIO_BITRATE,
+        "-progress", "pipe:1", "-nostats",
+        str(output_path)
+    ]
+    
+    try:
+        result = subprocess.run(cmd, check=True, capture_output=True, text=True, timeout=300)
+    except (subprocess.CalledProcessError, subprocess.TimeoutExpired) as e:
+        logging.error(f"FFmpeg audio mix failed: {e}")
+        logging.error(f"FFmpeg stderr: {getattr(e, 'stderr', '')}")
         return None
+    
+    final_duration = parse_progress_duration(result.stdout)
+    logging.info(f"Mixed audio saved to: {output_path}, duration: {final_duration:.2f}s")
+    print(f"🎵 Final mixed audio duration: {final_duration:.2f} seconds")
+    
+    return final_duration
+
+def parse_progress_duration(progress_output):
+    """Read the output duration from ffmpeg's -progress report"""
+    duration = 0.0
+    for line in progress_output.splitlines():
+        key, _, value = line.partition("=")
+        if key == "out_time_us" and value.strip().lstrip("-").isdigit():
+            duration = max(duration, int(value) / 1_000_000)
+    return duration
 
 def add_background_music(voice_audio_path, output_path):
     """Mix background music with the voice audio - ensuring perfect sync"""
@@ -196,6 +255,32 @@ def add_background_music(voice_audio_path, output_path):
     bg_music_path = random.choice(music_files)
     logging.info(f"Using background music: {bg_music_path}")
     
+    try:
+        # Fast path: mix against the pre-decoded, pre-attenuated track
+        from music_cache import sync_music_cache, mix_voice_with_music
+        
+        voice = AudioSegment.from_file(voice_audio_path)
+        cached_tracks = sync_music_cache(voice.frame_rate)
+        entry = next(e for e in cached_tracks.values() if e["source"] == bg_music_path.name)
+        
+        print(f"🎙️ Voice duration: {len(voice)/1000:.2f} seconds")
+        print(f"🎵 Background music duration: {entry['frames'] / entry['sample_rate']:.2f} seconds")
+        
+        combined, loops = mix_voice_with_music(voice, entry)
+        if loops > 1:
+            print(f"🔄 Wrapped background music {loops:.1f} times")
+        
+        combined.export(output_path, format="mp3")
+        
+        final_duration = len(combined) / 1000.0
+        logging.info(f"Mixed audio saved to: {output_path}, duration: {final_duration:.2f}s")
+        print(f"🎵 Final mixed audio duration: {final_duration:.2f} seconds")
+        
+        return final_duration
+        
+    except Exception as e:
+        logging.warning(f"Cached music mix failed, decoding track directly: {e}")
+    
     try:
         # Load audio files
         bg_music = AudioSegment.from_file(bg_music_path)
@@ -241,82 +326,50 @@ def add_background_music(voice_audio_path, output_path):
             shutil.copy2(voice_audio_path, output_path)
             return get_audio_duration(output_path)
 
-def download_trippy_video(output_path):
-    """Download background video with enhanced variety"""
+def download_trippy_video(output_path, min_duration=None):
+    """Download background video with enhanced variety; returns its clip cache entry"""
     from content_variety_enhancer import get_varied_background_search
+    from clip_cache import lookup_search, fetch_clip, copy_cached_clip
+    from clip_prefetch import take_pooled_clip
     
-    headers = {"Authorization": PEXELS_API_KEY}
+    # A clip the prefetcher has already made ready is served in milliseconds
+    pooled = take_pooled_clip(min_duration)
+    if pooled:
+        copy_cached_clip(pooled, output_path)
+        logging.info(f"Background video from prefetch pool ('{pooled['search_term']}'): {pooled['path']}")
+        print(f"⚡ Using prefetched {pooled['search_term']} video (original duration: {pooled['duration']}s)")
+        return pooled
     
     # Use the enhanced variety system for search terms
     search_term = get_varied_background_search()
     
-    url = f"https://api.pexels.com/videos/search?query={search_term}&orientation=portrait&per_page=20"
-
-    print(f"🎬 Searching for: {search_term}")
-    
-    response = requests.get(url, headers=headers)
-    data = response.json()
-    
-    if not data["videos"]:
-        # Fallback to basic search terms if specific search fails
-        fallback_terms = ["abstract", "nature", "cosmic", "flowing", "peaceful"]
-        search_term = random.choice(fallback_terms)
-        url = f"https://api.pexels.com/videos/search?query={search_term}&orientation=portrait&per_page=20"
-        response = requests.get(url, headers=headers)
-        data = response.json()
-        
-        if not data["videos"]:
-            raise Exception(f"No videos found even with fallback terms")
-
-    # Get the first available video (we'll loop it to match audio length)
-    video = data["videos"][0]
-    video_files = video["video_files"]
-    
-    # Prefer HD quality
-    best_video = None
-    for vf in video_files:
-        if vf.get("quality") == "hd":
-            best_video = vf
-            break
-    
-    if not best_video:
-        best_video = video_files[0]
-    
-    video_url = best_video["link"]
-    video_duration = video.get("duration", 0)
+    # A term we've downloaded for before is served straight from the clip cache
+    cached = lookup_search(search_term, min_duration)
+    if cached:
+        copy_cached_clip(cached, output_path)
+        logging.info(f"Background video cache hit for '{search_term}': {cached['path']}")
+        print(f"⚡ Using cached {search_term} video (original duration: {cached['duration']}s)")
+        return cached
     
-    logging.info(f"Downloading video: {search_term} from {video_url}")
-    print(f"🎬 Downloading {search_term} video (original duration: {video_duration}s)")
+    # Search Pexels and download (or reuse) the best matching clip
+    clip = fetch_clip(search_term, min_duration)
+    copy_cached_clip(clip, output_path)
     
-    r = requests.get(video_url)
-    r.raise_for_status()
-    
-    with open(output_path, "wb") as f:
-        f.write(r.content)
-    
-    return video_duration
+    return clip
 
 def get_video_duration(video_path):
-    """Get the exact duration of a video file"""
-    try:
-        cmd = [
-            "ffprobe", "-v", "quiet", "-print_format", "json", 
-            "-show_format", str(video_path)
-        ]
-        result = subprocess.run(cmd, capture_output=True, text=True, check=True)
-        
-        import json
-        info = json.loads(result.stdout)
-        duration = float(info["format"]["duration"])
-        return duration
-        
-    except Exception as e:
-        logging.error(f"Failed to get video duration: {e}")
-        return None
+    """Get the exact duration of a video file (from cached header probe)"""
+    return get_media_duration(video_path)
 
-def extend_video_to_match_audio(video_path, audio_duration, output_path):
-    """Loop/extend video to match audio duration exactly"""
+def extend_video_to_match_audio(video_path, audio_duration, output_path, normalized=False):
+    """Loop/extend video to match audio duration exactly
     
+    Only a normalized mezzanine (see clip_cache.py) can be cut with stream copy;
+    a clip cached as-is is re-encoded to the mezzanine on the way through.
+    """
+    from clip_cache import mezzanine_encode_args
+    
+    codec_args = ["-c", "copy"] if normalized else mezzanine_encode_args()
     original_duration = get_video_duration(video_path)
     
     if not original_duration:
@@ -333,7 +386,7 @@ def extend_video_to_match_audio(video_path, audio_duration, output_path):
             "ffmpeg", "-y",
             "-i", str(video_path),
             "-t", str(audio_duration),  # Trim to exact audio duration
-            "-c", "copy",  # Copy without re-encoding for speed
+            *codec_args,  # Copying a mezzanine is frame-accurate (one-second closed GOPs)
             str(output_path)
         ]
     else:
@@ -354,7 +407,7 @@ def extend_video_to_match_audio(video_path, audio_duration, output_path):
             "-safe", "0",
             "-i", str(concat_file),
             "-t", str(audio_duration),  # Trim to exact audio duration
-            "-c", "copy",
+            *codec_args,
             str(output_path)
         ]
     
@@ -394,9 +447,10 @@ def merge_audio_video(audio_path, video_path, output_path):
         "-i", str(video_path),
         "-i", str(audio_path),
         "-c:v", "copy",  # Copy video stream
-        "-c:a", "aac",   # Re-encode audio
+        *audio_codec_args(audio_path),  # Audio is already AAC when mixed by ffmpeg
         "-map", "0:v:0",  # Use video from first input
         "-map", "1:a:0",  # Use audio from second input
+        "-movflags", "+faststart",
         str(output_path)
     ]
     
@@ -417,24 +471,112 @@ def merge_audio_video(audio_path, video_path, output_path):
         print(f"❌ Audio/video merge failed: {e}")
         return False
 
+def render_final_video(video_path, audio_path, srt_path, audio_duration, output_path, render_profile=None):
+    """Loop, trim, mux and burn captions in a single ffmpeg decode/encode pass"""
+    
+    original_duration = get_video_duration(video_path)
+    
+    if not original_duration:
+        print("❌ Could not determine video duration")
+        return False
+    
+    print(f"🎥 Original video duration: {original_duration:.2f} seconds")
+    print(f"🎙️ Target audio duration: {audio_duration:.2f} seconds")
+    
+    if original_duration >= audio_duration:
+        print(f"✂️ Video is long enough, trimming to {audio_duration:.2f} seconds")
+    else:
+        loops_needed = int(audio_duration / original_duration) + 1
+        print(f"🔄 Video too short, looping {loops_needed} times in-stream")
+    
+    # One filtergraph: trim the looped clip to the audio length, then burn the styled captions
+    ass_path = Path(output_path).with_suffix(".ass")
+    write_ass(srt_path, ass_path)
+    video_filter = (
+        f"[0:v]trim=duration={audio_duration:.3f},setpts=PTS-STARTPTS,"
+        f"{ass_filter(ass_path)}[v]"
+    )
+    
+    cmd = [
+        "ffmpeg", "-y",
+        "-stream_loop", "-1", "-i", str(video_path),  # Loop the clip endlessly...
+        "-i", str(audio_path),
+        "-filter_complex", video_filter,
+        "-map", "[v]",
+        "-map", "1:a:0",
+        *video_encode_args(render_profile),
+        *audio_codec_args(audio_path),
+        "-t", f"{audio_duration:.3f}",  # ...and stop at the exact audio duration
+        str(output_path)
+    ]
+    
+    print("🎬 Rendering video, audio and captions in one pass...")
+    
+    try:
+        subprocess.run(cmd, check=True, capture_output=True, text=True, timeout=600)
+    except subprocess.CalledProcessError as e:
+        logging.error(f"Single-pass render failed: {e}")
+        logging.error(f"FFmpeg stderr: {e.stderr}")
+        print(f"❌ Single-pass render failed: {e}")
+        return False
+    except subprocess.TimeoutExpired as e:
+        logging.error(f"Single-pass render timed out: {e}")
+        print("❌ Single-pass render timed out")
+        return False
+    finally:
+        if ass_path.exists():
+            ass_path.unlink()
+    
+    logging.info(f"Rendered final video in one pass: {output_path}")
+    
+    # Verify the result
+    final_duration = get_video_duration(output_path)
+    if final_duration:
+        print(f"✅ Final video duration: {final_duration:.2f} seconds")
+        if abs(final_duration - audio_duration) < 1.0:  # Within 1 second is good
+            print(f"🎯 Video duration matches audio!")
+        else:
+            print(f"⚠️ Duration mismatch: {abs(final_duration - audio_duration):.2f}s difference")
+    
+    return True
+
+def render_with_legacy_steps(video_path, audio_path, srt_path, audio_duration, output_path, timestamp,
+                             render_profile=None, normalized=False):
+    """Fallback render: extend, merge and burn as separate ffmpeg passes"""
+    
+    # Extend video to match audio duration
+    extended_video_path = VIDEO_DIR / f"{timestamp}_extended.mp4"
+    print("\n🔄 Extending video to match audio length...")
+    
+    if extend_video_to_match_audio(video_path, audio_duration, extended_video_path, normalized=normalized):
+        print("✅ Video extended successfully")
+        video_to_use = extended_video_path
+    else:
+        print("⚠️ Video extension failed, using original")
+        video_to_use = video_path
+
+    # Merge audio and video with perfect sync
+    merged_path = FINAL_DIR / f"{timestamp}_final.mp4"
+    if merge_audio_video(str(audio_path), str(video_to_use), str(merged_path)):
+        logging.info(f"Audio and video merged: {merged_path}")
+        print("🎥 Audio and video merged successfully")
+    else:
+        raise Exception("Failed to merge audio and video")
+
+    # Burn captions into video
+    burn_captions(merged_path, srt_path, output_path, render_profile=render_profile)
+
 def create_upload_instructions(video_path, topic, script, timestamp):
     """Create instructions for manual upload with dynamic captions"""
-    from dynamic_captions_hashtags import (
-        create_tiktok_caption, 
-        create_youtube_title_and_description,
-        save_caption_hashtag_usage
-    )
+    from dynamic_captions_hashtags import pick_tiktok_caption, create_youtube_title_and_description
     
     instructions_file = UPLOAD_QUEUE_DIR / f"{timestamp}_upload_instructions.txt"
     
     # Generate dynamic content
-    tiktok_caption = create_tiktok_caption(topic)
+    # Picked and tracked in one step so parallel workers get different hashtag combos
+    tiktok_caption = pick_tiktok_caption(topic)
     youtube_title, youtube_description = create_youtube_title_and_description(topic)
     
-    # Track usage for variety
-    hashtags_used = [tag for tag in tiktok_caption.split() if tag.startswith('#')]
-    save_caption_hashtag_usage(tiktok_caption, hashtags_used)
-    
     # Get video duration for reference
     video_duration = get_video_duration(video_path)
     duration_info = f" ({video_duration:.1f} seconds)" if video_duration else ""
@@ -524,126 +666,407 @@ def prepare_for_upload(video_path, topic, script, timestamp):
     
     return upload_video_path, instructions_file
 
-def main():
-    try:
-        # Configure FFmpeg for pydub
-        configure_ffmpeg_for_pydub()
-        
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        logging.info("Starting video generation pipeline")
+# The background clip is fetched before the voice exists, so prefer clips
+# that cover the longest script we ask Claude for
+ESTIMATED_AUDIO_SECONDS = 90
+
+# Threads for running independent pipeline stages side by side
+PIPELINE_WORKERS = int(os.getenv("PIPELINE_WORKERS", "4"))
+
+def run_pipeline(timestamp, render_profile=None):
+    """Run one full video job and return a summary of what was produced
+    
+    Stages run as a dependency graph: the background video download and the
+    Whisper warm-up overlap with script, voice and music generation. Each
+    stage is recorded in the run's manifest, so running the same job again
+    (e.g. `--resume <run_id>`) skips every stage that's still valid.
+    `render_profile` names the x264 settings for the final encode.
+    """
+    from stage_cache import load_manifest, save_manifest, run_stage, hash_inputs, atomic_output
+    from stage_dag import run_dag, format_timeline
+    from pipeline_profiler import profiled_stage, is_profiling
+    
+    logging.info(f"Starting video generation pipeline (job {timestamp})")
+    
+    print("🧠 Esoteric Content Generator Starting...")
+    print("=" * 50)
+    
+    render_profile = render_profile or RENDER_PROFILE
+    
+    manifest = load_manifest(timestamp)
+    if manifest["stages"]:
+        print(f"♻️ Resuming run {timestamp} ({len(manifest['stages'])} stages recorded)")
+
+    # Load Whisper while network-bound stages are waiting
+    def whisper_stage(r):
+        get_whisper_model(ALIGN_MODEL_SIZE if CAPTION_MODE == "align" else "base")
+
+    # Step 1: Get topic and generate script
+    def pick_topic_and_script():
+        from content_variety_enhancer import expand_topic_bank
         
-        print("🧠 Esoteric Content Generator Starting...")
-        print("=" * 50)
+        # A script generated ahead of time brings its topic with it, but the
+        # topic bank still has to keep growing
+        queued = take_script()
+        if queued:
+            expand_topic_bank()
+            return {"topic": queued["topic"], "queued_script": queued["script"]}
+        return {"topic": get_random_topic()}
 
-        # Step 1: Get topic and generate script
-        topic = get_random_topic()
+    def topic_stage(r):
+        topic = run_stage(manifest, "topic", hash_inputs("topic", timestamp), pick_topic_and_script)["topic"]
         logging.info(f"Topic selected: {topic}")
         print(f"📝 Topic: {topic}")
+        return topic
+
+    def script_stage(r):
+        def produce():
+            script_path = SCRIPT_DIR / f"{timestamp}.txt"
+            queued_script = manifest["stages"]["topic"]["values"].get("queued_script")
+            with atomic_output(script_path) as temp_path:
+                temp_path.write_text(
+                    queued_script or generate_script_with_claude(r["topic"], slot=timestamp), encoding="utf-8"
+                )
+            logging.info(f"Script saved to: {script_path}")
+            print("📚 Script taken from the backlog" if queued_script else "✅ Clean script generated with Claude")
+            return {"script_path": script_path}
+        
+        script_path = Path(run_stage(
+            manifest, "script", hash_inputs("script", r["topic"]), produce, files=["script_path"]
+        )["script_path"])
+        return script_path.read_text(encoding="utf-8")
+
+    # Step 2: Generate voice audio with OpenAI TTS
+    def voice_stage(r):
+        def produce():
+            audio_path = AUDIO_DIR / f"{timestamp}.wav"
+            with atomic_output(audio_path) as temp_path:
+                synthesize_audio(r["script"], temp_path)
+            duration = get_audio_duration(audio_path)
+            logging.info(f"Voice audio generated: {audio_path}, duration: {duration:.2f}s")
+            print(f"🎙️ Voice generated with OpenAI TTS ({TTS_VOICE}) - {duration:.2f}s")
+            return {"audio_path": audio_path, "duration": duration}
+        
+        voice = run_stage(
+            manifest, "voice", hash_inputs("voice", r["script"], TTS_MODEL, TTS_VOICE, TTS_FORMAT), produce,
+            files=["audio_path"]
+        )
+        return Path(voice["audio_path"])
+
+    # Step 3: Add background music and get final audio duration
+    def mix_stage(r):
+        audio_path = r["voice"]
+        
+        def produce():
+            combined_audio_path = AUDIO_DIR / f"{timestamp}_with_music.m4a"
+            try:
+                with atomic_output(combined_audio_path) as temp_path:
+                    duration = mix_audio_to_aac(audio_path, temp_path)
+                    if not duration:
+                        raise RuntimeError("ffmpeg audio mix failed")
+            except RuntimeError:
+                print("⚠️ FFmpeg audio mix failed, mixing in Python instead")
+                combined_audio_path = AUDIO_DIR / f"{timestamp}_with_music.mp3"
+                with atomic_output(combined_audio_path) as temp_path:
+                    duration = add_background_music(audio_path, temp_path)
+            
+            return {"combined_audio_path": combined_audio_path, "duration": duration}
+        
+        mix = run_stage(
+            manifest, "mix", hash_inputs("mix", audio_path, MUSIC_DUCKING), produce,
+            files=["combined_audio_path"]
+        )
+        return Path(mix["combined_audio_path"]), mix["duration"]
 
-        script = generate_script_with_claude(topic)
-        script_path = SCRIPT_DIR / f"{timestamp}.txt"
-        script_path.write_text(script, encoding="utf-8")
-        logging.info(f"Script generated and saved to: {script_path}")
-        print("✅ Clean script generated with Claude")
-
-        # Step 2: Generate voice audio with OpenAI TTS
-        audio_path = AUDIO_DIR / f"{timestamp}.mp3"
-        synthesize_audio(script, audio_path)
-        base_audio_duration = get_audio_duration(audio_path)
-        logging.info(f"Voice audio generated: {audio_path}, duration: {base_audio_duration:.2f}s")
-        print(f"🎙️ Voice generated with OpenAI TTS (onyx) - {base_audio_duration:.2f}s")
-
-        # Step 3: Add background music and get final audio duration
-        combined_audio_path = AUDIO_DIR / f"{timestamp}_with_music.mp3"
-        final_audio_duration = add_background_music(audio_path, combined_audio_path)
-
-        # Step 4: Download background video
-        video_path = VIDEO_DIR / f"{timestamp}.mp4"
-        original_video_duration = download_trippy_video(video_path)
-        logging.info(f"Background video downloaded: {video_path}")
-
-        # Step 5: Extend video to match audio duration
-        extended_video_path = VIDEO_DIR / f"{timestamp}_extended.mp4"
-        print("\n🔄 Extending video to match audio length...")
-        
-        if extend_video_to_match_audio(video_path, final_audio_duration, extended_video_path):
-            print("✅ Video extended successfully")
-            video_to_use = extended_video_path
+    # Step 4: Download background video (needs nothing else, so it starts right away)
+    def clip_stage(r):
+        def produce():
+            video_path = VIDEO_DIR / f"{timestamp}.mp4"
+            with atomic_output(video_path) as temp_path:
+                clip = download_trippy_video(temp_path, min_duration=ESTIMATED_AUDIO_SECONDS)
+            logging.info(f"Background video downloaded: {video_path}")
+            return {
+                "video_path": video_path,
+                "duration": clip["duration"],
+                # Clips cached before normalization existed count as raw originals
+                "normalized": bool(clip.get("normalized")),
+            }
+        
+        clip = run_stage(manifest, "clip", hash_inputs("clip", timestamp), produce, files=["video_path"])
+        return Path(clip["video_path"]), clip.get("normalized", False)
+
+    # Step 5: Time the script against the voice track (free transcription as fallback)
+    def srt_stage(r):
+        audio_path = r["voice"]
+        combined_audio_path, _ = r["mix"]
+        
+        def produce():
+            srt_path = FINAL_DIR / f"{timestamp}.srt"
+            with atomic_output(srt_path) as temp_path:
+                caption_mode = generate_captions_srt(
+                    audio_path, r["script"], temp_path, fallback_audio_path=combined_audio_path
+                )
+            logging.info(f"Captions generated ({caption_mode}): {srt_path}")
+            print(f"📝 Captions generated with Whisper ({caption_mode})")
+            return {"srt_path": srt_path, "caption_mode": caption_mode}
+        
+        return Path(run_stage(
+            manifest, "srt",
+            hash_inputs("srt", audio_path, combined_audio_path, r["script"], CAPTION_MODE, ALIGN_MODEL_SIZE),
+            produce, files=["srt_path"]
+        )["srt_path"])
+
+    # Step 6: Loop video to the audio length, mux audio and burn captions in one pass
+    def captioned_stage(r):
+        video_path, normalized = r["clip"]
+        combined_audio_path, final_audio_duration = r["mix"]
+        srt_path = r["srt"]
+        
+        def produce():
+            captioned_path = FINAL_DIR / f"{timestamp}_captioned.mp4"
+            print(f"\n🎬 Rendering final video ({render_profile} profile)...")
+            
+            with atomic_output(captioned_path) as temp_path:
+                if render_final_video(video_path, combined_audio_path, srt_path, final_audio_duration, temp_path,
+                                      render_profile=render_profile):
+                    print("🔥 Video rendered with burned-in captions")
+                else:
+                    print("⚠️ Single-pass render failed, falling back to step-by-step rendering")
+                    render_with_legacy_steps(
+                        video_path, combined_audio_path, srt_path, final_audio_duration, temp_path, timestamp,
+                        render_profile=render_profile, normalized=normalized
+                    )
+            logging.info(f"Captions burned into video: {captioned_path}")
+            return {"captioned_path": captioned_path}
+        
+        return Path(run_stage(
+            manifest, "captioned",
+            hash_inputs(
+                "captioned", video_path, combined_audio_path, srt_path, CAPTION_STYLE,
+                get_render_profile(render_profile)
+            ),
+            produce, files=["captioned_path"]
+        )["captioned_path"])
+
+    # Step 7: Prepare for manual upload with dynamic captions
+    def upload_stage(r):
+        def produce():
+            print("\n📤 Preparing for manual upload with dynamic captions...")
+            upload_video_path, instructions_file = prepare_for_upload(
+                r["captioned"], r["topic"], r["script"], timestamp
+            )
+            return {"upload_video_path": upload_video_path, "instructions_file": instructions_file}
+        
+        upload = run_stage(
+            manifest, "upload", hash_inputs("upload", r["captioned"], r["topic"]), produce,
+            files=["upload_video_path", "instructions_file"]
+        )
+        return Path(upload["upload_video_path"]), Path(upload["instructions_file"])
+
+    stages = {
+        "whisper": ([], whisper_stage),
+        "topic": ([], topic_stage),
+        "clip": ([], clip_stage),
+        "script": (["topic"], script_stage),
+        "voice": (["script"], voice_stage),
+        "mix": (["voice"], mix_stage),
+        "srt": (["voice", "mix", "script", "whisper"], srt_stage),
+        "captioned": (["clip", "mix", "srt"], captioned_stage),
+        "upload": (["captioned", "topic", "script"], upload_stage),
+    }
+    
+    # cProfile can only watch one thread at a time, so --pstats runs stages serially
+    if is_profiling():
+        stages = {name: (deps, profiled_stage(name, func)) for name, (deps, func) in stages.items()}
+    workers = 1 if is_profiling(with_pstats=True) else PIPELINE_WORKERS
+    
+    try:
+        results, timeline = run_dag(stages, max_workers=workers)
+    except Exception as e:
+        if getattr(e, "timeline", None):
+            print("\n" + format_timeline(e.timeline))
+        raise
+    
+    topic = results["topic"]
+    script = results["script"]
+    _, final_audio_duration = results["mix"]
+    upload_video_path, instructions_file = results["upload"]
+    
+    manifest["completed"] = True
+    manifest["timeline"] = timeline
+    save_manifest(manifest)
+    
+    # Show what captions were generated
+    from dynamic_captions_hashtags import create_tiktok_caption, create_youtube_title_and_description
+    sample_tiktok = create_tiktok_caption(topic)
+    sample_yt_title, _ = create_youtube_title_and_description(topic)
+    print(f"📝 Generated TikTok caption preview: {sample_tiktok[:50]}...")
+    print(f"📺 Generated YouTube title: {sample_yt_title}")
+    
+    logging.info("Pipeline completed successfully")
+    print("\n" + "=" * 50)
+    print("🎉 CONTENT GENERATION COMPLETED!")
+    print("=" * 50)
+    print(f"📁 Video ready: {upload_video_path.name}")
+    print(f"📋 Instructions: {instructions_file.name}")
+    print(f"📊 Log file: {log_path}")
+    print("\n💡 NEXT STEPS:")
+    print("1. Check the 'ready_to_upload' folder")
+    print("2. Open the instructions file for upload details")
+    print("3. Upload to TikTok and YouTube when ready")
+    print("4. Captions are already burned into the video!")
+    print("5. Delete instructions file after uploading")
+    
+    # Show quick preview of what was created
+    final_video_duration = get_video_duration(upload_video_path)
+    print(f"\n🎬 CONTENT PREVIEW:")
+    print(f"Topic: {topic}")
+    print(f"Script length: {len(script)} characters")
+    print(f"Audio duration: {final_audio_duration:.2f} seconds")
+    print(f"Video duration: {final_video_duration:.2f} seconds" if final_video_duration else "Video duration: Unknown")
+    
+    if final_video_duration:
+        duration_diff = abs(final_video_duration - final_audio_duration)
+        if duration_diff < 1.0:
+            print(f"Sync status: ✅ Perfect (difference: {duration_diff:.2f}s)")
         else:
-            print("⚠️ Video extension failed, using original")
-            video_to_use = video_path
-
-        # Step 6: Merge audio and video with perfect sync
-        final_path = FINAL_DIR / f"{timestamp}_final.mp4"
-        if merge_audio_video(str(combined_audio_path), str(video_to_use), str(final_path)):
-            logging.info(f"Audio and video merged: {final_path}")
-            print("🎥 Audio and video merged successfully")
+            print(f"Sync status: ⚠️ Check ({duration_diff:.2f}s difference)")
+    
+    print(f"Has background music: {'Yes' if Path('assets').exists() and list(Path('assets').glob('*.mp3')) else 'No'}")
+    print(f"Captions: ✅ Burned-in professionally")
+    print(f"Content style: ✅ Dynamic captions and hashtags")
+    
+    print("\n" + format_timeline(timeline))
+
+    return {
+        "topic": topic,
+        "video": upload_video_path,
+        "instructions": instructions_file,
+        "duration": final_video_duration,
+    }
+
+def make_job_timestamp(job_number, count):
+    """Build a unique file prefix for a job - batch jobs get a numeric suffix"""
+    job_timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    if count > 1:
+        job_timestamp = f"{job_timestamp}_{job_number:02d}"
+    return job_timestamp
+
+def print_batch_summary(results):
+    """Show per-job success/failure for a batch run"""
+    succeeded = [r for r in results if r["ok"]]
+    
+    print("\n" + "=" * 50)
+    print(f"📦 BATCH SUMMARY: {len(succeeded)}/{len(results)} videos created")
+    print("=" * 50)
+    for r in results:
+        if r["ok"]:
+            print(f"✅ Job {r['job']} ({r['elapsed']:.0f}s): {r['video'].name}")
         else:
-            raise Exception("Failed to merge audio and video")
-
-        # Step 7: Generate and burn captions
-        srt_path = FINAL_DIR / f"{timestamp}.srt"
-        captioned_path = FINAL_DIR / f"{timestamp}_captioned.mp4"
-
-        # Transcribe audio to subtitles
-        transcribe_audio_to_srt(combined_audio_path, srt_path)
-        logging.info(f"Captions generated: {srt_path}")
-        print("📝 Captions generated with Whisper")
-
-        # Burn captions into video
-        burn_captions(final_path, srt_path, captioned_path)
-        logging.info(f"Captions burned into video: {captioned_path}")
-        print("🔥 Captions burned into video successfully")
-
-        # Step 8: Prepare for manual upload with dynamic captions
-        print("\n📤 Preparing for manual upload with dynamic captions...")
-        upload_video_path, instructions_file = prepare_for_upload(captioned_path, topic, script, timestamp)
-        
-        # Show what captions were generated
-        from dynamic_captions_hashtags import create_tiktok_caption, create_youtube_title_and_description
-        sample_tiktok = create_tiktok_caption(topic)
-        sample_yt_title, _ = create_youtube_title_and_description(topic)
-        print(f"📝 Generated TikTok caption preview: {sample_tiktok[:50]}...")
-        print(f"📺 Generated YouTube title: {sample_yt_title}")
-        
-        logging.info("Pipeline completed successfully")
-        print("\n" + "=" * 50)
-        print("🎉 CONTENT GENERATION COMPLETED!")
-        print("=" * 50)
-        print(f"📁 Video ready: {upload_video_path.name}")
-        print(f"📋 Instructions: {instructions_file.name}")
-        print(f"📊 Log file: {log_path}")
-        print("\n💡 NEXT STEPS:")
-        print("1. Check the 'ready_to_upload' folder")
-        print("2. Open the instructions file for upload details")
-        print("3. Upload to TikTok and YouTube when ready")
-        print("4. Captions are already burned into the video!")
-        print("5. Delete instructions file after uploading")
-        
-        # Show quick preview of what was created
-        final_video_duration = get_video_duration(upload_video_path)
-        print(f"\n🎬 CONTENT PREVIEW:")
-        print(f"Topic: {topic}")
-        print(f"Script length: {len(script)} characters")
-        print(f"Audio duration: {final_audio_duration:.2f} seconds")
-        print(f"Video duration: {final_video_duration:.2f} seconds" if final_video_duration else "Video duration: Unknown")
-        
-        if final_video_duration:
-            duration_diff = abs(final_video_duration - final_audio_duration)
-            if duration_diff < 1.0:
-                print(f"Sync status: ✅ Perfect (difference: {duration_diff:.2f}s)")
-            else:
-                print(f"Sync status: ⚠️ Check ({duration_diff:.2f}s difference)")
+            print(f"❌ Job {r['job']} ({r['elapsed']:.0f}s): {r['error']}")
+    print(f"📊 Log file: {log_path}")
+
+def main(count=1, resume=None, profile=False, with_pstats=False, render_profile=None):
+    """Run `count` pipeline jobs in this process, sharing clients and setup
+    
+    With `resume`, the first job continues that run id instead of starting fresh.
+    With `profile`, every job writes a per-stage trace and prints a summary table.
+    `render_profile` picks the encode settings for every job (see render_profiles.py).
+    """
+    from pipeline_profiler import start_profiling, stop_profiling
+    
+    # Configure FFmpeg for pydub (once per process)
+    configure_ffmpeg_for_pydub()
+    
+    # Batches keep the background clip pool and script backlog topped up while jobs render
+    if count > 1:
+        from clip_prefetch import start_prefetcher, POOL_SIZE
+        from script_backlog import start_backlog_filler, BACKLOG_SIZE
+        if POOL_SIZE > 0:
+            start_prefetcher()
+        if BACKLOG_SIZE > 0:
+            start_backlog_filler()
+    
+    results = []
+    for job_number in range(1, count + 1):
+        if count > 1:
+            print(f"\n📦 Batch job {job_number}/{count}")
+        
+        if resume and job_number == 1:
+            job_timestamp = resume
+        else:
+            job_timestamp = make_job_timestamp(job_number, count)
+        started = time.monotonic()
+        if profile or with_pstats:
+            start_profiling(job_timestamp, with_pstats=with_pstats)
         
-        print(f"Has background music: {'Yes' if Path('assets').exists() and list(Path('assets').glob('*.mp3')) else 'No'}")
-        print(f"Captions: ✅ Burned-in professionally")
-        print(f"Content style: ✅ Dynamic captions and hashtags")
+        try:
+            summary = run_pipeline(job_timestamp, render_profile=render_profile)
+            results.append({
+                "job": job_number,
+                "ok": True,
+                "video": summary["video"],
+                "elapsed": time.monotonic() - started,
+            })
+        except Exception as e:
+            # One failed job must not stop the rest of the batch
+            logging.error(f"Error in main pipeline (job {job_timestamp}): {e}")
+            print(f"\n❌ Error: {e}")
+            print("📋 Check the logs for more details.")
+            print(f"📊 Log file: {log_path}")
+            results.append({
+                "job": job_number,
+                "ok": False,
+                "error": str(e),
+                "elapsed": time.monotonic() - started,
+            })
+        finally:
+            stop_profiling()
+    
+    if count > 1:
+        print_batch_summary(results)
+    
+    return results
 
-    except Exception as e:
-        logging.error(f"Error in main pipeline: {e}")
-        print(f"\n❌ Error: {e}")
-        print("📋 Check the logs for more details.")
-        print(f"📊 Log file: {log_path}")
+def parse_args():
+    """Parse command line options"""
+    parser = argparse.ArgumentParser(description="Esoteric content video generator")
+    parser.add_argument(
+        "-n", "--count", type=int, default=1,
+        help="number of videos to produce in this process (default: 1)"
+    )
+    parser.add_argument(
+        "--resume", metavar="RUN_ID",
+        help="continue an earlier run, reusing every stage that's still valid "
+             "('last' picks the most recent unfinished run)"
+    )
+    parser.add_argument(
+        "--profile", action="store_true",
+        help="record per-stage wall/CPU/memory/IO and API latency to "
+             "esoteric_content_pipeline/profiles/<run_id>.jsonl"
+    )
+    parser.add_argument(
+        "--pstats", action="store_true",
+        help="with --profile, also dump cProfile stats (runs stages one at a time)"
+    )
+    parser.add_argument(
+        "--render-profile", choices=sorted(RENDER_PROFILES), default=RENDER_PROFILE,
+        help="encode settings for the final video: draft (fast review), standard, "
+             f"archive (high quality) or upload (size-capped) (default: {RENDER_PROFILE})"
+    )
+    args = parser.parse_args()
+    if args.count < 1:
+        parser.error("--count must be at least 1")
+    
+    if args.resume == "last":
+        from stage_cache import find_latest_run
+        args.resume = find_latest_run()
+        if not args.resume:
+            parser.error("no unfinished run to resume")
+    return args
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    args = parse_args()
+    results = main(args.count, resume=args.resume, profile=args.profile, with_pstats=args.pstats,
+                   render_profile=args.render_profile)
+    sys.exit(0 if all(r["ok"] for r in results) else 1)
@@ -0,0 +1,126 @@
+# Cached media probing
+#
+# Reads container headers once with ffprobe and remembers the result by
+# (path, size, mtime), both in memory and on disk, so repeated duration and
+# stream checks on the same file cost nothing.
+
+import os
+import json
+import time
+import logging
+import threading
+import subprocess
+from pathlib import Path
+
+from shared_state import write_json_atomic
+
+PROBE_CACHE_FILE = Path("esoteric_content_pipeline") / "probe_cache.json"
+PROBE_CACHE_MAX_ENTRIES = 2000
+
+_MEMO = {}
+_DISK_CACHE = None
+_LOCK = threading.Lock()
+
+def _file_key(path):
+    """Identity of a file's current contents: absolute path, size and mtime"""
+    stat = os.stat(path)
+    return str(Path(path).resolve()), stat.st_size, stat.st_mtime_ns
+
+def _load_disk_cache():
+    global _DISK_CACHE
+    if _DISK_CACHE is None:
+        _DISK_CACHE = {}
+        if PROBE_CACHE_FILE.exists():
+            try:
+                with open(PROBE_CACHE_FILE, 'r', encoding='utf-8') as f:
+                    _DISK_CACHE = json.load(f)
+            except (OSError, ValueError) as e:
+                logging.warning(f"Probe cache unreadable, starting fresh: {e}")
+    return _DISK_CACHE
+
+def _save_disk_cache():
+    # Keep only the most recently probed files
+    if len(_DISK_CACHE) > PROBE_CACHE_MAX_ENTRIES:
+        newest = sorted(_DISK_CACHE.items(), key=lambda item: item[1]["probed_at"], reverse=True)
+        _DISK_CACHE.clear()
+        _DISK_CACHE.update(newest[:PROBE_CACHE_MAX_ENTRIES])
+
+    PROBE_CACHE_FILE.parent.mkdir(parents=True, exist_ok=True)
+    try:
+        write_json_atomic(PROBE_CACHE_FILE, _DISK_CACHE)
+    except OSError as e:
+        logging.warning(f"Could not save probe cache: {e}")
+
+def _run_ffprobe(path):
+    """Probe a file's format and streams from its headers"""
+    cmd = [
+        "ffprobe", "-v", "quiet", "-print_format", "json",
+        "-show_format", "-show_streams", str(path)
+    ]
+    result = subprocess.run(cmd, capture_output=True, text=True, check=True)
+    raw = json.loads(result.stdout)
+
+    streams = []
+    for stream in raw.get("streams", []):
+        numerator, _, denominator = stream.get("r_frame_rate", "0/1").partition("/")
+        streams.append({
+            "type": stream.get("codec_type"),
+            "codec": stream.get("codec_name"),
+            "width": stream.get("width"),
+            "height": stream.get("height"),
+            "fps": float(numerator) / float(denominator) if float(denominator or 0) else None,
+            "sample_rate": int(stream["sample_rate"]) if stream.get("sample_rate") else None,
+            "channels": stream.get("channels"),
+            "duration": float(stream["duration"]) if stream.get("duration") else None,
+        })
+
+    video = next((s for s in streams if s["type"] == "video"), {})
+    audio = next((s for s in streams if s["type"] == "audio"), {})
+    fmt = raw.get("format", {})
+
+    return {
+        "duration": float(fmt["duration"]) if fmt.get("duration") else None,
+        "format": fmt.get("format_name"),
+        "bit_rate": int(fmt.get("bit_rate") or 0),
+        "size": int(fmt.get("size") or 0),
+        "width": video.get("width"),
+        "height": video.get("height"),
+        "fps": video.get("fps"),
+        "video_codec": video.get("codec"),
+        "audio_codec": audio.get("codec"),
+        "sample_rate": audio.get("sample_rate"),
+        "channels": audio.get("channels"),
+        "streams": streams,
+    }
+
+def probe_media(path):
+    """Return duration, streams, resolution and bitrate for a media file"""
+    key = _file_key(path)
+
+    with _LOCK:
+        if key in _MEMO:
+            return _MEMO[key]
+
+        stored = _load_disk_cache().get(key[0])
+        if stored and stored["size"] == key[1] and stored["mtime_ns"] == key[2]:
+            _MEMO[key] = stored["info"]
+            return stored["info"]
+
+    info = _run_ffprobe(path)
+
+    with _LOCK:
+        _MEMO[key] = info
+        _load_disk_cache()[key[0]] = {
+            "size": key[1], "mtime_ns": key[2], "probed_at": time.time(), "info": info
+        }
+        _save_disk_cache()
+
+    return info
+
+def get_media_duration(path):
+    """Duration of a media file in seconds, or None if it can't be probed"""
+    try:
+        return probe_media(path)["duration"]
+    except Exception as e:
+        logging.error(f"Failed to probe duration of {path}: {e}")
+        return None
@@ -0,0 +1,154 @@
+# Pre-decoded background music cache
+#
+# Each track in assets/ is decoded once, attenuated and resampled to the voice
+# sample rate, then stored as raw 16-bit PCM. Mixing memory-maps the PCM and
+# reads only the samples it needs, wrapping around instead of building a
+# looped copy of the track.
+
+import os
+import json
+import warnings
+from pathlib import Path
+
+import numpy as np
+
+warnings.filterwarnings("ignore", message="Couldn't find ffmpeg or avconv")
+
+from pydub import AudioSegment
+
+from shared_state import write_json_atomic
+
+ASSETS_DIR = Path("assets")
+CACHE_DIR = Path("esoteric_content_pipeline") / "music_cache"
+MANIFEST_FILE = CACHE_DIR / "manifest.json"
+
+# Background music sits this far under the narration
+BACKGROUND_GAIN_DB = -20
+SAMPLE_WIDTH = 2  # 16-bit PCM
+
+def get_music_tracks():
+    """List the background tracks currently in assets/"""
+    if not ASSETS_DIR.exists():
+        return []
+    return sorted(ASSETS_DIR.glob("*.mp3"))
+
+def load_manifest():
+    """Load the cache manifest"""
+    if MANIFEST_FILE.exists():
+        try:
+            with open(MANIFEST_FILE, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"⚠️ Music cache manifest unreadable, rebuilding: {e}")
+    return {}
+
+def save_manifest(manifest):
+    """Write the cache manifest atomically"""
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    write_json_atomic(MANIFEST_FILE, manifest, indent=2)
+
+def _source_signature(track_path):
+    """Size and mtime of a source track, used to spot changed files"""
+    stat = Path(track_path).stat()
+    return {"source_size": stat.st_size, "source_mtime": stat.st_mtime}
+
+def _cache_entry_key(track_path, sample_rate):
+    return f"{Path(track_path).name}@{sample_rate}"
+
+def sync_music_cache(sample_rate):
+    """Decode new or changed tracks and drop cache entries for removed ones"""
+    manifest = load_manifest()
+    tracks = get_music_tracks()
+    wanted = {_cache_entry_key(track, sample_rate): track for track in tracks}
+    changed = False
+
+    # Forget tracks that were deleted from assets/ (other sample rates are kept)
+    current_names = {track.name for track in tracks}
+    for key in list(manifest):
+        if manifest[key]["source"] not in current_names:
+            pcm_path = CACHE_DIR / manifest[key]["pcm_file"]
+            if pcm_path.exists():
+                pcm_path.unlink()
+            del manifest[key]
+            changed = True
+
+    for key, track in wanted.items():
+        entry = manifest.get(key)
+        signature = _source_signature(track)
+        pcm_path = CACHE_DIR / entry["pcm_file"] if entry else None
+
+        if (entry and entry["gain_db"] == BACKGROUND_GAIN_DB and pcm_path.exists()
+                and all(entry[k] == v for k, v in signature.items())):
+            continue
+
+        manifest[key] = _decode_track(track, sample_rate, signature)
+        changed = True
+
+    if changed:
+        save_manifest(manifest)
+
+    return {key: manifest[key] for key in wanted}
+
+def _decode_track(track_path, sample_rate, signature):
+    """Decode one track to attenuated raw PCM at the given sample rate"""
+    print(f"🎼 Caching decoded background track: {track_path.name}")
+
+    music = AudioSegment.from_file(track_path)
+    music = (music + BACKGROUND_GAIN_DB).set_frame_rate(sample_rate).set_sample_width(SAMPLE_WIDTH)
+
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    pcm_file = f"{track_path.stem}_{sample_rate}.pcm"
+    temp_path = CACHE_DIR / f".{pcm_file}.{os.getpid()}.tmp"
+    temp_path.write_bytes(music.raw_data)
+    os.replace(temp_path, CACHE_DIR / pcm_file)
+
+    return dict(
+        signature,
+        source=track_path.name,
+        pcm_file=pcm_file,
+        sample_rate=sample_rate,
+        channels=music.channels,
+        frames=int(music.frame_count()),
+        gain_db=BACKGROUND_GAIN_DB,
+    )
+
+def open_music_pcm(entry):
+    """Memory-map a cached track as an int16 (frames, channels) array"""
+    return np.memmap(
+        CACHE_DIR / entry["pcm_file"], dtype=np.int16, mode="r",
+        shape=(entry["frames"], entry["channels"])
+    )
+
+def mix_voice_with_music(voice, entry):
+    """Overlay a cached track under the voice, wrapping the music as needed"""
+    voice = voice.set_sample_width(SAMPLE_WIDTH)
+    channels = max(voice.channels, entry["channels"])
+
+    voice_samples = np.frombuffer(voice.raw_data, dtype=np.int16).reshape(-1, voice.channels)
+    mixed = voice_samples.astype(np.int32)
+    if voice.channels < channels:
+        mixed = np.repeat(mixed, channels, axis=1)
+
+    music = open_music_pcm(entry)
+
+    # Add the music in wrap-around slices - only the samples needed are read
+    total_frames = len(mixed)
+    music_frames = entry["frames"]
+    position = 0
+    while position < total_frames:
+        take = min(total_frames - position, music_frames)
+        chunk = music[:take]
+        if entry["channels"] < channels:
+            chunk = np.repeat(chunk, channels, axis=1)
+        mixed[position:position + take] += chunk
+        position += take
+
+    np.clip(mixed, -32768, 32767, out=mixed)
+
+    loops = total_frames / music_frames if music_frames else 0
+    return AudioSegment(
+        mixed.astype(np.int16).tobytes(),
+        frame_rate=voice.frame_rate,
+        sample_width=SAMPLE_WIDTH,
+        channels=channels,
+    ), loops
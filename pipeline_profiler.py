@@ -0,0 +1,244 @@
+# Per-stage profiling for the content pipeline (enabled with main.py --profile)
+#
+# Each stage records wall time, Python CPU time, CPU used by child processes
+# (ffmpeg/ffprobe), peak memory, bytes read/written and time spent waiting on
+# external APIs. Records go to a JSONL trace per run, and a summary table is
+# printed when the run ends. With --pstats, a cProfile dump of the Python side
+# of every stage is written as well.
+
+import sys
+import json
+import time
+import pstats
+import cProfile
+import threading
+from pathlib import Path
+from contextlib import contextmanager
+
+try:
+    import resource  # Not available on Windows
+except ImportError:
+    resource = None
+
+try:
+    import psutil  # Optional - used where /proc and resource are missing
+except ImportError:
+    psutil = None
+
+PROFILE_DIR = Path("esoteric_content_pipeline") / "profiles"
+
+_ACTIVE = None
+_STAGE = threading.local()
+
+def start_profiling(run_id, with_pstats=False):
+    """Begin collecting stage metrics for a run"""
+    global _ACTIVE
+
+    PROFILE_DIR.mkdir(parents=True, exist_ok=True)
+    trace_path = PROFILE_DIR / f"{run_id}.jsonl"
+    _ACTIVE = {
+        "run_id": run_id,
+        "trace_path": trace_path,
+        "trace": open(trace_path, "a", encoding="utf-8"),
+        "stages": [],
+        "api_calls": [],
+        "stats": None,
+        "with_pstats": with_pstats,
+        "lock": threading.Lock(),
+    }
+    return trace_path
+
+def is_profiling(with_pstats=False):
+    """Whether profiling (optionally with cProfile) is active"""
+    return _ACTIVE is not None and (not with_pstats or _ACTIVE["with_pstats"])
+
+def stop_profiling():
+    """Finish the run: close the trace, dump pstats and print the summary"""
+    global _ACTIVE
+
+    if _ACTIVE is None:
+        return None
+
+    profile, _ACTIVE = _ACTIVE, None
+    profile["trace"].close()
+
+    print("\n" + format_summary(profile["stages"], profile["api_calls"]))
+    print(f"📈 Profile trace: {profile['trace_path']}")
+
+    if profile["stats"] is not None:
+        pstats_path = PROFILE_DIR / f"{profile['run_id']}.pstats"
+        profile["stats"].dump_stats(pstats_path)
+        print(f"📈 cProfile stats: {pstats_path} (view with: python -m pstats {pstats_path})")
+
+    return profile["stages"]
+
+def _write(record):
+    with _ACTIVE["lock"]:
+        _ACTIVE["trace"].write(json.dumps(record) + "\n")
+        _ACTIVE["trace"].flush()
+
+def _child_cpu():
+    """CPU seconds used by finished child processes (ffmpeg, ffprobe)"""
+    if resource is None:
+        return None
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+def peak_rss_mb():
+    """Peak resident memory of this process and of its largest child, in MB"""
+    if resource is not None:
+        # ru_maxrss is KB on Linux and bytes on macOS
+        divisor = 1024 * 1024 if sys.platform == "darwin" else 1024
+        own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / divisor
+        child = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / divisor
+        return own, child
+    if psutil is not None:
+        info = psutil.Process().memory_info()
+        return getattr(info, "peak_wset", info.rss) / (1024 * 1024), None
+    return None, None
+
+def io_bytes():
+    """Bytes read and written so far, including reaped child processes on Linux"""
+    try:
+        with open("/proc/self/io", "r") as f:
+            counters = dict(line.split(": ") for line in f.read().splitlines())
+        return int(counters["rchar"]), int(counters["wchar"])
+    except (OSError, KeyError, ValueError):
+        pass
+    if psutil is not None:
+        try:
+            io = psutil.Process().io_counters()
+            return io.read_bytes, io.write_bytes
+        except (AttributeError, psutil.Error):
+            pass
+    return None, None
+
+def _delta(after, before):
+    if after is None or before is None:
+        return None
+    return after - before
+
+@contextmanager
+def profile_stage(name):
+    """Measure one pipeline stage (a no-op unless profiling is active)"""
+    if _ACTIVE is None:
+        yield
+        return
+
+    _STAGE.name = name
+    profiler = cProfile.Profile() if _ACTIVE["with_pstats"] else None
+
+    wall_start = time.perf_counter()
+    started_at = time.time()
+    cpu_start = time.thread_time()
+    child_start = _child_cpu()
+    read_start, written_start = io_bytes()
+
+    if profiler:
+        profiler.enable()
+    failed = False
+    try:
+        yield
+    except BaseException:
+        failed = True
+        raise
+    finally:
+        if profiler:
+            profiler.disable()
+
+        read_end, written_end = io_bytes()
+        peak_rss, child_peak_rss = peak_rss_mb()
+        record = {
+            "type": "stage",
+            "run_id": _ACTIVE["run_id"],
+            "stage": name,
+            "started_at": started_at,
+            "wall_s": time.perf_counter() - wall_start,
+            "cpu_s": time.thread_time() - cpu_start,
+            "child_cpu_s": _delta(_child_cpu(), child_start),
+            "peak_rss_mb": peak_rss,
+            "child_peak_rss_mb": child_peak_rss,
+            "bytes_read": _delta(read_end, read_start),
+            "bytes_written": _delta(written_end, written_start),
+            "api_s": sum(c["latency_s"] for c in _ACTIVE["api_calls"] if c["stage"] == name),
+            "failed": failed,
+        }
+        _STAGE.name = None
+
+        with _ACTIVE["lock"]:
+            _ACTIVE["stages"].append(record)
+            if profiler:
+                if _ACTIVE["stats"] is None:
+                    _ACTIVE["stats"] = pstats.Stats(profiler)
+                else:
+                    _ACTIVE["stats"].add(profiler)
+        _write(record)
+
+@contextmanager
+def track_api_call(service):
+    """Time a call to an external API and attribute it to the current stage"""
+    if _ACTIVE is None:
+        yield
+        return
+
+    start = time.perf_counter()
+    ok = True
+    try:
+        yield
+    except BaseException:
+        ok = False
+        raise
+    finally:
+        record = {
+            "type": "api",
+            "run_id": _ACTIVE["run_id"],
+            "service": service,
+            "stage": getattr(_STAGE, "name", None),
+            "latency_s": time.perf_counter() - start,
+            "ok": ok,
+        }
+        with _ACTIVE["lock"]:
+            _ACTIVE["api_calls"].append(record)
+        _write(record)
+
+def profiled_stage(name, func):
+    """Wrap a stage function so it runs inside profile_stage"""
+    def _run(*args, **kwargs):
+        with profile_stage(name):
+            return func(*args, **kwargs)
+    return _run
+
+def _fmt(value, pattern):
+    return pattern.format(value) if value is not None else "-"
+
+def format_summary(stages, api_calls):
+    """Render the per-stage metrics as a text table"""
+    header = (
+        f"{'stage':<12} {'wall s':>8} {'cpu s':>7} {'child s':>8} "
+        f"{'rss MB':>7} {'read MB':>8} {'write MB':>9} {'api s':>7}"
+    )
+    lines = ["📊 PROFILE SUMMARY", header, "-" * len(header)]
+
+    for s in sorted(stages, key=lambda s: s["started_at"]):
+        lines.append(
+            f"{s['stage']:<12} {s['wall_s']:>8.2f} {s['cpu_s']:>7.2f} "
+            f"{_fmt(s['child_cpu_s'], '{:>8.2f}'):>8} "
+            f"{_fmt(s['peak_rss_mb'], '{:>7.0f}'):>7} "
+            f"{_fmt(s['bytes_read'] and s['bytes_read'] / 1e6, '{:>8.1f}'):>8} "
+            f"{_fmt(s['bytes_written'] and s['bytes_written'] / 1e6, '{:>9.1f}'):>9} "
+            f"{s['api_s']:>7.2f}" + ("  FAILED" if s["failed"] else "")
+        )
+
+    if api_calls:
+        lines.append("")
+        by_service = {}
+        for call in api_calls:
+            by_service.setdefault(call["service"], []).append(call["latency_s"])
+        for service, latencies in sorted(by_service.items()):
+            lines.append(
+                f"🌐 {service}: {len(latencies)} calls, "
+                f"{sum(latencies):.2f}s total, {max(latencies):.2f}s slowest"
+            )
+
+    lines.append("(child CPU and I/O are process-wide, so stages running in parallel share them)")
+    return "\n".join(lines)
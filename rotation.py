@@ -0,0 +1,79 @@
+# Least-recently-used rotation for topics and background search terms
+#
+# Every item carries a key of round + jitter. The smallest key is picked next
+# and moves to the following round, so every item comes up once per round and
+# nothing repeats before the whole pool has been used - no history resets.
+# Items added mid-rotation join the current round. Weights only reorder items
+# inside a round: heavier items tend to come up earlier, never more often.
+
+import os
+import json
+import math
+import heapq
+import random
+
+from shared_state import file_lock, read_json, write_json_atomic
+
+# Optional weights by topic category or background search term, e.g.
+# ROTATION_WEIGHTS='{"Ancient wisdom": 2, "galaxy": 0.5}'
+ROTATION_WEIGHTS = json.loads(os.getenv("ROTATION_WEIGHTS", "{}"))
+
+def rotation_weight(name):
+    """Configured weight of a category or term (1 when unset)"""
+    return float(ROTATION_WEIGHTS.get(name, 1.0)) if name else 1.0
+
+def rotation_key(round_number, weight=1.0):
+    """Key in [round, round + 1), earlier in the round for heavier weights"""
+    # Efraimidis-Spirakis weighted order: u^(1/w) is biased towards 1 for large w
+    return round_number + 1.0 - (1.0 - random.random()) ** (1.0 / weight)
+
+def rotation_round(key):
+    return math.floor(key)
+
+def _load_heap(path, items, weight_of):
+    """Read a persisted schedule and bring it in line with the current items"""
+    heap = read_json(path, default=[])
+    wanted = dict.fromkeys(items)
+
+    if any(item not in wanted for _, item in heap):
+        heap = [entry for entry in heap if entry[1] in wanted]
+    heapq.heapify(heap)
+
+    current = rotation_round(heap[0][0]) if heap else 0
+    known = {item for _, item in heap}
+    for item in wanted:
+        if item not in known:
+            heapq.heappush(heap, [rotation_key(current, weight_of(item)), item])
+    return heap
+
+def pick_next(path, items, weight_of=rotation_weight):
+    """Pop the least recently used item from the schedule at `path` and requeue it"""
+    with file_lock(path):
+        heap = _load_heap(path, items, weight_of)
+        if not heap:
+            raise RuntimeError(f"Nothing to schedule in {path}")
+
+        key, item = heap[0]
+        heapq.heapreplace(heap, [rotation_key(rotation_round(key) + 1, weight_of(item)), item])
+        write_json_atomic(path, heap)
+    return item
+
+def mark_used(path, item, items, weight_of=rotation_weight):
+    """Move an item picked outside pick_next (e.g. by prefetch) to the next round"""
+    with file_lock(path):
+        heap = _load_heap(path, items, weight_of)
+        current = rotation_round(heap[0][0]) if heap else 0
+        for entry in heap:
+            if entry[1] == item:
+                entry[0] = rotation_key(max(rotation_round(entry[0]), current) + 1, weight_of(item))
+                heapq.heapify(heap)
+                write_json_atomic(path, heap)
+                break
+
+def schedule_progress(path, items, weight_of=rotation_weight):
+    """(current round, items still due in it) for a persisted schedule"""
+    heap = _load_heap(path, items, weight_of)
+    if not heap:
+        return 0, 0
+    current = rotation_round(heap[0][0])
+    return current, sum(1 for key, _ in heap if rotation_round(key) == current)
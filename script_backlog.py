@@ -0,0 +1,380 @@
+#!/usr/bin/env python3
+"""
+Script Backlog
+Generates scripts ahead of rendering so a pipeline run just dequeues one
+"""
+
+import os
+import re
+import json
+import time
+import logging
+import threading
+
+from dotenv import load_dotenv
+
+from topic_store import connect, transaction, release_topics
+
+load_dotenv()
+
+SCRIPT_MODEL = "claude-3-5-sonnet-20241022"
+SCRIPT_SYSTEM_PROMPT = (
+    "You are a philosophical content writer. Generate only the spoken content, no instructions or directions."
+)
+SCRIPT_TEMPERATURE = 1.0
+SCRIPT_MAX_TOKENS = 600
+
+# Ready scripts to keep queued (0 turns the background filler off)
+BACKLOG_SIZE = int(os.getenv("SCRIPT_BACKLOG_SIZE", "4"))
+
+# Monologues asked for in one Claude request
+SCRIPTS_PER_REQUEST = int(os.getenv("SCRIPTS_PER_REQUEST", "4"))
+BACKLOG_REFILL_INTERVAL = float(os.getenv("SCRIPT_BACKLOG_REFILL_SECONDS", "60"))
+
+_FILLER = None
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS script_backlog (
+    id INTEGER PRIMARY KEY,
+    topic TEXT NOT NULL,
+    script TEXT NOT NULL,
+    source TEXT NOT NULL,
+    created REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS script_batches (
+    batch_id TEXT PRIMARY KEY,
+    topics TEXT NOT NULL,
+    submitted REAL NOT NULL
+)
+"""
+
+# Delimiter Claude puts before each monologue in a multi-script reply
+MARKER_PATTERN = re.compile(r"^\s*===\s*(\d+)\s*===\s*$", re.MULTILINE)
+
+META_PATTERNS = [
+    r"\[.*?\]",  # Remove [instructions in brackets]
+    r"\(.*speaking.*\)",  # Remove (speaking instructions)
+    r"\(.*tone.*\)",  # Remove (tone instructions)
+    r"\(.*voice.*\)",  # Remove (voice instructions)
+    r"speaking in.*",  # Remove "speaking in a X manner"
+    r".*contemplative tone.*",  # Remove tone descriptions
+    r".*deliberate.*tone.*",  # Remove deliberate tone mentions
+]
+
+META_WORDS = [
+    'speaking', 'voice', 'tone', 'delivery', 'manner', 'contemplative',
+    'deliberate', 'pause', 'emphasis', 'inflection'
+]
+
+SCRIPT_GUIDELINES = """- Starts with an intriguing hook or question
+- Explores the topic with poetic, mystical language
+- Uses metaphors and profound insights
+- Ends with a thought-provoking conclusion
+- Flows naturally as spoken word
+
+Write ONLY the monologue content itself - no stage directions, no speaking instructions, no meta-commentary. Just the pure philosophical content as it should be spoken."""
+
+def script_prompt(topic):
+    """Prompt for a single monologue"""
+    return f"""Write a philosophical monologue about "{topic}" in the style of Alan Watts or Terence McKenna.
+
+Create a 60-90 second spoken piece that:
+{SCRIPT_GUIDELINES}"""
+
+def multi_script_prompt(topics):
+    """Prompt for one monologue per topic in a single reply"""
+    numbered = "\n".join(f"{i}. {topic}" for i, topic in enumerate(topics, 1))
+    return f"""Write {len(topics)} separate philosophical monologues in the style of Alan Watts or Terence McKenna, one for each of these topics:
+
+{numbered}
+
+Each monologue is a 60-90 second spoken piece that:
+{SCRIPT_GUIDELINES}
+
+Put a line with only "=== N ===" before each monologue, where N is its topic number."""
+
+def clean_generated_script(script):
+    """Strip stage directions and delivery notes that slip into Claude's output"""
+    script = script.strip()
+
+    # Remove common meta-instruction patterns
+    for pattern in META_PATTERNS:
+        script = re.sub(pattern, "", script, flags=re.IGNORECASE)
+
+    # Clean up extra whitespace and line breaks
+    script = re.sub(r'\s+', ' ', script).strip()
+
+    # Remove any sentences that start with meta-instructions
+    clean_sentences = []
+    for sentence in script.split('.'):
+        sentence = sentence.strip()
+        if sentence and not any(word in sentence.lower() for word in META_WORDS):
+            clean_sentences.append(sentence)
+
+    # Reconstruct the script
+    clean_script = '. '.join(clean_sentences)
+    if clean_script and not clean_script.endswith('.'):
+        clean_script += '.'
+
+    return clean_script
+
+def split_monologues(text, count):
+    """Map topic number -> monologue text from a multi-script reply"""
+    parts = MARKER_PATTERN.split(text)
+    # parts = [preamble, number, body, number, body, ...]
+    monologues = {}
+    for number, body in zip(parts[1::2], parts[2::2]):
+        index = int(number)
+        if 1 <= index <= count and body.strip():
+            monologues[index] = body
+    return monologues
+
+def _connect():
+    conn = connect()
+    # One statement at a time: executescript would commit an open transaction
+    for statement in SCHEMA.split(";"):
+        if statement.strip():
+            conn.execute(statement)
+    return conn
+
+def _enqueue(conn, topic_scripts, source):
+    """Clean and store (topic, raw script) pairs; returns the topics that couldn't be queued"""
+    skipped = []
+    now = time.time()
+    for topic, raw in topic_scripts:
+        script = clean_generated_script(raw)
+        if not script:
+            logging.warning(f"Generated script for '{topic}' was empty after cleanup, skipping it")
+            skipped.append(topic)
+            continue
+        conn.execute(
+            "INSERT INTO script_backlog (topic, script, source, created) VALUES (?, ?, ?, ?)",
+            (topic, script, source, now)
+        )
+    return skipped
+
+def take_script():
+    """Pop the oldest ready script as {"topic", "script"}, or None when the backlog is empty"""
+    conn = _connect()
+    try:
+        with transaction(conn):
+            row = conn.execute("SELECT id, topic, script FROM script_backlog ORDER BY id LIMIT 1").fetchone()
+            if row is None:
+                return None
+            conn.execute("DELETE FROM script_backlog WHERE id = ?", (row["id"],))
+        return {"topic": row["topic"], "script": row["script"]}
+    finally:
+        conn.close()
+
+def backlog_status():
+    """Ready scripts and topics still waiting in submitted batches"""
+    conn = _connect()
+    try:
+        ready = conn.execute("SELECT COUNT(*) FROM script_backlog").fetchone()[0]
+        pending = sum(
+            len(json.loads(row["topics"])) for row in conn.execute("SELECT topics FROM script_batches")
+        )
+        return {"ready": ready, "pending": pending}
+    finally:
+        conn.close()
+
+def request_scripts(count):
+    """Ask Claude for `count` monologues in one request and queue them"""
+    from llm_cache import cached_completion
+    from content_variety_enhancer import get_varied_topic
+
+    # Picking moves a topic on in the rotation; give it back if no script comes of it
+    topics = []
+    try:
+        for _ in range(count):
+            topics.append(get_varied_topic())
+        text = cached_completion(
+            model=SCRIPT_MODEL,
+            system=SCRIPT_SYSTEM_PROMPT,
+            prompt=multi_script_prompt(topics),
+            temperature=SCRIPT_TEMPERATURE,
+            max_tokens=min(SCRIPT_MAX_TOKENS * count, 8192)
+        )
+    except Exception:
+        release_topics(topics)
+        raise
+
+    monologues = split_monologues(text, count)
+    missing = [topic for i, topic in enumerate(topics, 1) if i not in monologues]
+    if missing:
+        logging.warning(f"Multi-script reply had no monologue for: {', '.join(missing)}")
+
+    conn = _connect()
+    try:
+        with transaction(conn):
+            skipped = _enqueue(conn, [(topics[i - 1], body) for i, body in sorted(monologues.items())], "multi")
+        release_topics(missing + skipped, conn=conn)
+    finally:
+        conn.close()
+    return len(topics) - len(missing) - len(skipped)
+
+def submit_batch(count):
+    """Submit `count` single-script requests as a Message Batch (half price, results within 24h)"""
+    from llm_cache import get_anthropic_client
+    from pipeline_profiler import track_api_call
+    from content_variety_enhancer import get_varied_topic
+
+    # Picking moves a topic on in the rotation; give it back if the batch isn't submitted
+    topics = []
+    try:
+        for _ in range(count):
+            topics.append(get_varied_topic())
+        requests = [
+            {
+                "custom_id": f"script-{i}",
+                "params": {
+                    "model": SCRIPT_MODEL,
+                    "max_tokens": SCRIPT_MAX_TOKENS,
+                    "temperature": SCRIPT_TEMPERATURE,
+                    "system": SCRIPT_SYSTEM_PROMPT,
+                    "messages": [{"role": "user", "content": script_prompt(topic)}],
+                },
+            }
+            for i, topic in enumerate(topics)
+        ]
+        with track_api_call("claude"):
+            batch = get_anthropic_client().messages.batches.create(requests=requests)
+    except Exception:
+        release_topics(topics)
+        raise
+
+    conn = _connect()
+    try:
+        with transaction(conn):
+            conn.execute(
+                "INSERT INTO script_batches (batch_id, topics, submitted) VALUES (?, ?, ?)",
+                (batch.id, json.dumps(topics), time.time())
+            )
+    finally:
+        conn.close()
+    return batch.id
+
+def collect_batches():
+    """Queue the scripts of every finished batch; returns how many were queued"""
+    from llm_cache import get_anthropic_client
+    from pipeline_profiler import track_api_call
+
+    client = get_anthropic_client()
+    conn = _connect()
+    queued = 0
+    try:
+        for row in conn.execute("SELECT batch_id, topics FROM script_batches").fetchall():
+            with track_api_call("claude"):
+                batch = client.messages.batches.retrieve(row["batch_id"])
+                if batch.processing_status != "ended":
+                    continue
+                results = list(client.messages.batches.results(row["batch_id"]))
+
+            topics = json.loads(row["topics"])
+            scripts = []
+            failed = []
+            for entry in results:
+                index = int(entry.custom_id.split("-")[1])
+                if entry.result.type == "succeeded":
+                    scripts.append((topics[index], entry.result.message.content[0].text))
+                else:
+                    logging.warning(f"Batch script for '{topics[index]}' {entry.result.type}")
+                    failed.append(topics[index])
+
+            with transaction(conn):
+                # Another collector may have taken this batch while results downloaded
+                claimed = conn.execute(
+                    "DELETE FROM script_batches WHERE batch_id = ?", (row["batch_id"],)
+                ).rowcount
+                if claimed:
+                    skipped = _enqueue(conn, scripts, "batch")
+                    queued += len(scripts) - len(skipped)
+            if claimed:
+                release_topics(failed + skipped, conn=conn)
+    finally:
+        conn.close()
+
+    if queued:
+        print(f"📚 Collected {queued} scripts from finished batches")
+    return queued
+
+def fill_backlog(size=None, use_batch=False):
+    """Request scripts until `size` are ready or on their way; returns how many were requested"""
+    size = BACKLOG_SIZE if size is None else size
+    status = backlog_status()
+    wanted = size - status["ready"] - status["pending"]
+    if wanted <= 0:
+        return 0
+
+    if use_batch:
+        batch_id = submit_batch(wanted)
+        print(f"📨 Submitted batch {batch_id} for {wanted} scripts")
+        return wanted
+
+    requested = 0
+    while requested < wanted:
+        count = min(SCRIPTS_PER_REQUEST, wanted - requested)
+        queued = request_scripts(count)
+        requested += count
+        print(f"📚 Queued {queued}/{count} scripts")
+    return requested
+
+def start_backlog_filler(interval=BACKLOG_REFILL_INTERVAL):
+    """Keep the backlog topped up on a daemon thread for the life of the process"""
+    global _FILLER
+
+    if _FILLER is not None and _FILLER.is_alive():
+        return _FILLER
+
+    def _loop():
+        while True:
+            try:
+                fill_backlog()
+            except Exception as e:
+                print(f"⚠️ Script backlog filler error: {e}")
+            time.sleep(interval)
+
+    _FILLER = threading.Thread(target=_loop, name="script-backlog", daemon=True)
+    _FILLER.start()
+    return _FILLER
+
+def show_backlog():
+    """Print what's waiting in the backlog"""
+    conn = _connect()
+    try:
+        rows = conn.execute("SELECT topic, source, created FROM script_backlog ORDER BY id").fetchall()
+        batches = conn.execute("SELECT batch_id, topics, submitted FROM script_batches").fetchall()
+    finally:
+        conn.close()
+
+    print(f"📚 SCRIPT BACKLOG ({len(rows)} ready)")
+    print("=" * 40)
+    for row in rows:
+        age = (time.time() - row["created"]) / 3600
+        print(f"   {row['topic'][:45]:<45} {row['source']:<5} {age:5.1f}h")
+    for row in batches:
+        print(f"   ⏳ batch {row['batch_id']}: {len(json.loads(row['topics']))} scripts pending")
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Generate scripts ahead of rendering")
+    parser.add_argument("--fill", type=int, metavar="N", help="queue scripts until N are ready or pending")
+    parser.add_argument("--batch", action="store_true", help="with --fill, submit a Message Batch instead")
+    parser.add_argument("--collect", action="store_true", help="queue the scripts of finished batches")
+    parser.add_argument("--daemon", action="store_true", help="keep the backlog topped up until interrupted")
+    args = parser.parse_args()
+
+    if args.collect:
+        collect_batches()
+    if args.fill:
+        fill_backlog(args.fill, use_batch=args.batch)
+    if args.daemon:
+        print(f"🔁 Topping up to {BACKLOG_SIZE} scripts every {BACKLOG_REFILL_INTERVAL:.0f}s (Ctrl+C to stop)")
+        try:
+            while True:
+                fill_backlog()
+                time.sleep(BACKLOG_REFILL_INTERVAL)
+        except KeyboardInterrupt:
+            print("\n👋 Backlog filler stopped")
+    show_backlog()
@@ -0,0 +1,171 @@
+# Locked, crash-safe state files shared by concurrent pipeline workers
+#
+# Usage history (background searches, captions/hashtags) is an append-only
+# journal next to a JSON snapshot. Reads, appends and picks all hold an
+# exclusive file lock, so nobody sees the journal half folded into the
+# snapshot. Once the journal grows past a size limit it is folded back into
+# the snapshot.
+
+import os
+import json
+import time
+import logging
+import threading
+from pathlib import Path
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+LOCK_TIMEOUT = float(os.getenv("STATE_LOCK_TIMEOUT", "30"))
+
+# Fold the journal into the snapshot once it grows past this many bytes
+JOURNAL_COMPACT_BYTES = 16 * 1024
+
+@contextmanager
+def file_lock(path, timeout=LOCK_TIMEOUT):
+    """Hold an exclusive lock on `path` (via a .lock file) across processes and threads"""
+    lock_path = Path(f"{path}.lock")
+    lock_path.parent.mkdir(parents=True, exist_ok=True)
+    deadline = time.monotonic() + timeout
+
+    with open(lock_path, "a+b") as f:
+        while True:
+            try:
+                if fcntl:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                else:
+                    f.seek(0)
+                    msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+                break
+            except OSError:
+                if time.monotonic() > deadline:
+                    raise TimeoutError(f"Timed out after {timeout:.0f}s waiting for lock on {path}")
+                time.sleep(0.05)
+
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+def read_json(path, default=None):
+    """Read a JSON file written by write_json_atomic (never sees a half-written file)"""
+    path = Path(path)
+    if not path.exists():
+        return default
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except ValueError as e:
+        logging.warning(f"State file {path} is not valid JSON, ignoring it: {e}")
+        return default
+
+def write_json_atomic(path, data, indent=None):
+    """Write JSON to a temp file, fsync it and rename it over `path`"""
+    path = Path(path)
+    temp_path = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, indent=indent)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)
+    finally:
+        if temp_path.exists():
+            temp_path.unlink()
+
+def journal_path(snapshot_path):
+    """The append-only journal that sits next to a snapshot file"""
+    snapshot_path = Path(snapshot_path)
+    return snapshot_path.with_name(f"{snapshot_path.stem}.journal.jsonl")
+
+def _read_journal(snapshot_path):
+    entries = []
+    path = journal_path(snapshot_path)
+    if not path.exists():
+        return entries
+
+    with open(path, 'r', encoding='utf-8') as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                entries.append(json.loads(line))
+            except ValueError:
+                # A crash mid-append leaves at most one torn line
+                logging.warning(f"Skipping unreadable line {line_number} of {path}")
+    return entries
+
+def _load_locked(snapshot_path, keep, convert):
+    snapshot = read_json(snapshot_path, default=[])
+    if convert:
+        snapshot = convert(snapshot)
+
+    entries = list(snapshot) + _read_journal(snapshot_path)
+    return entries[-keep:] if keep else entries
+
+def load_usage(snapshot_path, keep=None, convert=None):
+    """Snapshot + journal entries, oldest first (optionally only the last `keep`)
+
+    `convert` turns a legacy snapshot format into a list of entries.
+    """
+    with file_lock(snapshot_path):
+        return _load_locked(snapshot_path, keep, convert)
+
+def _append_locked(snapshot_path, entry):
+    path = journal_path(snapshot_path)
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write(json.dumps(entry) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+
+def _compact_locked(snapshot_path, keep, convert):
+    # Snapshot first, then truncate: a crash in between can repeat entries, never lose them
+    write_json_atomic(snapshot_path, _load_locked(snapshot_path, keep, convert))
+    journal_path(snapshot_path).unlink()
+
+def _journal_full(snapshot_path):
+    try:
+        return journal_path(snapshot_path).stat().st_size >= JOURNAL_COMPACT_BYTES
+    except FileNotFoundError:
+        return False
+
+def append_usage(snapshot_path, entry, keep=None, convert=None):
+    """Record one usage entry"""
+    with file_lock(snapshot_path):
+        _append_locked(snapshot_path, entry)
+    if _journal_full(snapshot_path):
+        compact_usage(snapshot_path, keep, convert)
+
+def pick_usage(snapshot_path, choose, keep=None, convert=None):
+    """Atomically read the history, let `choose(history)` pick an entry and record it
+
+    Holding the lock across read, choice and append means concurrent workers
+    always see each other's picks.
+    """
+    with file_lock(snapshot_path):
+        entry = choose(_load_locked(snapshot_path, keep, convert))
+        _append_locked(snapshot_path, entry)
+    if _journal_full(snapshot_path):
+        compact_usage(snapshot_path, keep, convert)
+    return entry
+
+def compact_usage(snapshot_path, keep=None, convert=None):
+    """Fold the journal into the snapshot (appends do this once it passes JOURNAL_COMPACT_BYTES)"""
+    with file_lock(snapshot_path):
+        if journal_path(snapshot_path).exists():
+            _compact_locked(snapshot_path, keep, convert)
+
+def clear_usage(snapshot_path):
+    """Forget all recorded usage"""
+    with file_lock(snapshot_path):
+        for path in (Path(snapshot_path), journal_path(snapshot_path)):
+            if path.exists():
+                path.unlink()
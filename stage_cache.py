@@ -0,0 +1,126 @@
+# Per-run stage manifests so a failed or repeated job can skip finished work
+#
+# Every pipeline stage is recorded in esoteric_content_pipeline/runs/<run_id>.json
+# together with a hash of its inputs and a digest of each output file. A stage
+# is reused only when its inputs hash the same and its outputs are unchanged.
+
+import os
+import json
+import time
+import hashlib
+import threading
+from pathlib import Path
+from contextlib import contextmanager
+
+from shared_state import write_json_atomic
+
+RUNS_DIR = Path("esoteric_content_pipeline") / "runs"
+
+_DIGEST_CACHE = {}
+_MANIFEST_LOCK = threading.Lock()
+
+def manifest_path(run_id):
+    """Where the manifest for a run is stored"""
+    return RUNS_DIR / f"{run_id}.json"
+
+def load_manifest(run_id):
+    """Load a run's manifest, or start an empty one"""
+    path = manifest_path(run_id)
+    if path.exists():
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"⚠️ Run manifest unreadable, starting fresh: {e}")
+
+    return {"run_id": run_id, "created": time.time(), "completed": False, "stages": {}}
+
+def save_manifest(manifest):
+    """Write a run's manifest atomically"""
+    RUNS_DIR.mkdir(parents=True, exist_ok=True)
+    write_json_atomic(manifest_path(manifest["run_id"]), manifest, indent=2)
+
+def find_latest_run(incomplete_only=True):
+    """Return the id of the most recent run (optionally only unfinished ones)"""
+    if not RUNS_DIR.exists():
+        return None
+
+    for path in sorted(RUNS_DIR.glob("*.json"), key=lambda p: p.stat().st_mtime, reverse=True):
+        manifest = load_manifest(path.stem)
+        if not incomplete_only or not manifest.get("completed"):
+            return manifest["run_id"]
+    return None
+
+def file_digest(path):
+    """SHA-256 of a file's content, memoized by path, size and mtime"""
+    path = Path(path)
+    stat = path.stat()
+    memo_key = (str(path.resolve()), stat.st_size, stat.st_mtime_ns)
+
+    if memo_key not in _DIGEST_CACHE:
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(block)
+        _DIGEST_CACHE[memo_key] = digest.hexdigest()
+
+    return _DIGEST_CACHE[memo_key]
+
+def hash_inputs(*parts):
+    """Hash a stage's inputs - files are hashed by content, everything else by value"""
+    digest = hashlib.sha256()
+    for part in parts:
+        if isinstance(part, Path):
+            part = f"file:{file_digest(part)}"
+        digest.update(json.dumps(part, sort_keys=True, default=str).encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+def fresh_stage(manifest, stage, input_hash):
+    """Return a stage's recorded values if its inputs and outputs are unchanged"""
+    record = manifest["stages"].get(stage)
+    if not record or record["input_hash"] != input_hash:
+        return None
+
+    for key, recorded_digest in record["outputs"].items():
+        path = Path(record["values"][key])
+        if not path.exists() or file_digest(path) != recorded_digest:
+            return None
+
+    return record["values"]
+
+def record_stage(manifest, stage, input_hash, values, files=()):
+    """Store a finished stage's values and the digests of its output files"""
+    with _MANIFEST_LOCK:
+        manifest["stages"][stage] = {
+            "input_hash": input_hash,
+            "values": {k: str(v) if isinstance(v, Path) else v for k, v in values.items()},
+            "outputs": {key: file_digest(values[key]) for key in files},
+            "finished": time.time(),
+        }
+        save_manifest(manifest)
+
+def run_stage(manifest, stage, input_hash, produce, files=()):
+    """Reuse a stage's results when still valid, otherwise run and record it"""
+    values = fresh_stage(manifest, stage, input_hash)
+    if values is not None:
+        print(f"♻️ Reusing '{stage}' from run {manifest['run_id']}")
+        return values
+
+    values = produce()
+    record_stage(manifest, stage, input_hash, values, files)
+    return fresh_stage(manifest, stage, input_hash) or values
+
+@contextmanager
+def atomic_output(path):
+    """Yield a temp path next to `path` and move it into place only on success"""
+    path = Path(path)
+    # Keep the real suffix last so ffmpeg still recognises the container
+    temp_path = path.with_name(f"{path.stem}.partial{path.suffix}")
+
+    try:
+        yield temp_path
+        os.replace(temp_path, path)
+    finally:
+        if temp_path.exists():
+            temp_path.unlink()
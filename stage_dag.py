@@ -0,0 +1,108 @@
+# Run pipeline stages as a dependency graph on a thread pool
+#
+# A stage starts as soon as everything it depends on has finished, so
+# independent work (e.g. the background video download) overlaps with the
+# script -> voice -> mix chain instead of waiting behind it.
+
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+def run_dag(stages, max_workers=4):
+    """Run {name: (dependencies, func)} stages; each func receives the results so far
+
+    Returns (results, timeline). The first stage error is re-raised once the
+    stages already running have finished; stages not yet started are skipped.
+    """
+    unknown = {dep for deps, _ in stages.values() for dep in deps if dep not in stages}
+    if unknown:
+        raise ValueError(f"Unknown stage dependencies: {', '.join(sorted(unknown))}")
+
+    results = {}
+    timeline = {}
+    pending = dict(stages)
+    running = {}
+    dag_start = time.monotonic()
+    error = None
+
+    def _run(name, func):
+        started = time.monotonic()
+        try:
+            return func(results)
+        finally:
+            timeline[name] = {
+                "stage": name,
+                "deps": list(stages[name][0]),
+                "start": started - dag_start,
+                "end": time.monotonic() - dag_start,
+                "thread": threading.current_thread().name,
+            }
+
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="stage") as executor:
+        while pending or running:
+            if error is None:
+                ready = [name for name, (deps, _) in pending.items() if all(d in results for d in deps)]
+                for name in ready:
+                    _, func = pending.pop(name)
+                    running[executor.submit(_run, name, func)] = name
+
+            if not running:
+                if error is None:
+                    raise RuntimeError(f"Stage graph has a cycle: {', '.join(sorted(pending))}")
+                break
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                try:
+                    results[name] = future.result()
+                except Exception as e:
+                    if error is None:
+                        error = e
+                    timeline[name]["failed"] = True
+
+    ordered = sorted(timeline.values(), key=lambda t: t["start"])
+    if error is not None:
+        error.timeline = ordered
+        raise error
+
+    return results, ordered
+
+def critical_path(timeline):
+    """Walk back from the last stage to finish through its latest-finishing dependency"""
+    by_name = {t["stage"]: t for t in timeline}
+    if not by_name:
+        return []
+
+    path = []
+    current = max(by_name.values(), key=lambda t: t["end"])
+    while current:
+        path.append(current["stage"])
+        deps = [by_name[d] for d in current["deps"] if d in by_name]
+        current = max(deps, key=lambda t: t["end"]) if deps else None
+
+    return list(reversed(path))
+
+def format_timeline(timeline, width=40):
+    """Render a stage timeline as text bars, marking the critical path with *"""
+    if not timeline:
+        return "(no stages ran)"
+
+    total = max(t["end"] for t in timeline) or 1.0
+    on_path = set(critical_path(timeline))
+    name_width = max(len(t["stage"]) for t in timeline)
+
+    lines = [f"⏱️ Stage timeline ({total:.1f}s total, * = critical path)"]
+    for t in timeline:
+        first = int(t["start"] / total * width)
+        length = max(1, int((t["end"] - t["start"]) / total * width))
+        bar = " " * first + "█" * length
+        marker = "*" if t["stage"] in on_path else " "
+        status = " FAILED" if t.get("failed") else ""
+        lines.append(
+            f"{marker} {t['stage']:<{name_width}} |{bar:<{width}}| "
+            f"{t['start']:6.1f}s → {t['end']:6.1f}s ({t['end'] - t['start']:.1f}s){status}"
+        )
+
+    lines.append("Critical path: " + " → ".join(critical_path(timeline)))
+    return "\n".join(lines)
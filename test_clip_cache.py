@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""
+Test Clip Cache
+Cached background clips are served without going back to Pexels
+"""
+
+import time
+
+import pytest
+
+import clip_cache
+import content_variety_enhancer
+
+@pytest.fixture
+def workspace(tmp_path, monkeypatch):
+    """Run against an empty clip cache (and prefetch pool) in a temp directory"""
+    monkeypatch.chdir(tmp_path)
+    clip_cache.CACHE_DIR.mkdir(parents=True)
+    return tmp_path
+
+def add_cached_clip(key, search_term, duration, created=None):
+    """Put a fake clip in the cache as if it had been downloaded for search_term"""
+    path = clip_cache.CACHE_DIR / f"{key}.mp4"
+    path.write_bytes(key.encode("utf-8"))
+
+    index = clip_cache.load_index()
+    index["clips"][key] = {
+        "file": path.name,
+        "duration": duration,
+        "normalized": True,
+        "size": path.stat().st_size,
+        "created": created or time.time(),
+        "last_used": 0,
+        "hits": 0,
+    }
+    index["searches"].setdefault(search_term, []).append(key)
+    clip_cache.save_index(index)
+
+def test_lookup_prefers_clips_that_cover_the_audio(workspace):
+    add_cached_clip("short", "galaxy", duration=12)
+    add_cached_clip("long", "galaxy", duration=95)
+
+    assert clip_cache.lookup_search("galaxy", min_duration=90)["key"] == "long"
+
+def test_lookup_serves_newest_short_clip_when_none_is_long_enough(workspace):
+    add_cached_clip("older", "galaxy", duration=12, created=1000)
+    add_cached_clip("newer", "galaxy", duration=20, created=2000)
+
+    assert clip_cache.lookup_search("galaxy", min_duration=90)["key"] == "newer"
+    assert clip_cache.lookup_search("nebula", min_duration=90) is None
+
+def test_short_cached_clip_is_served_without_fetching(workspace, monkeypatch):
+    main = pytest.importorskip("main")
+    add_cached_clip("short", "galaxy", duration=12)
+
+    def fetch_clip(*args, **kwargs):
+        raise AssertionError("a cache hit must not search Pexels")
+
+    monkeypatch.setattr(clip_cache, "fetch_clip", fetch_clip)
+    monkeypatch.setattr(content_variety_enhancer, "get_varied_background_search", lambda: "galaxy")
+
+    output_path = workspace / "background.mp4"
+    assert main.download_trippy_video(output_path, min_duration=90)["duration"] == 12
+    assert output_path.read_bytes() == b"short"
@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+"""
+Test Topic Vectors
+Diversity-aware picks skip candidates too close to the last few topics
+"""
+
+import time
+
+import numpy as np
+import pytest
+
+from topic_store import connect, normalize_topic
+from topic_vectors import least_similar, vectorize
+
+@pytest.fixture
+def conn(tmp_path):
+    conn = connect(tmp_path / "topics.db", sync=False)
+    yield conn
+    conn.close()
+
+def add_topic(conn, topic):
+    cursor = conn.execute(
+        "INSERT INTO topics (topic, normalized, source, shuffle, added) VALUES (?, ?, 'test', 0, ?)",
+        (topic, normalize_topic(topic), time.time())
+    )
+    return cursor.lastrowid
+
+def similarity_to(topic, other):
+    return float(vectorize(normalize_topic(topic)) @ vectorize(normalize_topic(other)))
+
+def test_takes_first_candidate_under_the_limit(conn):
+    recent = add_topic(conn, "The nature of consciousness")
+    topics = ["The nature of consciousness itself", "The nature of awareness", "Ancient star maps of Egypt"]
+    candidates = [add_topic(conn, topic) for topic in topics]
+
+    closest = [similarity_to(topic, "The nature of consciousness") for topic in topics]
+    assert closest[0] >= 0.3 > closest[1] > closest[2]
+
+    # Rotation order wins among acceptable candidates, not the lowest similarity
+    assert least_similar(conn, candidates, [recent], limit=0.3) == 1
+
+def test_falls_back_to_least_similar_when_all_are_too_close(conn):
+    recent = add_topic(conn, "The nature of consciousness")
+    topics = ["The nature of consciousness itself", "Ancient star maps of Egypt", "The nature of awareness"]
+    candidates = [add_topic(conn, topic) for topic in topics]
+
+    closest = [similarity_to(topic, "The nature of consciousness") for topic in topics]
+    assert least_similar(conn, candidates, [recent], limit=-1.0) == int(np.argmin(closest))
+
+def test_no_recent_topics_keeps_rotation_order(conn):
+    candidates = [add_topic(conn, "The illusion of time"), add_topic(conn, "Dreams and simulated realities")]
+    assert least_similar(conn, candidates, []) == 0
@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+"""
+Topic Dedupe
+Near-duplicate detection for the topic bank with MinHash signatures and LSH buckets
+"""
+
+import os
+import zlib
+import hashlib
+
+import numpy as np
+
+from topic_store import connect, transaction, get_meta, normalize_topic, clean_topic, TOPIC_FILE
+from topic_vectors import SCHEMA as VECTOR_SCHEMA
+
+# Character shingles of this length are hashed into the signature
+SHINGLE_SIZE = 4
+
+# 64 hash functions split into 16 bands of 4 rows: pairs above ~0.5 Jaccard
+# share a bucket in at least one band with high probability
+NUM_PERM = 64
+BANDS = 16
+ROWS_PER_BAND = NUM_PERM // BANDS
+
+# Estimated Jaccard similarity at which a new topic counts as a duplicate
+DUPLICATE_THRESHOLD = float(os.getenv("TOPIC_DUPLICATE_THRESHOLD", "0.6"))
+
+# Fixed seed so signatures stored in topics.db stay valid across runs
+MINHASH_SEED = 20240601
+_rng = np.random.default_rng(MINHASH_SEED)
+_HASH_A = _rng.integers(1, 2 ** 63, NUM_PERM, dtype=np.uint64) | np.uint64(1)
+_HASH_B = _rng.integers(0, 2 ** 63, NUM_PERM, dtype=np.uint64)
+
+INDEX_VERSION = f"{SHINGLE_SIZE}:{NUM_PERM}:{BANDS}:{MINHASH_SEED}"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS topic_minhash (
+    topic_id INTEGER PRIMARY KEY,
+    signature BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS topic_lsh (
+    band INTEGER NOT NULL,
+    bucket INTEGER NOT NULL,
+    topic_id INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_topic_lsh_bucket ON topic_lsh(band, bucket);
+CREATE INDEX IF NOT EXISTS idx_topic_lsh_topic ON topic_lsh(topic_id);
+"""
+
+def shingles(normalized):
+    """Overlapping character windows of a normalized topic (padded so short words count)"""
+    text = f" {normalized} "
+    if len(text) <= SHINGLE_SIZE:
+        return {text}
+    return {text[i:i + SHINGLE_SIZE] for i in range(len(text) - SHINGLE_SIZE + 1)}
+
+def minhash(normalized):
+    """MinHash signature of a topic as NUM_PERM uint32 values"""
+    hashes = np.fromiter(
+        (zlib.crc32(s.encode("utf-8")) for s in shingles(normalized)), dtype=np.uint64
+    )
+    # Multiply-shift hashing: overflow wraps mod 2^64, the high bits are the hash
+    permuted = (hashes[:, None] * _HASH_A + _HASH_B) >> np.uint64(32)
+    return permuted.min(axis=0).astype(np.uint32)
+
+def band_buckets(signature):
+    """One bucket id per band; topics sharing any bucket are candidates"""
+    buckets = []
+    for band in range(BANDS):
+        rows = signature[band * ROWS_PER_BAND:(band + 1) * ROWS_PER_BAND]
+        digest = hashlib.blake2b(rows.tobytes(), digest_size=8).digest()
+        buckets.append(int.from_bytes(digest, "big", signed=True))
+    return buckets
+
+def similarity(signature_a, signature_b):
+    """Estimated Jaccard similarity of two signatures"""
+    return float(np.mean(signature_a == signature_b))
+
+def _create_tables(conn):
+    # One statement at a time: executescript would commit an open transaction
+    for statement in SCHEMA.split(";"):
+        if statement.strip():
+            conn.execute(statement)
+
+def ensure_index(conn):
+    """Create the index tables and sign any topics that aren't indexed yet"""
+    _create_tables(conn)
+
+    if get_meta(conn, "dedupe_index_version") != INDEX_VERSION:
+        # Signature parameters changed - old signatures can't be compared
+        conn.execute("DELETE FROM topic_minhash")
+        conn.execute("DELETE FROM topic_lsh")
+        conn.execute(
+            "INSERT OR REPLACE INTO meta (key, value) VALUES ('dedupe_index_version', ?)", (INDEX_VERSION,)
+        )
+
+    # Every insert signs its own row, so only topics past the newest signed id
+    # (all of them, right after a reset) are left - no scan of the whole bank
+    newest = conn.execute("SELECT COALESCE(MAX(topic_id), 0) FROM topic_minhash").fetchone()[0]
+    missing = conn.execute(
+        "SELECT id, normalized FROM topics WHERE id > ?", (newest,)
+    ).fetchall()
+    for row in missing:
+        index_topic(conn, row["id"], row["normalized"])
+    return len(missing)
+
+def index_topic(conn, topic_id, normalized):
+    """Store a topic's signature and LSH buckets"""
+    signature = minhash(normalized)
+    conn.execute(
+        "INSERT OR REPLACE INTO topic_minhash (topic_id, signature) VALUES (?, ?)",
+        (topic_id, signature.tobytes())
+    )
+    conn.executemany(
+        "INSERT INTO topic_lsh (band, bucket, topic_id) VALUES (?, ?, ?)",
+        [(band, bucket, topic_id) for band, bucket in enumerate(band_buckets(signature))]
+    )
+
+def find_duplicate(conn, normalized, threshold=DUPLICATE_THRESHOLD):
+    """Closest indexed topic at or above `threshold` similarity, or None
+
+    Only topics sharing an LSH bucket are compared, so the cost depends on
+    the number of near matches rather than the size of the bank.
+    """
+    signature = minhash(normalized)
+
+    candidates = set()
+    for band, bucket in enumerate(band_buckets(signature)):
+        rows = conn.execute(
+            "SELECT topic_id FROM topic_lsh WHERE band = ? AND bucket = ?", (band, bucket)
+        ).fetchall()
+        candidates.update(row["topic_id"] for row in rows)
+
+    best = None
+    for topic_id in candidates:
+        row = conn.execute(
+            "SELECT t.id, t.topic, m.signature FROM topics t JOIN topic_minhash m ON m.topic_id = t.id "
+            "WHERE t.id = ?", (topic_id,)
+        ).fetchone()
+        if row is None:
+            continue
+        score = similarity(signature, np.frombuffer(row["signature"], dtype=np.uint32))
+        if score >= threshold and (best is None or score > best["similarity"]):
+            best = {"id": row["id"], "topic": row["topic"], "similarity": score}
+    return best
+
+def _merge_duplicates(conn, threshold):
+    """Rebuild the index oldest-first, folding each near-duplicate into the topic it matches"""
+    _create_tables(conn)
+    conn.execute(VECTOR_SCHEMA)
+    conn.execute("DELETE FROM topic_minhash")
+    conn.execute("DELETE FROM topic_lsh")
+    # Vectors of topics merged away by earlier runs
+    conn.execute("DELETE FROM topic_vectors WHERE topic_id NOT IN (SELECT id FROM topics)")
+
+    merged = []
+    for row in conn.execute("SELECT * FROM topics ORDER BY id").fetchall():
+        match = find_duplicate(conn, row["normalized"], threshold)
+        if match is None:
+            index_topic(conn, row["id"], row["normalized"])
+            continue
+
+        merged.append((row["topic"], match["topic"], match["similarity"]))
+        conn.execute(
+            "UPDATE topics SET use_count = use_count + ?, "
+            "last_used = NULLIF(MAX(COALESCE(last_used, 0), COALESCE(?, 0)), 0) WHERE id = ?",
+            (row["use_count"], row["last_used"], match["id"])
+        )
+        conn.execute("DELETE FROM topics WHERE id = ?", (row["id"],))
+        for table in ("topic_minhash", "topic_lsh", "topic_vectors"):
+            conn.execute(f"DELETE FROM {table} WHERE topic_id = ?", (row["id"],))
+
+    conn.execute(
+        "INSERT OR REPLACE INTO meta (key, value) VALUES ('dedupe_index_version', ?)", (INDEX_VERSION,)
+    )
+    return merged
+
+def compact_topics(threshold=DUPLICATE_THRESHOLD, dry_run=False):
+    """Merge near-duplicate topics into the oldest one and rewrite topics.txt without them"""
+    conn = connect()
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            merged = _merge_duplicates(conn, threshold)
+            if not dry_run:
+                _rewrite_topic_file(conn)
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        # A dry run only previews the merge
+        conn.execute("ROLLBACK" if dry_run else "COMMIT")
+    finally:
+        conn.close()
+
+    return merged
+
+def _rewrite_topic_file(conn):
+    """Drop merged and repeated lines from topics.txt, keeping the original order"""
+    if not TOPIC_FILE.exists():
+        return
+
+    known = {row["normalized"] for row in conn.execute("SELECT normalized FROM topics")}
+    seen = set()
+    kept = []
+    with open(TOPIC_FILE, 'r', encoding='utf-8') as f:
+        for line in f:
+            normalized = normalize_topic(clean_topic(line))
+            if normalized and normalized in known and normalized not in seen:
+                seen.add(normalized)
+                kept.append(line.strip())
+
+    temp_file = TOPIC_FILE.with_name(f".{TOPIC_FILE.name}.{os.getpid()}.tmp")
+    with open(temp_file, 'w', encoding='utf-8') as f:
+        f.write("\n".join(kept) + "\n")
+    os.replace(temp_file, TOPIC_FILE)
+
+    # The store already has every kept line - don't re-import the rewritten file
+    conn.execute(
+        "INSERT OR REPLACE INTO meta (key, value) VALUES ('topic_file_mtime', ?)",
+        (str(TOPIC_FILE.stat().st_mtime_ns),)
+    )
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Find and merge near-duplicate topics")
+    parser.add_argument("--compact", action="store_true", help="merge near-duplicates and rewrite topics.txt")
+    parser.add_argument("--dry-run", action="store_true", help="with --compact, only list what would be merged")
+    parser.add_argument("--check", metavar="TOPIC", help="show the closest existing topic")
+    parser.add_argument("--threshold", type=float, default=DUPLICATE_THRESHOLD,
+                        help=f"similarity that counts as a duplicate (default: {DUPLICATE_THRESHOLD})")
+    args = parser.parse_args()
+
+    if args.check:
+        conn = connect()
+        try:
+            with transaction(conn):
+                ensure_index(conn)
+            match = find_duplicate(conn, normalize_topic(args.check), args.threshold)
+        finally:
+            conn.close()
+        if match:
+            print(f"♻️ Near-duplicate of '{match['topic']}' ({match['similarity']:.0%} similar)")
+        else:
+            print("✨ No near-duplicate in the topic bank")
+    elif args.compact:
+        merged = compact_topics(args.threshold, dry_run=args.dry_run)
+        for duplicate, kept, score in merged:
+            print(f"   '{duplicate}' → '{kept}' ({score:.0%})")
+        verb = "Would merge" if args.dry_run else "Merged"
+        print(f"🧹 {verb} {len(merged)} near-duplicate topics")
+    else:
+        parser.print_help()
@@ -0,0 +1,357 @@
+#!/usr/bin/env python3
+"""
+Topic Store
+SQLite-backed topic bank with unique normalized topics and usage tracking
+"""
+
+import os
+import re
+import json
+import time
+import random
+import logging
+import sqlite3
+from pathlib import Path
+from contextlib import contextmanager
+
+from rotation import rotation_key, rotation_round, rotation_weight
+
+TOPIC_DB = Path(os.getenv("TOPIC_DB", "topics.db"))
+TOPIC_FILE = Path("topics.txt")
+LEGACY_USED_TOPICS_FILE = Path("used_topics.json")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS topics (
+    id INTEGER PRIMARY KEY,
+    topic TEXT NOT NULL,
+    normalized TEXT NOT NULL UNIQUE,
+    source TEXT NOT NULL,
+    category TEXT,
+    use_count INTEGER NOT NULL DEFAULT 0,
+    last_used REAL,
+    shuffle REAL NOT NULL,
+    added REAL NOT NULL,
+    rotation REAL NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_topics_last_used ON topics(last_used);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+def normalize_topic(topic):
+    """Canonical form used for uniqueness: lowercase words without punctuation"""
+    words = re.findall(r"[a-z0-9]+", topic.lower())
+    return " ".join(words)
+
+def clean_topic(line):
+    """Strip list markers and numbering that Claude or hand edits leave on a topic"""
+    line = re.sub(r"^\s*(?:[-*•]+|\d+[.)])\s*", "", line)
+    return line.strip().strip('"').strip()
+
+@contextmanager
+def transaction(conn):
+    """Run a block as one write transaction, taking the write lock up front"""
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+
+def connect(db_path=None, sync=True):
+    """Open the topic store, creating it and importing legacy files on first use"""
+    conn = sqlite3.connect(str(db_path or TOPIC_DB), timeout=30, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    # WAL lets parallel workers read while one of them writes
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript(SCHEMA)
+    _migrate_rotation(conn)
+
+    if sync:
+        if get_meta(conn, "legacy_imported") is None:
+            import_legacy_topics(conn)
+        else:
+            sync_topic_file(conn)
+    return conn
+
+def _migrate_rotation(conn):
+    """Add the rotation column to stores created before it existed"""
+    columns = {row["name"] for row in conn.execute("PRAGMA table_info(topics)")}
+    if "rotation" not in columns:
+        with transaction(conn):
+            conn.execute("ALTER TABLE topics ADD COLUMN rotation REAL NOT NULL DEFAULT 0")
+            conn.execute("DROP INDEX IF EXISTS idx_topics_shuffle")
+            _schedule_by_use_count(conn)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_topics_rotation ON topics(rotation)")
+
+def _schedule_by_use_count(conn):
+    """Seed the rotation from past usage: less used topics come first"""
+    rows = conn.execute("SELECT id, category, use_count FROM topics").fetchall()
+    if not rows:
+        return
+    least_used = min(row["use_count"] for row in rows)
+    conn.executemany(
+        "UPDATE topics SET rotation = ? WHERE id = ?",
+        [(rotation_key(row["use_count"] - least_used, rotation_weight(row["category"])), row["id"])
+         for row in rows]
+    )
+
+def current_round(conn):
+    """Rotation round the next pick comes from"""
+    row = conn.execute("SELECT MIN(rotation) AS rotation FROM topics").fetchone()
+    return rotation_round(row["rotation"]) if row["rotation"] is not None else 0
+
+def get_meta(conn, key):
+    row = conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+    return row["value"] if row else None
+
+def _set_meta(conn, key, value):
+    conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, str(value)))
+
+def _insert_topics(conn, topics, source, category=None, dedupe=True):
+    """Insert topics that aren't in the store yet; returns the ones added
+
+    With `dedupe`, topics that are near-duplicates of an existing one (by
+    MinHash similarity, see topic_dedupe.py) are skipped as well.
+    """
+    from topic_dedupe import ensure_index, find_duplicate, index_topic
+    from topic_vectors import index_vector
+    
+    ensure_index(conn)
+    added = []
+    now = time.time()
+    # New topics join the current round instead of waiting for the next one
+    round_number = current_round(conn)
+    for topic in topics:
+        topic = clean_topic(topic)
+        normalized = normalize_topic(topic)
+        if not normalized:
+            continue
+        
+        if dedupe:
+            match = find_duplicate(conn, normalized)
+            if match:
+                logging.info(f"Skipping topic '{topic}': {match['similarity']:.0%} similar to '{match['topic']}'")
+                continue
+        
+        # shuffle is no longer read, but older stores still require a value
+        cursor = conn.execute(
+            "INSERT OR IGNORE INTO topics (topic, normalized, source, category, shuffle, added, rotation) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (topic, normalized, source, category, random.random(), now,
+             rotation_key(round_number, rotation_weight(category)))
+        )
+        if cursor.rowcount:
+            index_topic(conn, cursor.lastrowid, normalized)
+            index_vector(conn, cursor.lastrowid, normalized)
+            added.append(topic)
+    return added
+
+def add_topics(topics, source="manual", category=None, conn=None):
+    """Add new topics to the bank, skipping ones already present; returns the ones added"""
+    own_conn = conn is None
+    conn = conn or connect()
+    try:
+        with transaction(conn):
+            return _insert_topics(conn, topics, source, category)
+    finally:
+        if own_conn:
+            conn.close()
+
+def _read_topic_file():
+    with open(TOPIC_FILE, 'r', encoding='utf-8') as f:
+        return [line for line in f if line.strip()]
+
+def sync_topic_file(conn):
+    """Pick up hand edits to topics.txt (only re-read when the file changed)"""
+    if not TOPIC_FILE.exists():
+        return []
+
+    mtime = str(TOPIC_FILE.stat().st_mtime_ns)
+    if get_meta(conn, "topic_file_mtime") == mtime:
+        return []
+
+    with transaction(conn):
+        added = _insert_topics(conn, _read_topic_file(), "file")
+        _set_meta(conn, "topic_file_mtime", mtime)
+    if added:
+        print(f"📝 Imported {len(added)} new topics from {TOPIC_FILE}")
+    return added
+
+def import_legacy_topics(conn):
+    """One-time import of the built-in topics, topics.txt and used_topics.json"""
+    from content_variety_enhancer import EXPANDED_TOPICS
+
+    used_topics = []
+    if LEGACY_USED_TOPICS_FILE.exists():
+        try:
+            with open(LEGACY_USED_TOPICS_FILE, 'r', encoding='utf-8') as f:
+                used_topics = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"⚠️ Could not read {LEGACY_USED_TOPICS_FILE}, importing without history: {e}")
+
+    with transaction(conn):
+        added = _insert_topics(conn, EXPANDED_TOPICS, "builtin")
+        if TOPIC_FILE.exists():
+            added += _insert_topics(conn, _read_topic_file(), "file")
+            _set_meta(conn, "topic_file_mtime", TOPIC_FILE.stat().st_mtime_ns)
+
+        # Replay the old history oldest first so recency order is kept
+        base = time.time() - len(used_topics)
+        for offset, topic in enumerate(used_topics):
+            _insert_topics(conn, [topic], "history", dedupe=False)
+            conn.execute(
+                "UPDATE topics SET use_count = use_count + 1, last_used = ? WHERE normalized = ?",
+                (base + offset, normalize_topic(topic))
+            )
+        _schedule_by_use_count(conn)
+        _set_meta(conn, "legacy_imported", time.time())
+
+    print(f"📚 Topic store created with {len(added)} topics ({len(used_topics)} past uses imported)")
+    return added
+
+def pick_topic(conn=None, diversity_window=None):
+    """Pick the least recently used topic and move it to the next rotation round
+
+    Every topic comes up once per round, so nothing repeats until the whole
+    bank has been used; the order inside a round is random (weighted by
+    category, see rotation.py). Among the topics due next, the one least
+    similar to the last `diversity_window` picks wins (see topic_vectors.py).
+    Runs inside a write transaction, so concurrent pipelines never get the
+    same topic.
+    """
+    from topic_vectors import DIVERSITY_WINDOW, DIVERSITY_CANDIDATES, least_similar
+
+    if diversity_window is None:
+        diversity_window = DIVERSITY_WINDOW
+
+    own_conn = conn is None
+    conn = conn or connect()
+    try:
+        with transaction(conn):
+            candidates = conn.execute(
+                "SELECT id, topic, category, rotation FROM topics ORDER BY rotation LIMIT ?",
+                (DIVERSITY_CANDIDATES if diversity_window > 0 else 1,)
+            ).fetchall()
+            if not candidates:
+                raise RuntimeError("Topic store is empty")
+
+            # Stay inside the current round so the rotation guarantee holds
+            round_number = rotation_round(candidates[0]["rotation"])
+            candidates = [row for row in candidates if rotation_round(row["rotation"]) == round_number]
+
+            recent_ids = [row["id"] for row in conn.execute(
+                "SELECT id FROM topics WHERE last_used IS NOT NULL ORDER BY last_used DESC LIMIT ?",
+                (diversity_window,)
+            )]
+            chosen = candidates[least_similar(conn, [row["id"] for row in candidates], recent_ids)]
+
+            conn.execute(
+                "UPDATE topics SET use_count = use_count + 1, last_used = ?, rotation = ? WHERE id = ?",
+                (time.time(), rotation_key(round_number + 1, rotation_weight(chosen["category"])), chosen["id"])
+            )
+        return chosen["topic"]
+    finally:
+        if own_conn:
+            conn.close()
+
+def _release_topics(conn, topics):
+    """Undo picks whose topic never got used, so each comes up again in the current round
+
+    last_used is cleared only when the pick was the topic's first use; an
+    older timestamp isn't kept, so a re-used topic keeps the pick's.
+    """
+    round_number = current_round(conn)
+    for topic in topics:
+        row = conn.execute(
+            "SELECT id, category FROM topics WHERE normalized = ?", (normalize_topic(topic),)
+        ).fetchone()
+        if row is None:
+            continue
+        conn.execute(
+            "UPDATE topics SET use_count = MAX(use_count - 1, 0), "
+            "last_used = CASE WHEN use_count <= 1 THEN NULL ELSE last_used END, rotation = ? WHERE id = ?",
+            (rotation_key(round_number, rotation_weight(row["category"])), row["id"])
+        )
+
+def release_topics(topics, conn=None):
+    """Give back picked topics that weren't used (e.g. their script failed)"""
+    if not topics:
+        return
+    own_conn = conn is None
+    conn = conn or connect()
+    try:
+        with transaction(conn):
+            _release_topics(conn, topics)
+    finally:
+        if own_conn:
+            conn.close()
+
+def recent_topics(limit=10, conn=None):
+    """Most recently used topics, newest first"""
+    own_conn = conn is None
+    conn = conn or connect()
+    try:
+        rows = conn.execute(
+            "SELECT topic FROM topics WHERE last_used IS NOT NULL ORDER BY last_used DESC LIMIT ?",
+            (limit,)
+        ).fetchall()
+        return [row["topic"] for row in rows]
+    finally:
+        if own_conn:
+            conn.close()
+
+def reset_usage(conn=None):
+    """Forget all usage history (topics themselves are kept)"""
+    own_conn = conn is None
+    conn = conn or connect()
+    try:
+        with transaction(conn):
+            conn.execute("UPDATE topics SET use_count = 0, last_used = NULL")
+            _schedule_by_use_count(conn)
+    finally:
+        if own_conn:
+            conn.close()
+
+def get_topic_stats(conn=None):
+    """Counts for the variety dashboard"""
+    own_conn = conn is None
+    conn = conn or connect()
+    try:
+        row = conn.execute(
+            "SELECT COUNT(*) AS total, "
+            "SUM(CASE WHEN use_count > 0 THEN 1 ELSE 0 END) AS used, "
+            "COALESCE(SUM(use_count), 0) AS uses FROM topics"
+        ).fetchone()
+        by_source = dict(conn.execute("SELECT source, COUNT(*) FROM topics GROUP BY source").fetchall())
+        round_number = current_round(conn)
+        due = conn.execute("SELECT COUNT(*) FROM topics WHERE rotation < ?", (round_number + 1,)).fetchone()[0]
+        return {"total": row["total"], "used": row["used"] or 0, "uses": row["uses"], "by_source": by_source,
+                "round": round_number, "due": due}
+    finally:
+        if own_conn:
+            conn.close()
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Manage the SQLite topic bank")
+    parser.add_argument("--add", nargs="+", metavar="TOPIC", help="add topics by hand")
+    parser.add_argument("--recent", type=int, metavar="N", help="show the N most recently used topics")
+    args = parser.parse_args()
+
+    if args.add:
+        added = add_topics(args.add)
+        print(f"✅ Added {len(added)} of {len(args.add)} topics")
+    if args.recent:
+        for i, topic in enumerate(recent_topics(args.recent), 1):
+            print(f"   {i:2d}. {topic}")
+
+    stats = get_topic_stats()
+    print(f"📚 {stats['total']} topics ({stats['used']} used, {stats['uses']} picks) in {TOPIC_DB}")
+    print(f"🔄 Rotation round {stats['round'] + 1}: {stats['due']} topics left before any repeat")
+    for source, count in sorted(stats["by_source"].items()):
+        print(f"   {source:<8} {count}")
@@ -0,0 +1,102 @@
+# Hashed n-gram vectors for diversity-aware topic picks
+#
+# Each topic gets a fixed-size vector of hashed word, word-stem and bigram
+# features, stored once in topics.db when the topic is added. A pick scores
+# the due candidates against the last few published topics with one matrix
+# product and skips the ones too close to any of them.
+
+import os
+import hashlib
+
+import numpy as np
+
+VECTOR_DIM = 256
+
+# Compare against this many of the most recently used topics (0 turns it off)
+DIVERSITY_WINDOW = int(os.getenv("TOPIC_DIVERSITY_WINDOW", "5"))
+
+# Candidates scored per pick, taken from the front of the current rotation round
+DIVERSITY_CANDIDATES = 256
+
+# Cosine similarity to a recent topic that counts as "too close"
+SIMILARITY_LIMIT = float(os.getenv("TOPIC_SIMILARITY_LIMIT", "0.2"))
+
+STOPWORDS = frozenset(
+    "a an and are as at be beyond by for from how in into is it its of on or our the to "
+    "vs what when where why with within without you your".split()
+)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS topic_vectors (
+    topic_id INTEGER PRIMARY KEY,
+    vector BLOB NOT NULL
+)
+"""
+
+def features(normalized):
+    """Content words, their 6-letter stems (consciousness ~ conscious) and word bigrams"""
+    words = [word for word in normalized.split() if word not in STOPWORDS]
+    feats = list(words)
+    feats += [f"~{word[:6]}" for word in words if len(word) > 6]
+    feats += [f"{a} {b}" for a, b in zip(words, words[1:])]
+    return feats
+
+def vectorize(normalized):
+    """Unit-length hashed feature vector (signed hashing keeps collisions unbiased)"""
+    vector = np.zeros(VECTOR_DIM, dtype=np.float32)
+    for feature in features(normalized):
+        h = int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=4).digest(), "big")
+        vector[h % VECTOR_DIM] += 1.0 if h & 0x80000000 else -1.0
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+def index_vector(conn, topic_id, normalized):
+    """Store a topic's vector (replacing any left over from a deleted topic with the same id)"""
+    conn.execute(SCHEMA)
+    conn.execute(
+        "INSERT OR REPLACE INTO topic_vectors (topic_id, vector) VALUES (?, ?)",
+        (topic_id, vectorize(normalized).tobytes())
+    )
+
+def load_vectors(conn, topic_ids):
+    """Matrix of vectors for `topic_ids` (rows in the same order), vectorizing any missing ones"""
+    conn.execute(SCHEMA)
+    placeholders = ",".join("?" * len(topic_ids))
+    rows = conn.execute(
+        f"SELECT t.id, t.normalized, v.vector FROM topics t "
+        f"LEFT JOIN topic_vectors v ON v.topic_id = t.id WHERE t.id IN ({placeholders})",
+        list(topic_ids)
+    ).fetchall()
+
+    by_id = {}
+    for row in rows:
+        if row["vector"] is None:
+            # Topics added before vectors existed are indexed on first use
+            index_vector(conn, row["id"], row["normalized"])
+            by_id[row["id"]] = vectorize(row["normalized"])
+        else:
+            by_id[row["id"]] = np.frombuffer(row["vector"], dtype=np.float32)
+
+    matrix = np.zeros((len(topic_ids), VECTOR_DIM), dtype=np.float32)
+    for i, topic_id in enumerate(topic_ids):
+        if topic_id in by_id:
+            matrix[i] = by_id[topic_id]
+    return matrix
+
+def least_similar(conn, candidate_ids, recent_ids, limit=SIMILARITY_LIMIT):
+    """Index of the first candidate not too close to any recent topic
+
+    Taking the first acceptable one (candidates are in rotation order) rather
+    than the most distant keeps similar topics spread over the round instead
+    of leaving them all for its end. Falls back to the least similar candidate.
+    """
+    if not recent_ids or len(candidate_ids) < 2:
+        return 0
+
+    vectors = load_vectors(conn, list(candidate_ids) + list(recent_ids))
+    candidates, recent = vectors[:len(candidate_ids)], vectors[len(candidate_ids):]
+
+    # Unit vectors, so the product is cosine similarity: (candidates x recent)
+    closest = (candidates @ recent.T).max(axis=1)
+    acceptable = np.flatnonzero(closest < limit)
+    return int(acceptable[0]) if acceptable.size else int(np.argmin(closest))
@@ -0,0 +1,159 @@
+# Chunked, parallel OpenAI TTS with a per-chunk audio cache
+#
+# The script is split on sentence boundaries and each chunk is synthesized on
+# its own, a few at a time, as raw PCM streamed straight to disk. Chunks are
+# cached by hash(text, voice, model, format), so a retry or a re-render of an
+# edited script only pays for the sentences that changed. The chunks are
+# joined with a short crossfade into a lossless WAV - nothing is re-encoded.
+
+import os
+import re
+import sys
+import json
+import wave
+import hashlib
+import threading
+from array import array
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+from pipeline_profiler import track_api_call
+
+TTS_CACHE_DIR = Path("esoteric_content_pipeline") / "tts_cache"
+TTS_CACHE_MAX_BYTES = int(float(os.getenv("TTS_CACHE_MAX_MB", "500")) * 1024 * 1024)
+
+# Concurrent TTS requests per script
+TTS_WORKERS = int(os.getenv("TTS_WORKERS", "4"))
+
+# Sentences shorter than this are merged with the next one (fewer, more natural requests)
+TTS_MIN_CHUNK_CHARS = 40
+
+# Overlap between chunks, enough to hide clicks at the joins
+TTS_CROSSFADE_MS = float(os.getenv("TTS_CROSSFADE_MS", "20"))
+
+# OpenAI's "pcm" format: 24 kHz, 16-bit signed little-endian, mono
+TTS_FORMAT = "pcm"
+PCM_SAMPLE_RATE = 24000
+PCM_SAMPLE_WIDTH = 2
+
+SENTENCE_END = re.compile(r"(?<=[.!?…])\s+")
+
+_CACHE_LOCK = threading.Lock()
+
+def split_into_chunks(text, min_chars=TTS_MIN_CHUNK_CHARS):
+    """Sentence-sized chunks; an edit only changes the chunks around it"""
+    chunks = []
+    pending = ""
+    for sentence in SENTENCE_END.split(text.strip()):
+        pending = f"{pending} {sentence}".strip()
+        if len(pending) >= min_chars:
+            chunks.append(pending)
+            pending = ""
+
+    if pending:
+        if chunks:
+            chunks[-1] = f"{chunks[-1]} {pending}"
+        else:
+            chunks.append(pending)
+    return chunks
+
+def chunk_key(text, voice, model, response_format=TTS_FORMAT):
+    payload = json.dumps([text, voice, model, response_format], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def chunk_path(key):
+    return TTS_CACHE_DIR / f"{key}.{TTS_FORMAT}"
+
+def synthesize_chunk(client, text, voice, model):
+    """PCM file for one chunk, from the cache or streamed from the API"""
+    path = chunk_path(chunk_key(text, voice, model))
+    if path.exists():
+        os.utime(path)  # Mark as recently used for eviction
+        return path
+
+    TTS_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    temp_path = path.with_name(f".{path.name}.{threading.get_ident()}.tmp")
+    try:
+        with client.audio.speech.with_streaming_response.create(
+            model=model, voice=voice, input=text, response_format=TTS_FORMAT
+        ) as response:
+            with open(temp_path, "wb") as f:
+                for block in response.iter_bytes():
+                    f.write(block)
+        os.replace(temp_path, path)
+    finally:
+        if temp_path.exists():
+            temp_path.unlink()
+    return path
+
+def read_pcm(path):
+    samples = array("h")
+    samples.frombytes(Path(path).read_bytes())
+    if sys.byteorder == "big":
+        samples.byteswap()
+    return samples
+
+def stitch_pcm(chunks, crossfade_samples):
+    """Join sample arrays, linearly crossfading each join"""
+    out = array("h")
+    for samples in chunks:
+        overlap = min(crossfade_samples, len(out), len(samples))
+        start = len(out) - overlap
+        for i in range(overlap):
+            t = (i + 1) / (overlap + 1)
+            out[start + i] = int(out[start + i] * (1 - t) + samples[i] * t)
+        out.extend(samples[overlap:])
+    return out
+
+def write_wav(samples, output_path):
+    if sys.byteorder == "big":
+        samples = array("h", samples)
+        samples.byteswap()
+    with wave.open(str(output_path), "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(PCM_SAMPLE_WIDTH)
+        f.setframerate(PCM_SAMPLE_RATE)
+        f.writeframes(samples.tobytes())
+
+def synthesize_speech(client, text, output_path, voice, model, workers=TTS_WORKERS):
+    """Synthesize `text` chunk by chunk into a WAV file; returns (chunks, chunks synthesized)"""
+    chunks = split_into_chunks(text)
+    missing = [c for c in dict.fromkeys(chunks) if not chunk_path(chunk_key(c, voice, model)).exists()]
+
+    if missing:
+        with track_api_call("openai_tts"):
+            with ThreadPoolExecutor(max_workers=max(1, min(workers, len(missing)))) as pool:
+                # list() re-raises the first failed chunk; finished ones stay cached for the retry
+                list(pool.map(lambda c: synthesize_chunk(client, c, voice, model), missing))
+
+    paths = [synthesize_chunk(client, c, voice, model) for c in chunks]
+    crossfade = int(PCM_SAMPLE_RATE * TTS_CROSSFADE_MS / 1000)
+    write_wav(stitch_pcm([read_pcm(p) for p in paths], crossfade), output_path)
+
+    if missing:
+        evict_tts_cache()
+    return len(chunks), len(missing)
+
+def evict_tts_cache(max_bytes=TTS_CACHE_MAX_BYTES):
+    """Drop the least recently used chunks until the cache fits its budget"""
+    with _CACHE_LOCK:
+        entries = []
+        for path in TTS_CACHE_DIR.glob(f"*.{TTS_FORMAT}"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in entries)
+        evicted = 0
+        for _, size, path in sorted(entries):
+            if total <= max_bytes:
+                break
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass  # Evicted by another worker
+            total -= size
+            evicted += 1
+        return evicted
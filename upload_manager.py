@@ -7,6 +7,7 @@ Helps manage your manual upload queue
 import os
 from pathlib import Path
 from datetime import datetime
+from media_probe import get_media_duration
 
 def show_upload_queue():
     """Display all videos ready for upload"""
@@ -42,6 +43,10 @@ def show_upload_queue():
         
         print(f"{i}. {video_file.name}")
         print(f"   📁 Size: {file_size:.1f} MB")
+        
+        duration = get_media_duration(video_file)
+        if duration:
+            print(f"   ⏱️ Duration: {duration:.1f} seconds")
         print(f"   ⏰ Created: {created_time.strftime('%Y-%m-%d %H:%M')}")
         print(f"   📋 Instructions: {'✅' if instruction_file else '❌'}")
         
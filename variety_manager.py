@@ -4,14 +4,16 @@ Content Variety Manager
 Track and manage topic and background variety
 """
 
-import json
-from pathlib import Path
 from content_variety_enhancer import (
     get_content_variety_stats, 
     auto_expand_topics, 
     EXPANDED_TOPICS,
-    BACKGROUND_CATEGORIES
+    BACKGROUND_CATEGORIES,
+    USED_SEARCHES_FILE,
+    BACKGROUND_SCHEDULE_FILE
 )
+from shared_state import load_usage, clear_usage
+from topic_store import recent_topics, reset_usage
 
 def show_variety_dashboard():
     """Display content variety statistics"""
@@ -26,6 +28,7 @@ def show_variety_dashboard():
     if stats['used_topics'] > 0:
         topic_variety = (stats['used_topics'] / stats['total_available_topics']) * 100
         print(f"   Variety: {topic_variety:.1f}% explored")
+    print(f"   Rotation: round {stats['topic_round'] + 1}, {stats['topics_due']} left before any repeat")
     
     print(f"\n🎬 Background Videos:")
     print(f"   Search terms available: {stats['total_search_terms']}")
@@ -34,6 +37,7 @@ def show_variety_dashboard():
     if stats['used_searches'] > 0:
         search_variety = (stats['used_searches'] / stats['total_search_terms']) * 100
         print(f"   Variety: {search_variety:.1f}% explored")
+    print(f"   Rotation: round {stats['search_round'] + 1}, {stats['searches_due']} left before any repeat")
     
     # Show freshness status
     print(f"\n🔄 Freshness Status:")
@@ -53,51 +57,32 @@ def show_variety_dashboard():
 
 def show_recent_content():
     """Show recently used topics and searches"""
-    used_topics_file = Path("used_topics.json")
-    used_searches_file = Path("used_searches.json")
-    
     print("\n📋 RECENT CONTENT")
     print("=" * 40)
     
     # Recent topics
-    if used_topics_file.exists():
-        try:
-            with open(used_topics_file, 'r') as f:
-                used_topics = json.load(f)
-                recent_topics = used_topics[-10:]  # Last 10
-                
-            print("📝 Last 10 Topics:")
-            for i, topic in enumerate(reversed(recent_topics), 1):
-                print(f"   {i:2d}. {topic}")
-        except:
-            print("📝 No topic history found")
+    recent = recent_topics(10)
+    if recent:
+        print("📝 Last 10 Topics:")
+        for i, topic in enumerate(recent, 1):
+            print(f"   {i:2d}. {topic}")
     else:
         print("📝 No topic history found")
     
     # Recent searches
-    if used_searches_file.exists():
-        try:
-            with open(used_searches_file, 'r') as f:
-                used_searches = json.load(f)
-                recent_searches = used_searches[-10:]  # Last 10
-                
-            print("\n🎬 Last 10 Background Searches:")
-            for i, search in enumerate(reversed(recent_searches), 1):
-                print(f"   {i:2d}. {search}")
-        except:
-            print("\n🎬 No search history found")
+    recent_searches = load_usage(USED_SEARCHES_FILE, keep=10)  # Last 10
+    if recent_searches:
+        print("\n🎬 Last 10 Background Searches:")
+        for i, search in enumerate(reversed(recent_searches), 1):
+            print(f"   {i:2d}. {search}")
     else:
         print("\n🎬 No search history found")
 
 def reset_variety_tracking():
     """Reset variety tracking to start fresh"""
-    used_topics_file = Path("used_topics.json")
-    used_searches_file = Path("used_searches.json")
-    
-    if used_topics_file.exists():
-        used_topics_file.unlink()
-    if used_searches_file.exists():
-        used_searches_file.unlink()
+    reset_usage()
+    clear_usage(USED_SEARCHES_FILE)
+    clear_usage(BACKGROUND_SCHEDULE_FILE)
     
     print("🔄 Variety tracking reset - all content will be fresh again!")
 